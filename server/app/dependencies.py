@@ -0,0 +1,26 @@
+from fastapi import Request
+
+from services.async_stripe_service import AsyncStripeService
+from services.deletion_jobs import DeletionWorkerPool
+from services.stripe_client import StripeClients
+from services.webhook_events import WebhookWorkerPool
+
+
+def get_stripe_clients(request: Request) -> StripeClients:
+    """The Stripe clients created in the app lifespan."""
+    return request.app.state.stripe
+
+
+def get_async_stripe_service(request: Request) -> AsyncStripeService:
+    """The AsyncStripeService bound to the default-version client."""
+    return request.app.state.async_stripe_service
+
+
+def get_deletion_jobs(request: Request) -> DeletionWorkerPool:
+    """The account deletion worker pool started in the app lifespan."""
+    return request.app.state.deletion_jobs
+
+
+def get_webhook_events(request: Request) -> WebhookWorkerPool:
+    """The webhook event worker pool started in the app lifespan."""
+    return request.app.state.webhook_events
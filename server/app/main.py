@@ -1,47 +1,97 @@
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
+import os
+
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from dotenv import load_dotenv
 
-from routers import accounts, payment_methods, external_accounts, transactions
+# Load .env before importing modules that read settings at import time
+load_dotenv()
+
+from services import database
+from services.idempotency import close_idempotency_store
+from services.metrics import MetricsMiddleware, render_metrics
+from services.async_stripe_service import AsyncStripeService
+from services.deletion_jobs import create_deletion_worker_pool
+from services.startup import LazyRouterMiddleware, RouterLoader, include_routers, warm_up
+from services.stripe_client import create_stripe_clients
+from services.webhook_events import create_webhook_worker_pool
+
+# With LAZY_ROUTERS the routers are imported after startup (or by the first request), not here
+LAZY_ROUTERS = os.getenv("LAZY_ROUTERS", "false").lower() in ("1", "true", "yes")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Starting up...")
+    app.state.stripe = create_stripe_clients()
+    app.state.async_stripe_service = AsyncStripeService(app.state.stripe.default)
+    if os.getenv("STARTUP_WARMUP", "true").lower() in ("1", "true", "yes"):
+        await warm_up(app.state.stripe, IMPORT_SECONDS)
+    store_maintenance = asyncio.create_task(database.run_store_maintenance())
+    app.state.deletion_jobs = create_deletion_worker_pool(app.state.stripe.default)
+    app.state.deletion_jobs.start()
+    app.state.webhook_events = create_webhook_worker_pool(app.state.stripe.preview)
+    app.state.webhook_events.start()
+    router_load = asyncio.create_task(app.state.router_loader.load()) if LAZY_ROUTERS else None
     yield
     print("Shutting down...")
+    if router_load is not None:
+        router_load.cancel()
+    store_maintenance.cancel()
+    await app.state.deletion_jobs.stop()
+    app.state.deletion_jobs.store.close()
+    await app.state.webhook_events.stop()
+    app.state.webhook_events.store.close()
+    database.close_account_store()
+    close_idempotency_store()
+    await app.state.stripe.aclose()
 
 
 def create_app() -> FastAPI:
     app = FastAPI(
         title="Stripe Connect Demo API",
         lifespan=lifespan,
+        default_response_class=ORJSONResponse,
     )
 
     @app.get("/")
     def root():
         return {"status": "up"}
 
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
     # Add CORS middleware
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["http://localhost:3000"],
         allow_credentials=True,
         allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH"],
-        allow_headers=["Content-Type"],
+        allow_headers=["Content-Type", "Idempotency-Key"],
     )
 
+    if LAZY_ROUTERS:
+        app.state.router_loader = RouterLoader(app)
+        app.add_middleware(LazyRouterMiddleware, loader=app.state.router_loader)
+
+    # Added last so it is outermost and also times CORS handling
+    app.add_middleware(MetricsMiddleware)
+
     # Register routers
-    app.include_router(accounts.router)
-    app.include_router(payment_methods.router)
-    app.include_router(external_accounts.router)
-    app.include_router(transactions.router)
+    if not LAZY_ROUTERS:
+        include_routers(app)
 
     return app
 
 
-load_dotenv()
-
 # uvicorn main:app --host 0.0.0.0 --port 6969 --reload
 app = create_app()
+IMPORT_SECONDS = time.perf_counter() - _import_started
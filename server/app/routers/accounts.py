@@ -1,70 +1,60 @@
+import asyncio
 import os
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import orjson
 import stripe
 from pydantic import BaseModel
 
+from dependencies import get_deletion_jobs, get_stripe_clients
 from schemas.account import CreateAccountRequest
+from services.resilience import stripe_error_status
+from services.stripe_client import StripeClients
+from services.account_snapshots import (
+    SNAPSHOT_INCLUDE,
+    get_account_snapshot,
+    get_cached_account_snapshot,
+    invalidate_account_snapshot,
+)
+from services.account_import import (
+    ROW_STATUSES,
+    create_stripe_account,
+    import_account_rows,
+    import_format,
+    iter_file_chunks,
+    iter_import_rows,
+    spool_body,
+)
+from services.deletion_jobs import DeletionWorkerPool, job_summary
+from services.fanout import bounded_gather
 from services.database import (
     create_platform_account,
     get_platform_account,
-    list_platform_accounts,
-    delete_platform_account,
+    list_platform_accounts_page,
+    iter_platform_account_batches,
 )
 
 router = APIRouter(prefix="/api/accounts", tags=["accounts"])
 
 
 @router.post("")
-async def create_account(request: CreateAccountRequest):
+async def create_account(
+    request: CreateAccountRequest,
+    stripe_clients: StripeClients = Depends(get_stripe_clients),
+):
 
     """Create a new v2 customer account."""
-    stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
-
     try:
 
-        stripe_client = stripe.StripeClient(
-            os.getenv("STRIPE_SECRET_KEY"),
-            stripe_version="2025-12-15.preview"
-        )
+        stripe_client = stripe_clients.preview
 
         # Create Stripe v2 account
-        account = stripe_client.v2.core.accounts.create({
-            "contact_email": request.email,
-            "display_name": request.name,
-            "identity": {
-                "country": "us",
-            },
-            "configuration": {
-                "customer": {
-                    "capabilities": {
-                        "automatic_indirect_tax": {"requested": True}
-                    }
-                },
-            },
-            "defaults": {
-                "currency": "usd",
-                "locales": ["en-US"],
-            },
-            "include": [
-                "configuration.customer",
-                "identity",
-                "requirements",
-                "defaults"
-            ],
-        })
+        account = await create_stripe_account(stripe_client, request)
 
         stripe_account_id = account.get("id", "")
 
-        _ = stripe_client.v2.core.accounts.update(
-            stripe_account_id,
-            {
-                "metadata": {
-                    "account_id": stripe_account_id,
-                },
-            }
-        )
-
         # Create platform account in our mock DB
         platform_account = create_platform_account(
             email=request.email,
@@ -85,60 +75,183 @@ async def create_account(request: CreateAccountRequest):
         }
 
     except stripe.error.StripeError as e:
-        raise HTTPException(status_code=400, detail=str(e.user_message or e))
+        raise HTTPException(status_code=stripe_error_status(e), detail=str(e.user_message or e))
+
+
+def _account_summary(platform_account, stripe_account) -> dict:
+    applied_configurations = stripe_account.get("applied_configurations", [])
+    return {
+        "id": platform_account.id,
+        "stripe_account_id": platform_account.stripe_account_id,
+        "stripe_customer_id": platform_account.stripe_customer_id,
+        "email": stripe_account.get("contact_email"),
+        "display_name": stripe_account.get("display_name"),
+        "created": stripe_account.get("created", ""),
+        "is_customer": "customer" in applied_configurations,
+        "is_merchant": "merchant" in applied_configurations,
+        "is_recipient": "recipient" in applied_configurations,
+    }
+
+
+def _platform_only_summary(platform_account) -> dict:
+    return {
+        "id": platform_account.id,
+        "stripe_account_id": platform_account.stripe_account_id,
+        "stripe_customer_id": platform_account.stripe_customer_id,
+        "email": platform_account.email,
+        "display_name": None,
+        "created": "",
+        "is_customer": False,
+        "is_merchant": False,
+        "is_recipient": False,
+    }
 
 
 @router.get("")
-async def list_accounts():
-    """List all platform accounts with their Stripe account details."""
+async def list_accounts(
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of accounts to return"),
+    starting_after: Optional[str] = Query(None, description="Return accounts after this platform account ID"),
+    stripe_clients: StripeClients = Depends(get_stripe_clients),
+):
+    """List one page of platform accounts with their Stripe account details."""
     try:
-        stripe_client = stripe.StripeClient(os.getenv("STRIPE_SECRET_KEY"))
+        stripe_client = stripe_clients.preview
 
-        # Get all platform accounts from our mock DB
-        platform_accounts = list_platform_accounts()
+        # Get one page of platform accounts from our mock DB
+        try:
+            platform_accounts, has_more = list_platform_accounts_page(limit, starting_after)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid starting_after cursor")
+
+        async def fetch_summary(pa):
+            stripe_account = await get_account_snapshot(stripe_client, pa.stripe_account_id)
+            return _account_summary(pa, stripe_account)
+
+        # Fetch Stripe account details (cache misses only) concurrently, capped and with a per-account timeout
+        results = await bounded_gather(
+            fetch_summary,
+            platform_accounts,
+            concurrency=int(os.getenv("ACCOUNTS_FANOUT_CONCURRENCY", "16")),
+            timeout=float(os.getenv("ACCOUNTS_FANOUT_TIMEOUT", "10")),
+        )
 
         accounts = []
-        for pa in platform_accounts:
-            try:
-                # Fetch Stripe account details
-                stripe_account = stripe_client.v2.core.accounts.retrieve(
-                    pa.stripe_account_id,
-                    {"include": ["configuration.customer", "configuration.recipient"]}
-                )
-                applied_configurations = stripe_account.get("applied_configurations", [])
-
-                accounts.append({
-                    "id": pa.id,
-                    "stripe_account_id": pa.stripe_account_id,
-                    "stripe_customer_id": pa.stripe_customer_id,
-                    "email": stripe_account.get("contact_email"),
-                    "display_name": stripe_account.get("display_name"),
-                    "created": stripe_account.get("created", ""),
-                    "is_customer": "customer" in applied_configurations,
-                    "is_merchant": "merchant" in applied_configurations,
-                    "is_recipient": "recipient" in applied_configurations,
-                })
-            except stripe.error.StripeError:
-                # If Stripe account doesn't exist, still include platform account
-                accounts.append({
-                    "id": pa.id,
-                    "stripe_account_id": pa.stripe_account_id,
-                    "stripe_customer_id": pa.stripe_customer_id,
-                    "email": pa.email,
-                    "display_name": None,
-                    "created": "",
-                    "is_customer": False,
-                    "is_merchant": False,
-                    "is_recipient": False,
-                })
-
-        return {"accounts": accounts}
+        for pa, result in zip(platform_accounts, results):
+            if isinstance(result, Exception):
+                # If the Stripe account can't be fetched, still include platform account
+                accounts.append(_platform_only_summary(pa))
+            else:
+                accounts.append(result)
+
+        # The summaries are plain JSON values already, so skip FastAPI's jsonable_encoder pass
+        return ORJSONResponse({
+            "accounts": accounts,
+            "has_more": has_more,
+            "next_cursor": platform_accounts[-1].id if has_more else None,
+        })
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.get("/export")
+async def export_accounts(stripe_clients: StripeClients = Depends(get_stripe_clients)):
+    """Stream every platform account joined with its Stripe status as NDJSON.
+
+    Accounts are read from the store and enriched one batch at a time, and the
+    next batch isn't started until the previous one has been handed to the
+    client, so memory stays flat however many accounts there are.
+    """
+    stripe_client = stripe_clients.preview
+    batch_size = int(os.getenv("ACCOUNTS_EXPORT_BATCH_SIZE", "200"))
+    concurrency = int(os.getenv("ACCOUNTS_FANOUT_CONCURRENCY", "16"))
+    timeout = float(os.getenv("ACCOUNTS_FANOUT_TIMEOUT", "10"))
+
+    async def fetch_row(pa):
+        # Read through the snapshot cache but don't fill it; an export would evict every hot entry
+        stripe_account = get_cached_account_snapshot(pa.stripe_account_id)
+        if stripe_account is None:
+            stripe_account = await stripe_client.v2.core.accounts.retrieve_async(
+                pa.stripe_account_id,
+                {"include": SNAPSHOT_INCLUDE},
+            )
+        return _account_summary(pa, stripe_account)
+
+    async def rows():
+        for batch in iter_platform_account_batches(batch_size):
+            results = await bounded_gather(fetch_row, batch, concurrency=concurrency, timeout=timeout)
+            lines = []
+            for pa, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    row = {**_platform_only_summary(pa), "stripe_error": str(result) or type(result).__name__}
+                else:
+                    row = {**result, "stripe_error": None}
+                lines.append(orjson.dumps(row))
+            yield b"\n".join(lines) + b"\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+
+@router.post("/import")
+async def import_accounts(
+    request: Request,
+    stripe_clients: StripeClients = Depends(get_stripe_clients),
+):
+    """Create accounts in bulk from a CSV (text/csv) or NDJSON (application/x-ndjson) body.
+
+    Each row has the fields of POST /api/accounts. Once the body has been
+    received, rows are processed in batches and one NDJSON result per row is
+    streamed back in input order, ending with a ``summary`` line of counts by
+    status. Rows whose email is already registered are skipped.
+    """
+    try:
+        fmt = import_format(request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+
+    body = await spool_body(request.stream())
+    batches = import_account_rows(
+        stripe_clients.preview,
+        iter_import_rows(iter_file_chunks(body), fmt),
+        concurrency=int(os.getenv("ACCOUNTS_IMPORT_CONCURRENCY", "16")),
+        batch_size=int(os.getenv("ACCOUNTS_IMPORT_BATCH_SIZE", "500")),
+    )
+
+    async def lines():
+        summary = dict.fromkeys(ROW_STATUSES, 0)
+        try:
+            async for results in batches:
+                for result in results:
+                    summary[result["status"]] += 1
+                yield b"\n".join(orjson.dumps(result) for result in results) + b"\n"
+        finally:
+            body.close()
+        yield orjson.dumps({"summary": summary}) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.get("/deletion-jobs")
+async def deletion_job_counts(deletion_jobs: DeletionWorkerPool = Depends(get_deletion_jobs)):
+    """Number of account deletion jobs in each status, to follow a bulk clean-up."""
+    return {"counts": await asyncio.to_thread(deletion_jobs.store.counts)}
+
+
+@router.get("/deletion-jobs/{job_id}")
+async def get_deletion_job(job_id: str, deletion_jobs: DeletionWorkerPool = Depends(get_deletion_jobs)):
+    """Status and per-step progress of an account deletion job."""
+    job = await asyncio.to_thread(deletion_jobs.store.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Deletion job not found")
+    return job_summary(job)
+
+
 @router.get("/{account_id}")
-async def get_account(account_id: str):
+async def get_account(
+    account_id: str,
+    stripe_clients: StripeClients = Depends(get_stripe_clients),
+):
     """Get a specific account by platform ID."""
     try:
         # Look up platform account
@@ -146,22 +259,8 @@ async def get_account(account_id: str):
         if not platform_account:
             raise HTTPException(status_code=404, detail="Account not found")
 
-        stripe_client = stripe.StripeClient(os.getenv("STRIPE_SECRET_KEY"))
-
         # Fetch Stripe account details
-        account = stripe_client.v2.core.accounts.retrieve(
-            platform_account.stripe_account_id,
-            {
-                "include": [
-                    "configuration.customer",
-                    "configuration.merchant",
-                    "configuration.recipient",
-                    "identity",
-                    "requirements",
-                    "defaults"
-                ],
-            }
-        )
+        account = await get_account_snapshot(stripe_clients.preview, platform_account.stripe_account_id)
 
         config = account.get("configuration", {})
 
@@ -191,48 +290,37 @@ async def get_account(account_id: str):
     except stripe.error.InvalidRequestError as e:
         raise HTTPException(status_code=404, detail="Stripe account not found")
     except stripe.error.StripeError as e:
-        raise HTTPException(status_code=400, detail=str(e.user_message or e))
+        raise HTTPException(status_code=stripe_error_status(e), detail=str(e.user_message or e))
 
 
-@router.delete("/{account_id}")
-async def delete_account(account_id: str):
-    """Delete a platform account and its associated Stripe account."""
-    try:
-        # Look up platform account
-        platform_account = get_platform_account(account_id)
-        if not platform_account:
-            raise HTTPException(status_code=404, detail="Account not found")
-
-        stripe_client = stripe.StripeClient(os.getenv("STRIPE_SECRET_KEY"))
-
-        # Delete the Stripe account
-        try:
-            stripe_client.v2.core.accounts.delete(platform_account.stripe_account_id)
-        except stripe.error.StripeError as e:
-            print(f"Warning: Could not delete Stripe account: {e}")
+@router.delete("/{account_id}", status_code=202)
+async def delete_account(
+    account_id: str,
+    response: Response,
+    deletion_jobs: DeletionWorkerPool = Depends(get_deletion_jobs),
+):
+    """Queue the deletion of a platform account and its Stripe account and customer.
 
-        # Delete the Stripe customer if exists
-        if platform_account.stripe_customer_id:
-            try:
-                stripe.Customer.delete(platform_account.stripe_customer_id)
-            except stripe.error.StripeError as e:
-                print(f"Warning: Could not delete Stripe customer: {e}")
+    Answers 202 with the job right away; its progress is at ``status_url``.
+    Deleting an account that already has an unfinished job returns that job.
+    """
+    platform_account = get_platform_account(account_id)
+    if not platform_account:
+        raise HTTPException(status_code=404, detail="Account not found")
 
-        # Delete from our mock DB
-        delete_platform_account(account_id)
-
-        return {"status": "deleted", "account_id": account_id}
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    job = await asyncio.to_thread(deletion_jobs.enqueue, platform_account)
+    status_url = f"/api/accounts/deletion-jobs/{job['id']}"
+    response.headers["Location"] = status_url
+    return {**job_summary(job), "status_url": status_url}
 
 
 @router.post("/{account_id}/upgrade-to-recipient")
-async def upgrade_to_recipient(request: Request, account_id: str):
+async def upgrade_to_recipient(
+    request: Request,
+    account_id: str,
+    stripe_clients: StripeClients = Depends(get_stripe_clients),
+):
     """Upgrade a customer account to also be a recipient (able to accept payments)."""
-    stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
-
     try:
         # Look up platform account
         platform_account = get_platform_account(account_id)
@@ -240,12 +328,9 @@ async def upgrade_to_recipient(request: Request, account_id: str):
             raise HTTPException(status_code=404, detail="Account not found")
 
         # Use preview version for recipient.capabilities.bank_accounts
-        stripe_client = stripe.StripeClient(
-            os.getenv("STRIPE_SECRET_KEY"),
-            stripe_version="2025-12-15.preview"
-        )
+        stripe_client = stripe_clients.preview
 
-        account = stripe_client.v2.core.accounts.update(
+        account = await stripe_client.v2.core.accounts.update_async(
             platform_account.stripe_account_id,
             {
                 "identity": {
@@ -280,6 +365,7 @@ async def upgrade_to_recipient(request: Request, account_id: str):
                 ],
             }
         )
+        invalidate_account_snapshot(platform_account.stripe_account_id)
 
         config = account.get("configuration", {})
         return {
@@ -293,7 +379,7 @@ async def upgrade_to_recipient(request: Request, account_id: str):
     except HTTPException:
         raise
     except stripe.error.StripeError as e:
-        raise HTTPException(status_code=400, detail=str(e.user_message or e))
+        raise HTTPException(status_code=stripe_error_status(e), detail=str(e.user_message or e))
 
 
 class AccountLinkRequest(BaseModel):
@@ -302,7 +388,11 @@ class AccountLinkRequest(BaseModel):
 
 
 @router.post("/{id}/onboarding-link")
-async def create_onboarding_link(id: str, request: AccountLinkRequest):
+async def create_onboarding_link(
+    id: str,
+    request: AccountLinkRequest,
+    stripe_clients: StripeClients = Depends(get_stripe_clients),
+):
     """Create an account link for recipient onboarding."""
     try:
         # Look up platform account
@@ -310,16 +400,10 @@ async def create_onboarding_link(id: str, request: AccountLinkRequest):
         if not platform_account:
             raise HTTPException(status_code=404, detail="Account not found")
 
-        stripe_client = stripe.StripeClient(
-            os.getenv("STRIPE_SECRET_KEY"),
-            stripe_version="2025-12-15.preview"
-        )
+        stripe_client = stripe_clients.preview
 
         # Check if account has recipient configuration
-        account = stripe_client.v2.core.accounts.retrieve(
-            platform_account.stripe_account_id,
-            {"include": ["configuration.recipient"]}
-        )
+        account = await get_account_snapshot(stripe_client, platform_account.stripe_account_id)
 
         # Verify recipient is in applied_configurations
         applied_configs = account.get("applied_configurations", [])
@@ -330,7 +414,7 @@ async def create_onboarding_link(id: str, request: AccountLinkRequest):
             )
 
         # Now create the onboarding link - must match applied configurations exactly
-        account_link = stripe_client.v2.core.account_links.create({
+        account_link = await stripe_client.v2.core.account_links.create_async({
             "account": platform_account.stripe_account_id,
             "use_case": {
                 "type": "account_onboarding",
@@ -350,4 +434,4 @@ async def create_onboarding_link(id: str, request: AccountLinkRequest):
     except HTTPException:
         raise
     except stripe.error.StripeError as e:
-        raise HTTPException(status_code=400, detail=str(e.user_message or e))
+        raise HTTPException(status_code=stripe_error_status(e), detail=str(e.user_message or e))
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from services.database import get_platform_account
 import stripe
-import os
 
-from services.stripe_service import StripeService
+from dependencies import get_async_stripe_service
+from services.async_stripe_service import AsyncStripeService
+from services.resilience import stripe_error_status
+from services.serialization import ModelResponse
 from schemas.external_account import (
     CreateExternalAccountRequest,
     ExternalAccountResponse,
@@ -14,55 +16,69 @@ router = APIRouter(prefix="/api/accounts/{account_id}/external-accounts", tags=[
 
 
 @router.post("", response_model=ExternalAccountResponse)
-async def create_external_account(account_id: str, request: CreateExternalAccountRequest):
+async def create_external_account(
+    account_id: str,
+    request: CreateExternalAccountRequest,
+    stripe_service: AsyncStripeService = Depends(get_async_stripe_service),
+):
     """Add a bank account to a connected account using a token from Stripe.js."""
     try:
-        external_account = StripeService.create_external_account(account_id, request.token)
-        return ExternalAccountResponse.from_stripe_external_account(external_account)
+        external_account = await stripe_service.create_external_account(account_id, request.token)
+        return ModelResponse(ExternalAccountResponse.from_stripe_external_account(external_account))
     except stripe.error.InvalidRequestError as e:
         raise HTTPException(status_code=400, detail=str(e.user_message or e))
     except stripe.error.StripeError as e:
-        raise HTTPException(status_code=400, detail=str(e.user_message or e))
+        raise HTTPException(status_code=stripe_error_status(e), detail=str(e.user_message or e))
 
 
 @router.get("", response_model=ExternalAccountListResponse)
-async def list_external_accounts(account_id: str):
+async def list_external_accounts(
+    account_id: str,
+    stripe_service: AsyncStripeService = Depends(get_async_stripe_service),
+):
     """List external accounts (bank accounts) for a connected account."""
     try:
         platform_account = get_platform_account(account_id)
-        stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
-        external_accounts = StripeService.list_external_accounts(platform_account.stripe_account_id)
-        return ExternalAccountListResponse(
+        external_accounts = await stripe_service.list_external_accounts(platform_account.stripe_account_id)
+        return ModelResponse(ExternalAccountListResponse(
             external_accounts=[
                 ExternalAccountResponse.from_stripe_external_account(ea)
                 for ea in external_accounts
             ]
-        )
+        ))
     except stripe.error.InvalidRequestError as e:
         raise HTTPException(status_code=404, detail="Account not found")
     except stripe.error.StripeError as e:
-        raise HTTPException(status_code=400, detail=str(e.user_message or e))
+        raise HTTPException(status_code=stripe_error_status(e), detail=str(e.user_message or e))
 
 
 @router.delete("/{external_account_id}")
-async def delete_external_account(account_id: str, external_account_id: str):
+async def delete_external_account(
+    account_id: str,
+    external_account_id: str,
+    stripe_service: AsyncStripeService = Depends(get_async_stripe_service),
+):
     """Remove an external account from a connected account."""
     try:
-        StripeService.delete_external_account(account_id, external_account_id)
+        await stripe_service.delete_external_account(account_id, external_account_id)
         return {"status": "deleted", "external_account_id": external_account_id}
     except stripe.error.InvalidRequestError as e:
         raise HTTPException(status_code=404, detail="External account not found")
     except stripe.error.StripeError as e:
-        raise HTTPException(status_code=400, detail=str(e.user_message or e))
+        raise HTTPException(status_code=stripe_error_status(e), detail=str(e.user_message or e))
 
 
 @router.patch("/{external_account_id}/default", response_model=ExternalAccountResponse)
-async def set_default_external_account(account_id: str, external_account_id: str):
+async def set_default_external_account(
+    account_id: str,
+    external_account_id: str,
+    stripe_service: AsyncStripeService = Depends(get_async_stripe_service),
+):
     """Set an external account as the default for payouts."""
     try:
-        external_account = StripeService.set_default_external_account(account_id, external_account_id)
-        return ExternalAccountResponse.from_stripe_external_account(external_account)
+        external_account = await stripe_service.set_default_external_account(account_id, external_account_id)
+        return ModelResponse(ExternalAccountResponse.from_stripe_external_account(external_account))
     except stripe.error.InvalidRequestError as e:
         raise HTTPException(status_code=404, detail="External account not found")
     except stripe.error.StripeError as e:
-        raise HTTPException(status_code=400, detail=str(e.user_message or e))
+        raise HTTPException(status_code=stripe_error_status(e), detail=str(e.user_message or e))
@@ -1,11 +1,16 @@
-import os
 from typing import Optional
 
-from fastapi import APIRouter, HTTPException, Query
-from services.stripe_service import StripeService
+from fastapi import APIRouter, Depends, HTTPException, Query
+from services.async_stripe_service import AsyncStripeService
+from services.customer_ids import resolve_customer_id
 import stripe
 
+from dependencies import get_stripe_clients, get_async_stripe_service
+from services.resilience import stripe_error_status
+from services.serialization import ModelResponse
+from services.stripe_client import StripeClients
 from services.database import get_platform_account, update_platform_account
+from services.payment_method_owners import forget_payment_method_owner, remember_payment_method_owner
 from schemas.payment_method import (
     SetupIntentResponse,
     PaymentMethodResponse,
@@ -18,11 +23,11 @@ router = APIRouter(prefix="/api/accounts/{account_id}/payment-methods", tags=["p
 @router.post("/setup-intent", response_model=SetupIntentResponse)
 async def create_setup_intent(
     account_id: str,
-    customer_id: Optional[str] = Query(None, description="Existing Stripe Customer ID")
+    customer_id: Optional[str] = Query(None, description="Existing Stripe Customer ID"),
+    stripe_clients: StripeClients = Depends(get_stripe_clients),
+    stripe_service: AsyncStripeService = Depends(get_async_stripe_service),
 ):
     """Create a SetupIntent to collect a payment method for a platform account."""
-    stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
-
     try:
         # Look up platform account
         platform_account = get_platform_account(account_id)
@@ -30,20 +35,20 @@ async def create_setup_intent(
             raise HTTPException(status_code=404, detail="Account not found")
 
         customer_id = ""
-        customer_id = StripeService.get_customer_id_for_account_with_account_id(account_id=platform_account.stripe_account_id)
+        customer_id = await resolve_customer_id(stripe_service, platform_account)
 
-        if customer_id == "":
+        if not customer_id:
             raise HTTPException(status_code=400, detail="Account has no customer ID")
 
-        setup_intent = stripe.SetupIntent.create(
-            customer=customer_id,
-            usage="off_session",
-            payment_method_types=["card"],
-            metadata={
+        setup_intent = await stripe_clients.default.v1.setup_intents.create_async({
+            "customer": customer_id,
+            "usage": "off_session",
+            "payment_method_types": ["card"],
+            "metadata": {
                 "platform_account_id": account_id,
                 "stripe_account_id": platform_account.stripe_account_id,
             },
-        )
+        })
 
         return SetupIntentResponse(
             client_secret=setup_intent.client_secret,
@@ -55,14 +60,16 @@ async def create_setup_intent(
     except stripe.error.InvalidRequestError as e:
         raise HTTPException(status_code=404, detail="Customer not found")
     except stripe.error.StripeError as e:
-        raise HTTPException(status_code=400, detail=str(e.user_message or e))
+        raise HTTPException(status_code=stripe_error_status(e), detail=str(e.user_message or e))
 
 
 @router.get("", response_model=PaymentMethodListResponse)
-async def list_payment_methods(account_id: str):
+async def list_payment_methods(
+    account_id: str,
+    stripe_clients: StripeClients = Depends(get_stripe_clients),
+    stripe_service: AsyncStripeService = Depends(get_async_stripe_service),
+):
     """List payment methods attached to a platform account."""
-    stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
-
     try:
         # Look up platform account
         platform_account = get_platform_account(account_id)
@@ -71,23 +78,24 @@ async def list_payment_methods(account_id: str):
             raise HTTPException(status_code=404, detail="Account not found")
 
         # Use the platform account's stripe_customer_id
-        customer_id = StripeService.get_customer_id_for_account_with_account_id(account_id=platform_account.stripe_account_id)
+        customer_id = await resolve_customer_id(stripe_service, platform_account)
 
         if not customer_id:
-            return PaymentMethodListResponse(payment_methods=[])
+            return ModelResponse(PaymentMethodListResponse(payment_methods=[]))
         
-        stripe_client = stripe.StripeClient(os.getenv("STRIPE_SECRET_KEY"))
-        payment_methods = stripe_client.v1.customers.payment_methods.list(
+        payment_methods = await stripe_clients.default.v1.customers.payment_methods.list_async(
             customer_id,
             {"limit": 3},
         )
+        for pm in payment_methods:
+            remember_payment_method_owner(pm.id, customer_id)
 
-        return PaymentMethodListResponse(
+        return ModelResponse(PaymentMethodListResponse(
             payment_methods=[
                 PaymentMethodResponse.from_stripe_payment_method(pm)
                 for pm in payment_methods
             ]
-        )
+        ))
     except HTTPException:
         raise
     except stripe.error.InvalidRequestError as e:
@@ -95,14 +103,16 @@ async def list_payment_methods(account_id: str):
         raise HTTPException(status_code=404, detail="Customer not found")
     except stripe.error.StripeError as e:
         print("list_payment_methods", e)
-        raise HTTPException(status_code=400, detail=str(e.user_message or e))
+        raise HTTPException(status_code=stripe_error_status(e), detail=str(e.user_message or e))
 
 
 @router.delete("/{payment_method_id}")
-async def delete_payment_method(account_id: str, payment_method_id: str):
+async def delete_payment_method(
+    account_id: str,
+    payment_method_id: str,
+    stripe_clients: StripeClients = Depends(get_stripe_clients),
+):
     """Detach a payment method from a platform account."""
-    stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
-
     try:
         # Look up platform account (just to verify it exists)
         platform_account = get_platform_account(account_id)
@@ -110,7 +120,8 @@ async def delete_payment_method(account_id: str, payment_method_id: str):
             raise HTTPException(status_code=404, detail="Account not found")
 
         # Detach the payment method
-        stripe.PaymentMethod.detach(payment_method_id)
+        await stripe_clients.default.v1.payment_methods.detach_async(payment_method_id)
+        forget_payment_method_owner(payment_method_id)
 
         return {"status": "detached", "payment_method_id": payment_method_id}
     except HTTPException:
@@ -118,4 +129,4 @@ async def delete_payment_method(account_id: str, payment_method_id: str):
     except stripe.error.InvalidRequestError as e:
         raise HTTPException(status_code=404, detail="Payment method not found")
     except stripe.error.StripeError as e:
-        raise HTTPException(status_code=400, detail=str(e.user_message or e))
+        raise HTTPException(status_code=stripe_error_status(e), detail=str(e.user_message or e))
@@ -1,18 +1,31 @@
+import asyncio
 import os
-from typing import Optional
+import uuid
+from typing import Dict, List, Optional
 
-from fastapi import APIRouter, HTTPException
-from services.stripe_service import StripeService
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+import orjson
+from services.async_stripe_service import AsyncStripeService
+from services.customer_ids import resolve_customer_id
 import stripe
 from pydantic import BaseModel
 
+from dependencies import get_stripe_clients, get_async_stripe_service
+from services.resilience import stripe_error_status
+from services.stripe_client import StripeClients
 from services.database import (
     get_platform_account,
 )
+from services.idempotency import run_idempotent
+from services.payment_method_owners import (
+    forget_payment_method_owner,
+    get_payment_method_owner,
+    remember_payment_method_owner,
+)
 
 router = APIRouter(prefix="/api/transactions", tags=["transactions"])
 
-
 class PayUserRequest(BaseModel):
     amount: int  # Amount in cents
     currency: str = "usd"
@@ -20,6 +33,11 @@ class PayUserRequest(BaseModel):
     payment_method_id: str  # The sender's payment method to charge
 
 
+class BulkPayUserRequest(BaseModel):
+    payments: List[PayUserRequest]
+    batch_id: Optional[str] = None  # Reuse to retry a batch without double-charging
+
+
 class CreatePaymentIntentRequest(BaseModel):
     amount: int  # Amount in cents
     currency: str = "usd"
@@ -27,13 +45,118 @@ class CreatePaymentIntentRequest(BaseModel):
     save_payment_method: bool = False  # Whether to save the card for future use
 
 
+def _application_fee(amount: int) -> int:
+    # Calculate 10% application fee (platform keeps this, rest goes to recipient)
+    return int(amount * 0.10)
+
+
+def _destination_charge_params(
+    account_id: str,
+    sender_account,
+    recipient_account,
+    customer_id: str,
+    request: PayUserRequest,
+) -> dict:
+    """PaymentIntent parameters for an off-session destination charge."""
+    # Use the recipient's stripe_account_id for the transfer
+    return {
+        "amount": request.amount,
+        "currency": request.currency,
+        "customer": customer_id,
+        "payment_method": request.payment_method_id,
+        "confirm": True,
+        "off_session": True,
+        "application_fee_amount": _application_fee(request.amount),
+        "transfer_data": {
+            "destination": recipient_account.stripe_account_id,
+        },
+        "metadata": {
+            "sender_platform_id": account_id,
+            "recipient_platform_id": request.recipient_account_id,
+            "sender_stripe_account": sender_account.stripe_account_id,
+            "recipient_stripe_account": recipient_account.stripe_account_id,
+        },
+    }
+
+
+def _pay_user_result(payment_intent, request: PayUserRequest) -> dict:
+    return {
+        "id": payment_intent.id,
+        "amount": payment_intent.amount,
+        "currency": payment_intent.currency,
+        "status": payment_intent.status,
+        "application_fee": _application_fee(request.amount),
+        "recipient": request.recipient_account_id,
+        "transfer": payment_intent.get("transfer_data", {}).get("destination"),
+        "created": payment_intent.created,
+    }
+
+
+def _stripe_request_options(operation: str, account_id: str, idempotency_key: Optional[str]) -> dict:
+    # Forward the client's key so Stripe also dedupes if our stored response is lost
+    if not idempotency_key:
+        return {}
+    return {"idempotency_key": f"{operation}-{account_id}-{idempotency_key}"}
+
+
+async def _attach_if_needed(
+    stripe_client: stripe.StripeClient,
+    payment_method_id: str,
+    customer_id: str,
+    owner: Optional[str],
+):
+    if owner != customer_id:
+        # Attach the payment method to the customer
+        await stripe_client.v1.payment_methods.attach_async(
+            payment_method_id,
+            {"customer": customer_id},
+        )
+    remember_payment_method_owner(payment_method_id, customer_id)
+
+
+async def _ensure_payment_method_attached(
+    stripe_client: stripe.StripeClient,
+    payment_method_id: str,
+    customer_id: str,
+):
+    # Check if the payment method is already attached to this customer, asking Stripe only if we don't know
+    owner = get_payment_method_owner(payment_method_id)
+    if owner is None:
+        pm = await stripe_client.v1.payment_methods.retrieve_async(payment_method_id)
+        owner = pm.customer
+    await _attach_if_needed(stripe_client, payment_method_id, customer_id, owner)
+
+
 @router.post("/{account_id}/pay-user")
-async def pay_user(account_id: str, request: PayUserRequest):
+async def pay_user(
+    account_id: str,
+    request: PayUserRequest,
+    http_request: Request,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    stripe_clients: StripeClients = Depends(get_stripe_clients),
+    stripe_service: AsyncStripeService = Depends(get_async_stripe_service),
+):
     """
     Pay another user using destination charges.
     Charges the sender's payment method and transfers funds to the recipient.
+    Retrying with the same Idempotency-Key header returns the original result
+    instead of charging again.
     """
-    stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+    return await run_idempotent(
+        http_request,
+        idempotency_key,
+        lambda: _pay_user(account_id, request, idempotency_key, stripe_clients, stripe_service),
+    )
+
+
+async def _pay_user(
+    account_id: str,
+    request: PayUserRequest,
+    idempotency_key: Optional[str],
+    stripe_clients: StripeClients,
+    stripe_service: AsyncStripeService,
+):
+    stripe_client = stripe_clients.default
 
     try:
         # Look up sender platform account
@@ -46,72 +169,183 @@ async def pay_user(account_id: str, request: PayUserRequest):
         if not recipient_account:
             raise HTTPException(status_code=404, detail="Recipient account not found")
 
-        # Use the sender's stripe_customer_id
-        customer_id = StripeService.get_customer_id_for_account_with_account_id(sender_account.stripe_account_id)
+        # Resolve the sender's customer and who owns the payment method. Both usually
+        # come from local caches; when the owner is unknown, fetch it alongside the customer.
+        owner = get_payment_method_owner(request.payment_method_id)
+        if owner is None:
+            customer_id, pm = await asyncio.gather(
+                resolve_customer_id(stripe_service, sender_account),
+                stripe_client.v1.payment_methods.retrieve_async(request.payment_method_id),
+            )
+            owner = pm.customer
+        else:
+            customer_id = await resolve_customer_id(stripe_service, sender_account)
 
         if not customer_id:
             raise HTTPException(status_code=400, detail="Sender has no customer ID")
 
-        # Check if the payment method is already attached to this customer
-        pm = stripe.PaymentMethod.retrieve(request.payment_method_id)
-        if pm.customer != customer_id:
-            # Attach the payment method to the customer
-            stripe.PaymentMethod.attach(
-                request.payment_method_id,
-                customer=customer_id,
-            )
+        await _attach_if_needed(stripe_client, request.payment_method_id, customer_id, owner)
 
         # Create a PaymentIntent with destination charge
-        # Use the recipient's stripe_account_id for the transfer
-        # Calculate 10% application fee (platform keeps this, rest goes to recipient)
-        application_fee = int(request.amount * 0.10)
-
-        payment_intent = stripe.PaymentIntent.create(
-            amount=request.amount,
-            currency=request.currency,
-            customer=customer_id,
-            payment_method=request.payment_method_id,
-            confirm=True,
-            off_session=True,
-            application_fee_amount=application_fee,
-            transfer_data={
-                "destination": recipient_account.stripe_account_id,
-            },
-            metadata={
-                "sender_platform_id": account_id,
-                "recipient_platform_id": request.recipient_account_id,
-                "sender_stripe_account": sender_account.stripe_account_id,
-                "recipient_stripe_account": recipient_account.stripe_account_id,
-            },
+        payment_intent = await stripe_client.v1.payment_intents.create_async(
+            _destination_charge_params(account_id, sender_account, recipient_account, customer_id, request),
+            _stripe_request_options("pay-user", account_id, idempotency_key),
         )
 
-        return {
-            "id": payment_intent.id,
-            "amount": payment_intent.amount,
-            "currency": payment_intent.currency,
-            "status": payment_intent.status,
-            "application_fee": application_fee,
-            "recipient": request.recipient_account_id,
-            "transfer": payment_intent.get("transfer_data", {}).get("destination"),
-            "created": payment_intent.created,
-        }
+        return _pay_user_result(payment_intent, request)
     except HTTPException:
         raise
     except stripe.error.CardError as e:
         raise HTTPException(status_code=400, detail=str(e.user_message or "Card was declined"))
-    except stripe.error.StripeError as e:
+    except stripe.error.InvalidRequestError as e:
+        # The cached owner may be stale (e.g. detached elsewhere); check with Stripe next time
+        forget_payment_method_owner(request.payment_method_id)
         raise HTTPException(status_code=400, detail=str(e.user_message or e))
+    except stripe.error.StripeError as e:
+        raise HTTPException(status_code=stripe_error_status(e), detail=str(e.user_message or e))
+
+
+@router.post("/{account_id}/pay-users")
+async def pay_users(
+    account_id: str,
+    request: BulkPayUserRequest,
+    http_request: Request,
+    stream: bool = Query(False, description="Stream per-item results as NDJSON as they complete"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    stripe_clients: StripeClients = Depends(get_stripe_clients),
+    stripe_service: AsyncStripeService = Depends(get_async_stripe_service),
+):
+    """
+    Pay many users from one sender in a single request.
+    The sender and its customer are resolved once, each distinct payment method
+    is attached at most once, and the destination charges then run concurrently
+    under BULK_PAY_CONCURRENCY, paced by the outbound Stripe rate limiter. Every
+    charge carries an idempotency key derived from the sender, batch_id and its
+    index, so resubmitting a batch with the same batch_id never charges twice.
+    An Idempotency-Key header stands in for a missing batch_id, and replays the
+    stored summary for non-streamed requests.
+    """
+    if stream:
+        return await _pay_users(account_id, request, stream, idempotency_key, stripe_clients, stripe_service)
+    return await run_idempotent(
+        http_request,
+        idempotency_key,
+        lambda: _pay_users(account_id, request, stream, idempotency_key, stripe_clients, stripe_service),
+    )
+
+
+async def _pay_users(
+    account_id: str,
+    request: BulkPayUserRequest,
+    stream: bool,
+    idempotency_key: Optional[str],
+    stripe_clients: StripeClients,
+    stripe_service: AsyncStripeService,
+):
+    stripe_client = stripe_clients.default
+
+    max_items = int(os.getenv("BULK_PAY_MAX_ITEMS", "1000"))
+    if len(request.payments) > max_items:
+        raise HTTPException(status_code=400, detail=f"At most {max_items} payments per batch")
+
+    try:
+        sender_account = get_platform_account(account_id)
+        if not sender_account:
+            raise HTTPException(status_code=404, detail="Sender account not found")
+
+        customer_id = await resolve_customer_id(stripe_service, sender_account)
+        if not customer_id:
+            raise HTTPException(status_code=400, detail="Sender has no customer ID")
+    except stripe.error.StripeError as e:
+        raise HTTPException(status_code=stripe_error_status(e), detail=str(e.user_message or e))
+
+    batch_id = request.batch_id or idempotency_key or uuid.uuid4().hex
+    semaphore = asyncio.Semaphore(int(os.getenv("BULK_PAY_CONCURRENCY", "10")))
+
+    # Attach each distinct payment method once, shared by every item that uses it
+    attachments: Dict[str, asyncio.Task] = {}
+
+    def attach(payment_method_id: str) -> asyncio.Task:
+        if payment_method_id not in attachments:
+            attachments[payment_method_id] = asyncio.ensure_future(
+                _ensure_payment_method_attached(stripe_client, payment_method_id, customer_id)
+            )
+        return attachments[payment_method_id]
+
+    async def pay(index: int, item: PayUserRequest) -> dict:
+        result = {"index": index, "recipient": item.recipient_account_id}
+        try:
+            recipient_account = get_platform_account(item.recipient_account_id)
+            if not recipient_account:
+                return {**result, "status": "failed", "error": "Recipient account not found"}
+
+            async with semaphore:
+                await attach(item.payment_method_id)
+                payment_intent = await stripe_client.v1.payment_intents.create_async(
+                    _destination_charge_params(account_id, sender_account, recipient_account, customer_id, item),
+                    _stripe_request_options(f"pay-users-{index}", account_id, batch_id),
+                )
+            return {**result, "status": "succeeded", "payment_intent": _pay_user_result(payment_intent, item)}
+        except stripe.error.CardError as e:
+            return {**result, "status": "failed", "error": str(e.user_message or "Card was declined")}
+        except stripe.error.InvalidRequestError as e:
+            forget_payment_method_owner(item.payment_method_id)
+            return {**result, "status": "failed", "error": str(e.user_message or e)}
+        except stripe.error.StripeError as e:
+            return {**result, "status": "failed", "error": str(e.user_message or e)}
+
+    tasks = [asyncio.ensure_future(pay(index, item)) for index, item in enumerate(request.payments)]
+
+    if stream:
+        async def results():
+            try:
+                for next_result in asyncio.as_completed(tasks):
+                    yield orjson.dumps(await next_result) + b"\n"
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(results(), media_type="application/x-ndjson")
+
+    results = await asyncio.gather(*tasks)
+    succeeded = sum(1 for result in results if result["status"] == "succeeded")
+    return {
+        "batch_id": batch_id,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results,
+    }
 
 
 @router.post("/{account_id}/create-payment-intent")
-async def create_payment_intent(account_id: str, request: CreatePaymentIntentRequest):
+async def create_payment_intent(
+    account_id: str,
+    request: CreatePaymentIntentRequest,
+    http_request: Request,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    stripe_clients: StripeClients = Depends(get_stripe_clients),
+    stripe_service: AsyncStripeService = Depends(get_async_stripe_service),
+):
     """
     Create a PaymentIntent for paying another user with a new card.
     The frontend will use Stripe Elements to collect card details and confirm the payment.
     Optionally saves the payment method for future use.
+    Retrying with the same Idempotency-Key header returns the same PaymentIntent.
     """
-    stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+    return await run_idempotent(
+        http_request,
+        idempotency_key,
+        lambda: _create_payment_intent(account_id, request, idempotency_key, stripe_clients, stripe_service),
+    )
+
 
+async def _create_payment_intent(
+    account_id: str,
+    request: CreatePaymentIntentRequest,
+    idempotency_key: Optional[str],
+    stripe_clients: StripeClients,
+    stripe_service: AsyncStripeService,
+):
     try:
         # Look up sender platform account
         sender_account = get_platform_account(account_id)
@@ -124,7 +358,7 @@ async def create_payment_intent(account_id: str, request: CreatePaymentIntentReq
             raise HTTPException(status_code=404, detail="Recipient account not found")
 
         # Get the sender's customer ID
-        customer_id = StripeService.get_customer_id_for_account_with_account_id(sender_account.stripe_account_id)
+        customer_id = await resolve_customer_id(stripe_service, sender_account)
 
         if not customer_id:
             raise HTTPException(status_code=400, detail="Sender has no customer ID")
@@ -150,7 +384,10 @@ async def create_payment_intent(account_id: str, request: CreatePaymentIntentReq
             payment_intent_params["setup_future_usage"] = "off_session"
 
         # Create PaymentIntent (not confirmed yet - frontend will confirm with card details)
-        payment_intent = stripe.PaymentIntent.create(**payment_intent_params)
+        payment_intent = await stripe_clients.default.v1.payment_intents.create_async(
+            payment_intent_params,
+            _stripe_request_options("create-payment-intent", account_id, idempotency_key),
+        )
 
         return {
             "client_secret": payment_intent.client_secret,
@@ -162,4 +399,4 @@ async def create_payment_intent(account_id: str, request: CreatePaymentIntentReq
     except HTTPException:
         raise
     except stripe.error.StripeError as e:
-        raise HTTPException(status_code=400, detail=str(e.user_message or e))
+        raise HTTPException(status_code=stripe_error_status(e), detail=str(e.user_message or e))
@@ -0,0 +1,82 @@
+import asyncio
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+import orjson
+import stripe
+
+from dependencies import get_webhook_events
+from services.metrics import WEBHOOK_EVENTS
+from services.webhook_events import WebhookWorkerPool, event_object_id, event_summary
+
+router = APIRouter(prefix="/webhooks", tags=["webhooks"])
+
+
+@router.post("/stripe")
+async def stripe_webhook(
+    request: Request,
+    webhook_events: WebhookWorkerPool = Depends(get_webhook_events),
+):
+    """Receive a Stripe event, store it and acknowledge it.
+
+    The event is verified, appended to the local event log unless it was
+    already received, and processed afterwards by the webhook workers.
+    """
+    secret = os.getenv("STRIPE_WEBHOOK_SECRET")
+    if not secret:
+        raise HTTPException(status_code=503, detail="Webhook secret is not configured")
+
+    body = await request.body()
+    try:
+        payload = body.decode("utf-8")
+        stripe.WebhookSignature.verify_header(
+            payload,
+            request.headers.get("stripe-signature", ""),
+            secret,
+        )
+        event = orjson.loads(payload)
+    except stripe.error.SignatureVerificationError:
+        raise HTTPException(status_code=400, detail="Invalid signature")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid payload")
+    if not isinstance(event, dict) or not event.get("id"):
+        raise HTTPException(status_code=400, detail="Invalid payload")
+
+    seq = await asyncio.to_thread(
+        webhook_events.store.append, event["id"], event.get("type", ""), event_object_id(event), payload
+    )
+    if seq is None:
+        WEBHOOK_EVENTS.inc("duplicate")
+        return {"received": True, "duplicate": True}
+
+    WEBHOOK_EVENTS.inc("received")
+    webhook_events.notify()
+    return {"received": True, "seq": seq}
+
+
+@router.get("/stripe/events")
+async def list_webhook_events(
+    after: int = Query(0, ge=0, description="Return events with a seq greater than this offset"),
+    limit: int = Query(100, ge=1, le=1000),
+    status: Optional[str] = Query(None, description="Only events in this status"),
+    webhook_events: WebhookWorkerPool = Depends(get_webhook_events),
+):
+    """Page through the stored events by offset, with their processing status."""
+    events = await asyncio.to_thread(webhook_events.store.list, after, limit, status)
+    return {
+        "events": [event_summary(event) for event in events],
+        "counts": await asyncio.to_thread(webhook_events.store.counts),
+    }
+
+
+@router.post("/stripe/replay")
+async def replay_webhook_events(
+    from_seq: int = Query(..., ge=0, description="First seq to process again"),
+    to_seq: Optional[int] = Query(None, ge=0, description="Last seq to process again (default: the latest)"),
+    webhook_events: WebhookWorkerPool = Depends(get_webhook_events),
+):
+    """Process the stored events from an offset again, e.g. after fixing a handler or restoring local state."""
+    replayed = await asyncio.to_thread(webhook_events.store.replay, from_seq, to_seq)
+    webhook_events.notify()
+    return {"replayed": replayed}
@@ -37,27 +37,28 @@ class AccountResponse(BaseModel):
     @classmethod
     def from_stripe_account(cls, account) -> "AccountResponse":
         external_accounts = []
-        if account.external_accounts and account.external_accounts.data:
-            for ea in account.external_accounts.data:
+        if account.get("external_accounts") and account["external_accounts"].get("data"):
+            for ea in account["external_accounts"]["data"]:
                 external_accounts.append(
                     ExternalAccountSummary(
-                        id=ea.id,
-                        bank_name=getattr(ea, "bank_name", None),
-                        last4=ea.last4,
-                        currency=ea.currency,
-                        default_for_currency=ea.default_for_currency or False,
+                        id=ea["id"],
+                        bank_name=ea.get("bank_name"),
+                        last4=ea.get("last4"),
+                        currency=ea.get("currency"),
+                        default_for_currency=ea.get("default_for_currency") or False,
                     )
                 )
 
+        business_profile = account.get("business_profile")
         return cls(
-            stripe_account_id=account.id,
-            email=account.email,
-            business_name=account.business_profile.name if account.business_profile else None,
-            charges_enabled=account.charges_enabled,
-            payouts_enabled=account.payouts_enabled,
-            details_submitted=account.details_submitted,
+            stripe_account_id=account["id"],
+            email=account.get("email"),
+            business_name=business_profile.get("name") if business_profile else None,
+            charges_enabled=account.get("charges_enabled"),
+            payouts_enabled=account.get("payouts_enabled"),
+            details_submitted=account.get("details_submitted"),
             external_accounts=external_accounts,
-            created=account.created,
+            created=account.get("created"),
         )
 
 
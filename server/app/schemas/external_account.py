@@ -20,15 +20,15 @@ class ExternalAccountResponse(BaseModel):
     @classmethod
     def from_stripe_external_account(cls, ea) -> "ExternalAccountResponse":
         return cls(
-            id=ea.id,
-            object=ea.object,
-            bank_name=getattr(ea, "bank_name", None),
-            last4=ea.last4,
-            routing_number=getattr(ea, "routing_number", None),
-            currency=ea.currency,
-            country=ea.country,
-            default_for_currency=ea.default_for_currency or False,
-            status=getattr(ea, "status", None),
+            id=ea["id"],
+            object=ea.get("object"),
+            bank_name=ea.get("bank_name"),
+            last4=ea.get("last4"),
+            routing_number=ea.get("routing_number"),
+            currency=ea.get("currency"),
+            country=ea.get("country"),
+            default_for_currency=ea.get("default_for_currency") or False,
+            status=ea.get("status"),
         )
 
 
@@ -23,20 +23,22 @@ class PaymentMethodResponse(BaseModel):
 
     @classmethod
     def from_stripe_payment_method(cls, pm) -> "PaymentMethodResponse":
+        # Stripe objects are dicts; item access is several times cheaper than their attribute access
         card = None
-        if pm.type == "card" and pm.card:
+        stripe_card = pm.get("card")
+        if pm.get("type") == "card" and stripe_card:
             card = CardDetails(
-                brand=pm.card.brand,
-                last4=pm.card.last4,
-                exp_month=pm.card.exp_month,
-                exp_year=pm.card.exp_year,
+                brand=stripe_card.get("brand"),
+                last4=stripe_card.get("last4"),
+                exp_month=stripe_card.get("exp_month"),
+                exp_year=stripe_card.get("exp_year"),
             )
 
         return cls(
-            id=pm.id,
-            type=pm.type,
+            id=pm["id"],
+            type=pm.get("type"),
             card=card,
-            created=pm.created,
+            created=pm.get("created"),
         )
 
 
@@ -1,3 +1,3 @@
-from .stripe_service import StripeService
+from .async_stripe_service import AsyncStripeService
 
-__all__ = ["StripeService"]
+__all__ = ["AsyncStripeService"]
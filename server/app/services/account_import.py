@@ -0,0 +1,261 @@
+import asyncio
+import csv
+import tempfile
+from typing import IO, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+import orjson
+import stripe
+from pydantic import ValidationError
+
+from schemas.account import CreateAccountRequest, PlatformAccount
+from services.database import generate_id, get_platform_account_by_email, insert_platform_accounts
+from services.fanout import bounded_gather
+from services.metrics import ACCOUNT_IMPORT_ROWS
+from services.resilience import stripe_error_status
+
+CSV = "csv"
+NDJSON = "ndjson"
+
+# Row outcomes
+CREATED = "created"
+SKIPPED = "skipped"
+INVALID = "invalid"
+FAILED = "failed"
+ROW_STATUSES = (CREATED, SKIPPED, INVALID, FAILED)
+
+_CONTENT_TYPES = {
+    "text/csv": CSV,
+    "application/csv": CSV,
+    "application/x-ndjson": NDJSON,
+    "application/ndjson": NDJSON,
+    "application/jsonl": NDJSON,
+}
+
+
+def account_create_params(request: CreateAccountRequest) -> dict:
+    """Parameters of the v2 account create call for a new platform account."""
+    return {
+        "contact_email": request.email,
+        "display_name": request.name,
+        "identity": {
+            "country": "us",
+        },
+        "configuration": {
+            "customer": {
+                "capabilities": {
+                    "automatic_indirect_tax": {"requested": True}
+                }
+            },
+        },
+        "defaults": {
+            "currency": "usd",
+            "locales": ["en-US"],
+        },
+        "include": [
+            "configuration.customer",
+            "identity",
+            "requirements",
+            "defaults"
+        ],
+    }
+
+
+async def create_stripe_account(stripe_client: stripe.StripeClient, request: CreateAccountRequest):
+    """Create the v2 account of a new platform account.
+
+    The account's own ID is then stored as its ``metadata.account_id``, the
+    value Customer searches and customer webhooks look accounts up by.
+    """
+    account = await stripe_client.v2.core.accounts.create_async(account_create_params(request))
+    await stripe_client.v2.core.accounts.update_async(
+        account.get("id", ""),
+        {"metadata": {"account_id": account.get("id", "")}},
+    )
+    return account
+
+
+def import_format(content_type: str) -> str:
+    """CSV or NDJSON, from a request's Content-Type header."""
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    if media_type not in _CONTENT_TYPES:
+        raise ValueError("Send the import as text/csv or application/x-ndjson")
+    return _CONTENT_TYPES[media_type]
+
+
+async def spool_body(chunks: AsyncIterator[bytes], max_memory: int = 1 << 20) -> IO[bytes]:
+    """Receive a whole request body into a temporary file, kept in memory up to ``max_memory`` bytes.
+
+    The body has to be in hand before a streaming response starts: once it
+    does, Starlette listens for the client disconnecting and swallows any body
+    messages that are still to come.
+    """
+    body = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    async for chunk in chunks:
+        body.write(chunk)
+    body.seek(0)
+    return body
+
+
+async def iter_file_chunks(file: IO[bytes], size: int = 1 << 16) -> AsyncIterator[bytes]:
+    """Read a spooled body back ``size`` bytes at a time."""
+    while True:
+        chunk = file.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, str]]:
+    """Non-blank lines of a streamed body with their 1-based line numbers."""
+    buffer = b""
+    number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            text = line.decode("utf-8", errors="replace").strip()
+            if text:
+                yield number, text
+    number += 1
+    text = buffer.decode("utf-8", errors="replace").strip()
+    if text:
+        yield number, text
+
+
+async def iter_import_rows(
+    chunks: AsyncIterator[bytes], fmt: str
+) -> AsyncIterator[Tuple[int, Union[dict, str]]]:
+    """Parse an import body into ``(line, row)`` pairs.
+
+    ``row`` is the row's fields as a dict, or an error message if the line
+    can't be parsed. A CSV import starts with a header naming its columns
+    (name, email and optionally country); empty CSV cells are left out. CSV
+    rows must not contain line breaks.
+    """
+    header: Optional[List[str]] = None
+    async for line, text in _iter_lines(chunks):
+        if fmt == NDJSON:
+            try:
+                row = orjson.loads(text)
+            except orjson.JSONDecodeError as e:
+                yield line, f"Invalid JSON: {e}"
+                continue
+            yield line, row if isinstance(row, dict) else "Each line must be a JSON object"
+            continue
+
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [column.strip().lower() for column in values]
+            continue
+        if len(values) != len(header):
+            yield line, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield line, {column: value for column, value in zip(header, values) if value != ""}
+
+
+async def _batches(rows: AsyncIterator, size: int) -> AsyncIterator[list]:
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc']) or 'row'}: {detail['msg']}"
+        for detail in error.errors()
+    )
+
+
+async def import_account_rows(
+    stripe_client: stripe.StripeClient,
+    rows: AsyncIterator[Tuple[int, Union[dict, str]]],
+    concurrency: int,
+    batch_size: int,
+) -> AsyncIterator[List[Dict]]:
+    """Create a platform account and Stripe account for every imported row.
+
+    Rows are taken ``batch_size`` at a time. A batch's Stripe accounts are
+    created with at most ``concurrency`` calls in flight (each still waits for
+    the outbound rate limiter), then its platform accounts are stored in one
+    write, and the per-row results are yielded in input order before the next
+    batch is read. Rows whose email already has a platform account, here or
+    earlier in the import, are skipped, so an interrupted import can be sent
+    again as is.
+    """
+    seen_emails = set()
+
+    async def create(item):
+        _, request = item
+        account = await create_stripe_account(stripe_client, request)
+        return generate_id(), account
+
+    async for batch in _batches(rows, batch_size):
+        results: List[Optional[Dict]] = [None] * len(batch)
+        requests = []
+        for index, (line, row) in enumerate(batch):
+            if isinstance(row, str):
+                results[index] = {"line": line, "status": INVALID, "error": row}
+                continue
+            try:
+                requests.append((index, CreateAccountRequest(**row)))
+            except ValidationError as e:
+                results[index] = {"line": line, "status": INVALID, "error": _validation_message(e)}
+
+        existing = await asyncio.to_thread(
+            lambda: [get_platform_account_by_email(request.email) for _, request in requests]
+        )
+        to_create = []
+        for (index, request), platform_account in zip(requests, existing):
+            line = batch[index][0]
+            if platform_account is not None or request.email in seen_emails:
+                results[index] = {
+                    "line": line,
+                    "status": SKIPPED,
+                    "email": request.email,
+                    "id": platform_account.id if platform_account else None,
+                    "error": "An account with this email already exists",
+                }
+                continue
+            seen_emails.add(request.email)
+            to_create.append((index, request))
+
+        created = await bounded_gather(create, to_create, concurrency=concurrency)
+
+        platform_accounts = []
+        for (index, request), result in zip(to_create, created):
+            line = batch[index][0]
+            if isinstance(result, Exception):
+                error = str(getattr(result, "user_message", None) or result) or type(result).__name__
+                status_code = stripe_error_status(result) if isinstance(result, stripe.error.StripeError) else 500
+                results[index] = {"line": line, "status": FAILED, "email": request.email,
+                                  "error": error, "status_code": status_code}
+                continue
+            account_id, account = result
+            platform_account = PlatformAccount(
+                id=account_id,
+                email=request.email,
+                stripe_account_id=account.get("id", ""),
+                stripe_customer_id="",
+            )
+            platform_accounts.append(platform_account)
+            results[index] = {"line": line, "status": CREATED, "email": request.email,
+                              "id": account_id, "stripe_account_id": platform_account.stripe_account_id}
+
+        if platform_accounts:
+            try:
+                await asyncio.to_thread(insert_platform_accounts, platform_accounts)
+            except Exception as e:
+                # The Stripe accounts exist; report their IDs so they can be reconciled
+                for result in results:
+                    if result["status"] == CREATED:
+                        result.update(status=FAILED, error=f"Created in Stripe but not stored: {e}", status_code=500)
+
+        for result in results:
+            ACCOUNT_IMPORT_ROWS.inc(result["status"])
+        yield results
@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+from typing import Iterator
+
+
+class AccountLog:
+    """Append-only log of account mutations.
+
+    Each mutation is one compact JSON line, either ``{"op": "put", "account": {...}}``
+    carrying the full record or ``{"op": "del", "id": "..."}``. Lines are flushed to
+    the OS on every append but only fsynced every ``fsync_batch`` records or when
+    ``sync()`` is called, so a burst of writes shares one disk flush.
+
+    Compaction rotates the active log to ``<path>.1`` before the snapshot is
+    rewritten. Replay reads the rotated file first, then the active one; because
+    puts carry full records and deletes are idempotent, replaying entries that
+    already made it into the snapshot gives the same state.
+
+    Several worker processes may share one log. Each tracks how far into the
+    active log it has read or written, so ``changed()`` tells it cheaply that
+    another process appended (pick the new records up with ``read_new()``) or
+    rotated the log (``rotated()``; replay everything). Callers must hold the
+    store's file lock around appends, reads and rotation.
+    """
+
+    def __init__(self, path: str, fsync_batch: int = 64):
+        self._path = path
+        self._rotated_path = f"{path}.1"
+        self._fsync_batch = max(1, fsync_batch)
+        self._lock = threading.Lock()
+        self._file = None
+        self._unsynced = 0
+        self._entries = 0
+        # Inode of the active log we follow and the offset we've read or written up to
+        self._inode = None
+        self._offset = 0
+
+    @property
+    def entries(self) -> int:
+        """Number of records appended since the last rotation."""
+        return self._entries
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self._path, "ab")
+            stat = os.fstat(self._file.fileno())
+            if stat.st_ino != self._inode:
+                self._inode = stat.st_ino
+                self._offset = stat.st_size
+
+    def _active_key(self):
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size
+
+    def changed(self) -> bool:
+        """Whether the active log was appended to or rotated since we last read or wrote it."""
+        key = self._active_key()
+        if key is None:
+            return self._inode is not None
+        return key != (self._inode, self._offset)
+
+    def rotated(self) -> bool:
+        """Whether the active log we were following has been moved aside by another process."""
+        if self._inode is None:
+            return False
+        key = self._active_key()
+        return key is None or key[0] != self._inode
+
+    def append(self, entry: dict):
+        """Append one mutation record."""
+        line = json.dumps(entry, separators=(",", ":")).encode() + b"\n"
+        with self._lock:
+            self._open()
+            self._file.write(line)
+            self._file.flush()
+            self._offset += len(line)
+            self._entries += 1
+            self._unsynced += 1
+            if self._unsynced >= self._fsync_batch:
+                self._sync_locked()
+
+    def sync(self):
+        """Force any appended records to stable storage."""
+        with self._lock:
+            self._sync_locked()
+
+    def _sync_locked(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def replay(self) -> Iterator[dict]:
+        """Yield every record from the rotated and active logs, in order."""
+        with self._lock:
+            # Drop a handle left on a log another process has rotated away
+            self._sync_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        self._entries = 0
+        self._inode = None
+        self._offset = 0
+        for path in (self._rotated_path, self._path):
+            yield from self._read(path)
+
+    def read_new(self) -> Iterator[dict]:
+        """Yield the records other processes appended to the active log since we last looked."""
+        yield from self._read(self._path, self._offset if self._inode is not None else 0)
+
+    def _read(self, path: str, start: int = 0) -> Iterator[dict]:
+        if not os.path.exists(path):
+            return
+
+        good_offset = start
+        torn = False
+        with open(path, "rb") as f:
+            if path == self._path:
+                self._inode = os.fstat(f.fileno()).st_ino
+                self._offset = start
+            f.seek(start)
+            for line in f:
+                try:
+                    entry = json.loads(line) if line.endswith(b"\n") else None
+                except ValueError:
+                    entry = None
+                if entry is None:
+                    # A crash mid-append leaves a partial last line; stop there
+                    torn = True
+                    break
+                good_offset += len(line)
+                if path == self._path:
+                    self._entries += 1
+                    self._offset = good_offset
+                yield entry
+
+        if torn and path == self._path:
+            with open(path, "r+b") as f:
+                f.truncate(good_offset)
+
+    def rotate(self):
+        """Move the active log aside so a snapshot can absorb it."""
+        with self._lock:
+            self._sync_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if not os.path.exists(self._path):
+                pass
+            elif os.path.exists(self._rotated_path):
+                # A previous compaction never finished; keep its records ahead of ours
+                with open(self._rotated_path, "ab") as dst, open(self._path, "rb") as src:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self._path)
+            else:
+                os.replace(self._path, self._rotated_path)
+            self._entries = 0
+            self._inode = None
+            self._offset = 0
+
+    def discard_rotated(self):
+        """Remove the rotated log once its records are in the snapshot."""
+        if os.path.exists(self._rotated_path):
+            os.remove(self._rotated_path)
+
+    def close(self):
+        with self._lock:
+            self._sync_locked()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,75 @@
+import asyncio
+import os
+from typing import Dict
+
+import stripe
+
+from services.cache import TTLCache
+
+# Everything any router reads from a v2 account, so one snapshot serves them all.
+SNAPSHOT_INCLUDE = [
+    "configuration.customer",
+    "configuration.merchant",
+    "configuration.recipient",
+    "identity",
+    "requirements",
+    "defaults",
+]
+
+# Stripe account ID -> v2 Account. Webhooks keep entries fresh; the TTL is a safety net.
+_cache: TTLCache = TTLCache(
+    maxsize=int(os.getenv("ACCOUNT_SNAPSHOT_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("ACCOUNT_SNAPSHOT_TTL", "300")),
+)
+
+# Fetches in progress, so concurrent misses for one account share a single request.
+_inflight: Dict[str, "asyncio.Future"] = {}
+
+
+async def get_account_snapshot(stripe_client: stripe.StripeClient, stripe_account_id: str):
+    """Return the v2 account, from the local cache when possible."""
+    snapshot = _cache.get(stripe_account_id)
+    if snapshot is not None:
+        return snapshot
+    return await refresh_account_snapshot(stripe_client, stripe_account_id)
+
+
+def get_cached_account_snapshot(stripe_account_id: str):
+    """Return the cached v2 account without fetching, or None."""
+    return _cache.get(stripe_account_id)
+
+
+async def refresh_account_snapshot(stripe_client: stripe.StripeClient, stripe_account_id: str):
+    """Fetch the v2 account from Stripe and cache it."""
+    pending = _inflight.get(stripe_account_id)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[stripe_account_id] = future
+    try:
+        snapshot = await stripe_client.v2.core.accounts.retrieve_async(
+            stripe_account_id,
+            {"include": SNAPSHOT_INCLUDE},
+        )
+    except BaseException as e:
+        future.set_exception(e)
+        # Mark retrieved so the loop doesn't warn when nobody else was waiting
+        future.exception()
+        raise
+    else:
+        future.set_result(snapshot)
+        # An invalidation during the fetch removes us from _inflight; don't cache stale data then
+        if _inflight.get(stripe_account_id) is future:
+            _cache.set(stripe_account_id, snapshot)
+        return snapshot
+    finally:
+        if _inflight.get(stripe_account_id) is future:
+            del _inflight[stripe_account_id]
+
+
+def invalidate_account_snapshot(stripe_account_id: str):
+    """Drop the cached account, e.g. after an update or an account webhook."""
+    _cache.invalidate(stripe_account_id)
+    _inflight.pop(stripe_account_id, None)
+
@@ -0,0 +1,85 @@
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+class AccountStorage(ABC):
+    """Storage engine behind the platform account functions in services.database.
+
+    Records are plain dicts with the ``PlatformAccount`` fields. Implementations
+    must return copies so callers cannot mutate stored state.
+    """
+
+    # --- Reads ---
+
+    @abstractmethod
+    def get(self, account_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def get_by_stripe_id(self, stripe_account_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def get_by_email(self, email: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def list(self) -> List[dict]:
+        ...
+
+    @abstractmethod
+    def list_page(self, limit: int, starting_after: Optional[str] = None) -> Tuple[List[dict], bool]:
+        """Return up to ``limit`` records in insertion order after the ``starting_after`` id.
+
+        The second value says whether more records follow the page. Raises
+        ValueError when ``starting_after`` is not a stored id.
+        """
+
+    @abstractmethod
+    def iter_batches(self, batch_size: int) -> Iterator[List[dict]]:
+        """Yield every record in insertion order, ``batch_size`` at a time.
+
+        Unlike paging with ``list_page``, iteration keeps its place even if the
+        last record it returned is deleted in the meantime.
+        """
+
+    # --- Writes ---
+
+    @abstractmethod
+    def insert(self, record: dict):
+        ...
+
+    def insert_many(self, records: Iterable[dict]):
+        """Insert several records. Backends override this to commit them together."""
+        for record in records:
+            self.insert(record)
+
+    @abstractmethod
+    def update(self, account_id: str, updates: dict) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def delete(self, account_id: str) -> bool:
+        ...
+
+    # --- Lifecycle / maintenance ---
+
+    def load(self):
+        """Prepare the backend for use. Called lazily by backends that need it."""
+
+    @property
+    def uses_log(self) -> bool:
+        """Whether the backend has a log that run_store_maintenance() should sync and compact."""
+        return False
+
+    def sync(self):
+        pass
+
+    def needs_compaction(self, threshold: int) -> bool:
+        return False
+
+    def compact(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,348 @@
+import bisect
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from services.account_log import AccountLog
+from services.account_storage import AccountStorage
+from services.file_lock import FileLock
+
+
+def _file_key(path: str) -> Optional[Tuple[int, int, int]]:
+    """Identity and version of a file, to tell whether it has been replaced or rewritten."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class JsonAccountStore(AccountStorage):
+    """Resident copy of the accounts file with hash indexes on the lookup keys.
+
+    The file is parsed once on first use. Reads are served from memory, and
+    every mutation updates the indexes before being made durable in one of two
+    ways:
+
+    - without a log, the whole snapshot file is rewritten (the original behaviour)
+    - with an ``AccountLog``, the mutation is appended to the log and the snapshot
+      is only rewritten by ``compact()``
+
+    Several worker processes can share the files. Mutations hold an exclusive
+    ``flock`` on ``<path>.lock`` and first catch up with what other processes
+    wrote; the snapshot is only ever replaced by renaming a complete temporary
+    file over it. Reads stat the snapshot (and log) and, if another process
+    changed them, reload the snapshot or read the new log records under a
+    shared lock before answering.
+    """
+
+    def __init__(self, path: str, log: Optional[AccountLog] = None):
+        self._path = path
+        self._log = log
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._file_lock = FileLock(f"{path}.lock")
+        self._compact_file_lock = FileLock(f"{path}.compact.lock")
+        self._snapshot_key = None
+        self._loaded = False
+        self._accounts: Dict[str, dict] = {}
+        self._by_stripe_id: Dict[str, str] = {}
+        self._by_email: Dict[str, List[str]] = {}
+        # Ordered index for cursor pagination: insertion sequence numbers and
+        # the ids they belong to, kept sorted in parallel lists.
+        self._next_seq = 0
+        self._seq_by_id: Dict[str, int] = {}
+        self._order_seqs: List[int] = []
+        self._order_ids: List[str] = []
+
+    # --- Loading / persistence ---
+
+    def load(self):
+        """Parse the accounts file and rebuild the indexes."""
+        with self._lock, self._file_lock.shared():
+            self._load_locked()
+
+    def _load_locked(self):
+        self._ensure_file()
+        with open(self._path, "r") as f:
+            self._snapshot_key = _file_key(self._path)
+            data = json.load(f)
+
+        self._accounts = {}
+        self._by_stripe_id = {}
+        self._by_email = {}
+        self._next_seq = 0
+        self._seq_by_id = {}
+        self._order_seqs = []
+        self._order_ids = []
+        for record in data.get("accounts", []):
+            self._index(record)
+        if self._log is not None:
+            for entry in self._log.replay():
+                self._apply(entry)
+        self._loaded = True
+
+    def _refresh(self):
+        """Catch up with other processes' writes before a read. Caller holds ``_lock``."""
+        if (
+            self._loaded
+            and _file_key(self._path) == self._snapshot_key
+            and (self._log is None or not self._log.changed())
+        ):
+            return
+        with self._file_lock.shared():
+            self._refresh_locked()
+
+    def _refresh_locked(self):
+        """Catch up with other processes' writes. Caller holds ``_lock`` and the file lock."""
+        if (
+            not self._loaded
+            or _file_key(self._path) != self._snapshot_key
+            or (self._log is not None and self._log.rotated())
+        ):
+            self._load_locked()
+        elif self._log is not None:
+            for entry in self._log.read_new():
+                self._apply(entry)
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        """Hold the store for a mutation, up to date with every other process."""
+        with self._lock, self._file_lock.exclusive():
+            self._refresh_locked()
+            yield
+
+    def _ensure_file(self):
+        db_dir = os.path.dirname(self._path)
+        if not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        if not os.path.exists(self._path):
+            # Link rather than create so a concurrently starting worker can't see a half-written file
+            tmp_path = f"{self._path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"accounts": []}, f)
+            try:
+                os.link(tmp_path, self._path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp_path)
+
+    def _persist(self):
+        tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"accounts": list(self._accounts.values())}, f, indent=2)
+        os.replace(tmp_path, self._path)
+        self._snapshot_key = _file_key(self._path)
+
+    def _commit(self, entry: dict):
+        """Make a mutation that has already been applied in memory durable."""
+        if self._log is not None:
+            self._log.append(entry)
+        else:
+            self._persist()
+
+    def _apply(self, entry: dict):
+        """Apply a log record to the in-memory state."""
+        if entry["op"] == "put":
+            record = entry["account"]
+            current = self._accounts.get(record["id"])
+            if current is None:
+                self._index(record)
+            else:
+                self._unindex_keys(current)
+                self._accounts[record["id"]] = record
+                self._index_keys(record)
+        elif entry["op"] == "del":
+            current = self._accounts.get(entry["id"])
+            if current is not None:
+                self._unindex(current)
+
+    def sync(self):
+        """Flush batched log appends to stable storage."""
+        if self._log is not None:
+            self._log.sync()
+
+    @property
+    def uses_log(self) -> bool:
+        return self._log is not None
+
+    def needs_compaction(self, threshold: int) -> bool:
+        return self._log is not None and self._log.entries >= threshold
+
+    def compact(self):
+        """Fold the log into a fresh snapshot.
+
+        The log is rotated and the records are copied under the store lock, then
+        the snapshot is written to a temporary file outside it, so writers are
+        only blocked for the copy and the final rename. Only one process
+        compacts at a time; the others skip their turn.
+        """
+        if self._log is None:
+            return
+
+        with self._compact_lock:
+            if not self._compact_file_lock.acquire(blocking=False):
+                return
+            try:
+                with self._writing():
+                    self._log.rotate()
+                    records = list(self._accounts.values())
+
+                tmp_path = f"{self._path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump({"accounts": records}, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                # Rename and drop the rotated log together, so a reload sees both or neither
+                with self._lock, self._file_lock.exclusive():
+                    os.replace(tmp_path, self._path)
+                    self._log.discard_rotated()
+                    self._snapshot_key = _file_key(self._path)
+            finally:
+                self._compact_file_lock.release()
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+        self._file_lock.close()
+        self._compact_file_lock.close()
+
+    # --- Index maintenance ---
+
+    def _index(self, record: dict):
+        self._accounts[record["id"]] = record
+        self._index_keys(record)
+
+        seq = self._next_seq
+        self._next_seq += 1
+        self._seq_by_id[record["id"]] = seq
+        self._order_seqs.append(seq)
+        self._order_ids.append(record["id"])
+
+    def _unindex(self, record: dict):
+        self._accounts.pop(record["id"], None)
+        self._unindex_keys(record)
+
+        seq = self._seq_by_id.pop(record["id"], None)
+        if seq is not None:
+            position = bisect.bisect_left(self._order_seqs, seq)
+            del self._order_seqs[position]
+            del self._order_ids[position]
+
+    def _index_keys(self, record: dict):
+        if record.get("stripe_account_id"):
+            self._by_stripe_id[record["stripe_account_id"]] = record["id"]
+        if record.get("email"):
+            self._by_email.setdefault(record["email"], []).append(record["id"])
+
+    def _unindex_keys(self, record: dict):
+        if self._by_stripe_id.get(record.get("stripe_account_id")) == record["id"]:
+            del self._by_stripe_id[record["stripe_account_id"]]
+        ids = self._by_email.get(record.get("email"))
+        if ids and record["id"] in ids:
+            ids.remove(record["id"])
+            if not ids:
+                del self._by_email[record["email"]]
+
+    # --- Reads ---
+
+    def get(self, account_id: str) -> Optional[dict]:
+        with self._lock:
+            self._refresh()
+            record = self._accounts.get(account_id)
+            return dict(record) if record else None
+
+    def get_by_stripe_id(self, stripe_account_id: str) -> Optional[dict]:
+        with self._lock:
+            self._refresh()
+            account_id = self._by_stripe_id.get(stripe_account_id)
+            return dict(self._accounts[account_id]) if account_id else None
+
+    def get_by_email(self, email: str) -> Optional[dict]:
+        with self._lock:
+            self._refresh()
+            ids = self._by_email.get(email)
+            return dict(self._accounts[ids[0]]) if ids else None
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            self._refresh()
+            return [dict(record) for record in self._accounts.values()]
+
+    def list_page(self, limit: int, starting_after: Optional[str] = None) -> Tuple[List[dict], bool]:
+        with self._lock:
+            self._refresh()
+            start = 0
+            if starting_after is not None:
+                seq = self._seq_by_id.get(starting_after)
+                if seq is None:
+                    raise ValueError(f"Unknown cursor: {starting_after}")
+                start = bisect.bisect_right(self._order_seqs, seq)
+
+            ids = self._order_ids[start:start + limit + 1]
+            page = [dict(self._accounts[account_id]) for account_id in ids[:limit]]
+            return page, len(ids) > limit
+
+    def iter_batches(self, batch_size: int) -> Iterator[List[dict]]:
+        last_seq = -1
+        while True:
+            # Only hold the lock while copying one batch, not while the caller consumes it
+            with self._lock:
+                self._refresh()
+                start = bisect.bisect_right(self._order_seqs, last_seq)
+                ids = self._order_ids[start:start + batch_size]
+                if not ids:
+                    return
+                batch = [dict(self._accounts[account_id]) for account_id in ids]
+                last_seq = self._order_seqs[start + len(ids) - 1]
+            yield batch
+
+    # --- Writes ---
+
+    def insert(self, record: dict):
+        with self._writing():
+            record = dict(record)
+            self._index(record)
+            self._commit({"op": "put", "account": record})
+
+    def insert_many(self, records: Iterable[dict]):
+        with self._writing():
+            entries = []
+            for record in records:
+                record = dict(record)
+                self._index(record)
+                entries.append({"op": "put", "account": record})
+
+            if self._log is not None:
+                for entry in entries:
+                    self._log.append(entry)
+            elif entries:
+                self._persist()
+
+    def update(self, account_id: str, updates: dict) -> Optional[dict]:
+        with self._writing():
+            current = self._accounts.get(account_id)
+            if current is None:
+                return None
+
+            # Replace in place so the record keeps its position in the list
+            updated = {**current, **updates}
+            self._unindex_keys(current)
+            self._accounts[account_id] = updated
+            self._index_keys(updated)
+            self._commit({"op": "put", "account": updated})
+            return dict(updated)
+
+    def delete(self, account_id: str) -> bool:
+        with self._writing():
+            current = self._accounts.get(account_id)
+            if current is None:
+                return False
+
+            self._unindex(current)
+            self._commit({"op": "del", "id": account_id})
+            return True
@@ -0,0 +1,208 @@
+import time
+import stripe
+from typing import AsyncIterator, Optional
+
+from services.external_account_lists import (
+    cache_external_accounts,
+    external_accounts_generation,
+    get_cached_external_accounts,
+    invalidate_external_accounts,
+)
+from services.metrics import instrument_methods
+
+
+@instrument_methods
+class AsyncStripeService:
+    """The Stripe API calls the request handlers make.
+
+    Every call goes through the SDK's ``*_async`` methods on the shared httpx
+    pool, so awaiting Stripe never blocks the event loop. Get one through
+    ``dependencies.get_async_stripe_service``.
+    """
+
+    def __init__(self, client: stripe.StripeClient):
+        self._client = client
+
+    # --- Connected Accounts ---
+
+    async def create_connected_account(self, email: str, business_name: str, country: str = "US") -> stripe.Account:
+        """Create a Custom connected account with minimal required fields for test mode."""
+
+        return await self._client.v1.accounts.create_async({
+            "type": "custom",
+            "country": country,
+            "email": email,
+            "capabilities": {
+                "card_payments": {"requested": True},
+                "transfers": {"requested": True},
+            },
+            "business_type": "individual",
+            "business_profile": {
+                "name": business_name,
+                "mcc": "5734",  # Computer Software Stores
+                "url": "https://example.com",
+            },
+            "individual": {
+                "first_name": "Test",
+                "last_name": "User",
+                "email": email,
+                "dob": {"day": 1, "month": 1, "year": 1990},
+                "address": {
+                    "line1": "123 Test St",
+                    "city": "San Francisco",
+                    "state": "CA",
+                    "postal_code": "94111",
+                    "country": "US",
+                },
+                "ssn_last_4": "0000",  # Test mode only
+            },
+            "tos_acceptance": {
+                "date": int(time.time()),
+                "ip": "127.0.0.1",
+            },
+        })
+
+    async def list_connected_accounts(self, limit: int = 100) -> list:
+        """List all connected accounts."""
+        accounts = await self._client.v1.accounts.list_async({"limit": limit})
+        return accounts.data
+
+    async def get_account(self, account_id: str) -> stripe.Account:
+        """Get a specific connected account."""
+        return await self._client.v1.accounts.retrieve_async(account_id)
+
+    async def delete_account(self, account_id: str) -> stripe.Account:
+        """Delete a connected account."""
+        return await self._client.v1.accounts.delete_async(account_id)
+
+    # --- Payment Methods (SetupIntents) ---
+
+    async def get_or_create_customer(self, account_id: str, email: str = None) -> stripe.Customer:
+        """Get or create a Stripe Customer for the given account_id."""
+
+        # Search for existing customer with this account_id in metadata
+        customers = await self._client.v1.customers.search_async({
+            "query": f"metadata['account_id']:'{account_id}'"
+        })
+
+        if customers.data:
+            return customers.data[0]
+
+        # Create new customer
+        params = {"metadata": {"account_id": account_id}}
+        if email:
+            params["email"] = email
+        return await self._client.v1.customers.create_async(params)
+
+    async def create_setup_intent(self, account_id: str, email: str = None) -> stripe.SetupIntent:
+        """Create a SetupIntent for collecting a payment method at the platform level."""
+
+        # Get or create a customer for this account
+        customer = await self.get_or_create_customer(account_id, email)
+
+        return await self._client.v1.setup_intents.create_async({
+            "customer": customer.id,
+            "usage": "off_session",
+            "payment_method_types": ["card"],
+            "metadata": {"account_id": account_id},
+        })
+
+    async def list_payment_methods(self, account_id: str, customer_id: Optional[str] = None) -> list:
+        """List payment methods for an account via its associated Customer.
+
+        Only returns payment methods attached to a Customer (usable for payments).
+        Legacy unattached payment methods are not returned as they can't be reused.
+        """
+
+        # Find the customer for this account
+        customers = await self._client.v1.customers.search_async({
+            "query": f"metadata['account_id']:'{account_id}'"
+        })
+
+        if not customers.data:
+            return []
+
+        customer = customers.data[0]
+
+        # Only return payment methods attached to this customer
+        customer_pms = await self._client.v1.payment_methods.list_async({
+            "customer": customer.id,
+            "type": "card",
+        })
+
+        return customer_pms.data
+
+    async def get_customer_id_for_account_with_account_id(self, account_id: str) -> Optional[str]:
+        """Get the Customer ID associated with an account, if any."""
+
+        customers = await self._client.v1.customers.search_async({
+            "query": f"metadata['account_id']:'{account_id}'"
+        })
+
+        if customers.data:
+            return customers.data[0].id
+        return None
+
+    async def get_customer_id_for_account_with_email(self, email: str) -> Optional[str]:
+        """Get the Customer ID associated with an account, if any."""
+
+        customers = await self._client.v1.customers.search_async({
+            "query": f"email:'{email}'"
+        })
+
+        if customers.data:
+            return customers.data[0].id
+        return None
+
+    async def detach_payment_method(self, account_id: str, payment_method_id: str) -> stripe.PaymentMethod:
+        """Detach a payment method (stored at platform level)."""
+        return await self._client.v1.payment_methods.detach_async(payment_method_id)
+
+    # --- External Accounts (Bank Accounts) ---
+
+    async def create_external_account(self, account_id: str, token: str) -> stripe.BankAccount:
+        """Add an external bank account to a connected account using a token."""
+        try:
+            return await self._client.v1.accounts.external_accounts.create_async(
+                account_id,
+                {"external_account": token},
+            )
+        finally:
+            invalidate_external_accounts(account_id)
+
+    async def iter_external_accounts(self, account_id: str) -> AsyncIterator[stripe.BankAccount]:
+        """Yield every external account of a connected account, fetching pages of 100 as needed."""
+        page = await self._client.v1.accounts.external_accounts.list_async(account_id, {"limit": 100})
+        async for external_account in page.auto_paging_iter():
+            yield external_account
+
+    async def list_external_accounts(self, account_id: str) -> list:
+        """List external accounts (bank accounts) for a connected account, from the local cache when possible."""
+        external_accounts = get_cached_external_accounts(account_id)
+        if external_accounts is None:
+            generation = external_accounts_generation()
+            external_accounts = [ea async for ea in self.iter_external_accounts(account_id)]
+            cache_external_accounts(account_id, external_accounts, generation)
+        return external_accounts
+
+    async def delete_external_account(self, account_id: str, external_account_id: str):
+        """Delete an external account from a connected account."""
+        try:
+            return await self._client.v1.accounts.external_accounts.delete_async(
+                account_id,
+                external_account_id,
+            )
+        finally:
+            invalidate_external_accounts(account_id)
+
+    async def set_default_external_account(self, account_id: str, external_account_id: str) -> stripe.BankAccount:
+        """Set an external account as the default for payouts."""
+        try:
+            return await self._client.v1.accounts.external_accounts.update_async(
+                account_id,
+                external_account_id,
+                {"default_for_currency": True},
+            )
+        finally:
+            # Other external accounts in the currency lose their default flag too
+            invalidate_external_accounts(account_id)
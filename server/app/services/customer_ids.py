@@ -0,0 +1,47 @@
+import os
+from typing import Optional
+
+from schemas.account import PlatformAccount
+from services.async_stripe_service import AsyncStripeService
+from services.cache import TTLCache
+from services.database import update_platform_account
+
+# Stripe account ID -> Customer ID
+_cache: TTLCache[str] = TTLCache(
+    maxsize=int(os.getenv("CUSTOMER_ID_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("CUSTOMER_ID_CACHE_TTL", "3600")),
+)
+
+
+async def resolve_customer_id(
+    stripe_service: AsyncStripeService,
+    platform_account: PlatformAccount,
+) -> Optional[str]:
+    """Find the Stripe Customer for a platform account.
+
+    Checks the in-process cache, then the ``stripe_customer_id`` stored on the
+    platform account, and only falls back to Customer.search when neither has
+    it. A search hit is persisted on the platform account so later lookups, in
+    this or any other worker, skip the search. Misses are not cached because
+    search results are eventually consistent.
+    """
+    stripe_account_id = platform_account.stripe_account_id
+
+    customer_id = _cache.get(stripe_account_id)
+    if customer_id:
+        return customer_id
+
+    customer_id = platform_account.stripe_customer_id
+    if not customer_id:
+        customer_id = await stripe_service.get_customer_id_for_account_with_account_id(stripe_account_id)
+        if not customer_id:
+            return None
+        update_platform_account(platform_account.id, stripe_customer_id=customer_id)
+
+    _cache.set(stripe_account_id, customer_id)
+    return customer_id
+
+
+def forget_customer_id(stripe_account_id: str):
+    """Drop a cached Customer ID, e.g. after the customer is deleted."""
+    _cache.invalidate(stripe_account_id)
@@ -1,34 +1,97 @@
-import json
+import asyncio
 import os
+import time
 import uuid
-from typing import Optional, List
+from typing import Iterator, Optional, List, Tuple
 from schemas.account import PlatformAccount
+from services.account_log import AccountLog
+from services.account_storage import AccountStorage
+from services.account_store import JsonAccountStore
+from services.sqlite_store import SqliteAccountStore
 
 DB_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "accounts.json")
-
-
-def _ensure_db_exists():
-    """Ensure the database file and directory exist."""
-    db_dir = os.path.dirname(DB_FILE)
-    if not os.path.exists(db_dir):
-        os.makedirs(db_dir)
-    if not os.path.exists(DB_FILE):
-        with open(DB_FILE, "w") as f:
-            json.dump({"accounts": []}, f)
-
-
-def _read_db() -> dict:
-    """Read the database file."""
-    _ensure_db_exists()
-    with open(DB_FILE, "r") as f:
-        return json.load(f)
-
-
-def _write_db(data: dict):
-    """Write to the database file."""
-    _ensure_db_exists()
-    with open(DB_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+LOG_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "accounts.log")
+SQLITE_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "accounts.db")
+
+# Created once per process on first use.
+_store: Optional[AccountStorage] = None
+
+
+def create_account_store() -> AccountStorage:
+    """Build the storage backend selected by the environment.
+
+    ACCOUNT_DB_BACKEND picks the engine: "json" (default, for development) keeps
+    accounts.json resident in memory, "sqlite" uses accounts.db in WAL mode with
+    ACCOUNT_DB_POOL_SIZE pooled connections.
+
+    For the json backend, ACCOUNT_DB_MODE selects how writes reach disk:
+    "snapshot" (default) rewrites accounts.json on every mutation, "wal" appends
+    to accounts.log and leaves rewriting the snapshot to run_store_maintenance().
+    """
+    backend = os.getenv("ACCOUNT_DB_BACKEND", "json")
+    if backend == "sqlite":
+        return SqliteAccountStore(
+            os.getenv("ACCOUNT_DB_SQLITE_PATH") or SQLITE_FILE,
+            pool_size=int(os.getenv("ACCOUNT_DB_POOL_SIZE", "4")),
+        )
+    if backend != "json":
+        raise ValueError(f"Unknown ACCOUNT_DB_BACKEND: {backend}")
+
+    log = None
+    if os.getenv("ACCOUNT_DB_MODE", "snapshot") == "wal":
+        log = AccountLog(
+            os.getenv("ACCOUNT_DB_LOG_PATH") or LOG_FILE,
+            fsync_batch=int(os.getenv("ACCOUNT_DB_FSYNC_BATCH", "64")),
+        )
+    return JsonAccountStore(os.getenv("ACCOUNT_DB_PATH") or DB_FILE, log=log)
+
+
+def get_account_store() -> AccountStorage:
+    """Return the process-wide account store, creating it on first use."""
+    global _store
+    if _store is None:
+        _store = create_account_store()
+    return _store
+
+
+async def run_store_maintenance():
+    """Background loop that fsyncs batched log appends and compacts the log.
+
+    The log is compacted once it holds ACCOUNT_DB_COMPACT_THRESHOLD records, or
+    every ACCOUNT_DB_COMPACT_INTERVAL seconds if it holds any. Returns straight
+    away for backends without a log.
+    """
+    store = get_account_store()
+    fsync_interval = float(os.getenv("ACCOUNT_DB_FSYNC_INTERVAL", "0.2"))
+    compact_interval = float(os.getenv("ACCOUNT_DB_COMPACT_INTERVAL", "60"))
+    compact_threshold = int(os.getenv("ACCOUNT_DB_COMPACT_THRESHOLD", "10000"))
+
+    if not store.uses_log:
+        return
+
+    last_compaction = time.monotonic()
+    while True:
+        await asyncio.sleep(fsync_interval)
+        await asyncio.to_thread(store.sync)
+
+        interval_elapsed = time.monotonic() - last_compaction >= compact_interval
+        if store.needs_compaction(compact_threshold) or (
+            interval_elapsed and store.needs_compaction(1)
+        ):
+            await asyncio.to_thread(store.compact)
+            last_compaction = time.monotonic()
+        elif interval_elapsed:
+            last_compaction = time.monotonic()
+
+
+def close_account_store():
+    """Compact any outstanding log records and release the store's files."""
+    global _store
+    if _store is not None:
+        if _store.needs_compaction(1):
+            _store.compact()
+        _store.close()
+        _store = None
 
 
 def generate_id() -> str:
@@ -39,73 +102,74 @@ def generate_id() -> str:
 def create_platform_account(
     email: str,
     stripe_account_id: str,
-    stripe_customer_id: str = ""
+    stripe_customer_id: str = "",
+    account_id: Optional[str] = None,
 ) -> PlatformAccount:
-    """Create and store a new platform account."""
-    db = _read_db()
-
+    """Create and store a new platform account, with a new ID unless ``account_id`` is given."""
     account = PlatformAccount(
-        id=generate_id(),
+        id=account_id or generate_id(),
         email=email,
         stripe_account_id=stripe_account_id,
         stripe_customer_id=stripe_customer_id,
     )
 
-    db["accounts"].append(account.model_dump())
-    _write_db(db)
+    get_account_store().insert(account.model_dump())
 
     return account
 
 
-def get_platform_account(account_id: str) -> Optional[PlatformAccount]:
-    """Get a platform account by its ID."""
-    db = _read_db()
+def insert_platform_accounts(accounts: List[PlatformAccount]):
+    """Store several new platform accounts in one write."""
+    get_account_store().insert_many(account.model_dump() for account in accounts)
 
-    for account in db["accounts"]:
-        if account["id"] == account_id:
-            return PlatformAccount(**account)
 
-    return None
+def get_platform_account(account_id: str) -> Optional[PlatformAccount]:
+    """Get a platform account by its ID."""
+    record = get_account_store().get(account_id)
+    return PlatformAccount(**record) if record else None
 
 
 def get_platform_account_by_stripe_id(stripe_account_id: str) -> Optional[PlatformAccount]:
     """Get a platform account by its Stripe account ID."""
-    db = _read_db()
+    record = get_account_store().get_by_stripe_id(stripe_account_id)
+    return PlatformAccount(**record) if record else None
 
-    for account in db["accounts"]:
-        if account["stripe_account_id"] == stripe_account_id:
-            return PlatformAccount(**account)
 
-    return None
+def get_platform_account_by_email(email: str) -> Optional[PlatformAccount]:
+    """Get the first platform account registered with an email."""
+    record = get_account_store().get_by_email(email)
+    return PlatformAccount(**record) if record else None
 
 
 def list_platform_accounts() -> List[PlatformAccount]:
     """List all platform accounts."""
-    db = _read_db()
-    return [PlatformAccount(**account) for account in db["accounts"]]
+    return [PlatformAccount(**record) for record in get_account_store().list()]
 
 
-def update_platform_account(account_id: str, **updates) -> Optional[PlatformAccount]:
-    """Update a platform account."""
-    db = _read_db()
+def list_platform_accounts_page(
+    limit: int,
+    starting_after: Optional[str] = None,
+) -> Tuple[List[PlatformAccount], bool]:
+    """List one page of platform accounts in creation order, plus whether more follow.
 
-    for i, account in enumerate(db["accounts"]):
-        if account["id"] == account_id:
-            db["accounts"][i].update(updates)
-            _write_db(db)
-            return PlatformAccount(**db["accounts"][i])
+    Raises ValueError if ``starting_after`` is not an existing account ID.
+    """
+    records, has_more = get_account_store().list_page(limit, starting_after)
+    return [PlatformAccount(**record) for record in records], has_more
 
-    return None
 
+def iter_platform_account_batches(batch_size: int) -> Iterator[List[PlatformAccount]]:
+    """Iterate over every platform account in creation order, one batch at a time."""
+    for records in get_account_store().iter_batches(batch_size):
+        yield [PlatformAccount(**record) for record in records]
 
-def delete_platform_account(account_id: str) -> bool:
-    """Delete a platform account."""
-    db = _read_db()
 
-    for i, account in enumerate(db["accounts"]):
-        if account["id"] == account_id:
-            db["accounts"].pop(i)
-            _write_db(db)
-            return True
+def update_platform_account(account_id: str, **updates) -> Optional[PlatformAccount]:
+    """Update a platform account."""
+    record = get_account_store().update(account_id, updates)
+    return PlatformAccount(**record) if record else None
+
 
-    return False
+def delete_platform_account(account_id: str) -> bool:
+    """Delete a platform account."""
+    return get_account_store().delete(account_id)
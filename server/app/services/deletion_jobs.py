@@ -0,0 +1,358 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import stripe
+
+from schemas.account import PlatformAccount
+from services.account_snapshots import invalidate_account_snapshot
+from services.customer_ids import forget_customer_id
+from services.database import delete_platform_account
+from services.metrics import ACCOUNT_DELETION_JOBS
+from services.resilience import is_transient_error
+
+logger = logging.getLogger(__name__)
+
+DELETION_JOBS_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "deletion_jobs.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deletion_jobs (
+    id TEXT PRIMARY KEY,
+    account_id TEXT NOT NULL,
+    stripe_account_id TEXT NOT NULL,
+    stripe_customer_id TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL,
+    steps TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    run_after REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_deletion_jobs_ready ON deletion_jobs (status, run_after);
+CREATE INDEX IF NOT EXISTS idx_deletion_jobs_account_id ON deletion_jobs (account_id);
+"""
+
+# Job statuses
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Step statuses
+PENDING = "pending"
+DONE = "done"
+SKIPPED = "skipped"
+
+CLOSE_ACCOUNT = "close_stripe_account"
+DELETE_CUSTOMER = "delete_stripe_customer"
+DELETE_RECORD = "delete_platform_account"
+
+_COLUMNS = (
+    "id, account_id, stripe_account_id, stripe_customer_id, status, steps, "
+    "attempts, last_error, created_at, updated_at, run_after"
+)
+
+
+def _row_to_job(row) -> dict:
+    job = dict(zip([name.strip() for name in _COLUMNS.split(",")], row))
+    job["steps"] = json.loads(job["steps"])
+    return job
+
+
+def job_summary(job: dict) -> dict:
+    """The public view of a job, as returned by the API."""
+    return {
+        "job_id": job["id"],
+        "account_id": job["account_id"],
+        "status": job["status"],
+        "steps": job["steps"],
+        "attempts": job["attempts"],
+        "last_error": job["last_error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+class DeletionJobStore:
+    """Durable queue of account deletion jobs in SQLite, shared by every worker.
+
+    A job is claimed by setting it to running with ``run_after`` as the lease
+    expiry; a job whose worker died is picked up again once its lease runs
+    out. Step progress is saved as it happens, so a re-run skips finished
+    steps. Finished jobs are purged after ``ttl`` seconds.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self._path = path
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._last_purge = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            db_dir = os.path.dirname(self._path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+            self._conn = sqlite3.connect(self._path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def enqueue(self, account: PlatformAccount) -> dict:
+        """Queue the deletion of a platform account, or return its unfinished job if it has one."""
+        now = time.time()
+        steps = {
+            CLOSE_ACCOUNT: PENDING,
+            DELETE_CUSTOMER: PENDING if account.stripe_customer_id else SKIPPED,
+            DELETE_RECORD: PENDING,
+        }
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    f"SELECT {_COLUMNS} FROM deletion_jobs WHERE account_id = ? AND status IN (?, ?)",
+                    (account.id, QUEUED, RUNNING),
+                ).fetchone()
+                if row is None:
+                    row = (
+                        f"deljob_{uuid.uuid4().hex[:16]}", account.id, account.stripe_account_id,
+                        account.stripe_customer_id, QUEUED, json.dumps(steps), 0, None, now, now, now,
+                    )
+                    conn.execute(f"INSERT INTO deletion_jobs ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return _row_to_job(row)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connection().execute(
+                f"SELECT {_COLUMNS} FROM deletion_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return _row_to_job(row) if row else None
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs in each status."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT status, COUNT(*) FROM deletion_jobs GROUP BY status"
+            ).fetchall()
+        counts = {QUEUED: 0, RUNNING: 0, SUCCEEDED: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def claim(self, lease: float) -> Optional[dict]:
+        """Take the oldest job that is due, or whose worker's lease has expired."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    f"SELECT {_COLUMNS} FROM deletion_jobs WHERE status IN (?, ?) AND run_after <= ? "
+                    "ORDER BY run_after LIMIT 1",
+                    (QUEUED, RUNNING, now),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE deletion_jobs SET status = ?, run_after = ?, updated_at = ? WHERE id = ?",
+                        (RUNNING, now + lease, now, row[0]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            self._maybe_purge()
+            return None
+        job = _row_to_job(row)
+        job.update(status=RUNNING, run_after=now + lease, updated_at=now)
+        return job
+
+    def save(self, job: dict):
+        """Persist a job's status, step progress and retry schedule."""
+        job["updated_at"] = time.time()
+        with self._lock:
+            self._connection().execute(
+                "UPDATE deletion_jobs SET status = ?, steps = ?, attempts = ?, last_error = ?, "
+                "updated_at = ?, run_after = ? WHERE id = ?",
+                (job["status"], json.dumps(job["steps"]), job["attempts"], job["last_error"],
+                 job["updated_at"], job["run_after"], job["id"]),
+            )
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        with self._lock:
+            self._connection().execute(
+                "DELETE FROM deletion_jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (SUCCEEDED, FAILED, now - self._ttl),
+            )
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _already_gone(error: Exception) -> bool:
+    return isinstance(error, stripe.error.InvalidRequestError) and error.http_status == 404
+
+
+class DeletionWorkerPool:
+    """Asyncio workers that run the deletion jobs of a DeletionJobStore.
+
+    Each job closes the v2 account and deletes the Customer concurrently, and
+    removes the platform account only once both are gone, so a job that fails
+    for good leaves the account in place to be deleted again. Transient
+    failures, and unexpected errors while running a job, are retried with
+    jittered exponential backoff up to ``max_attempts`` times.
+    """
+
+    def __init__(
+        self,
+        store: DeletionJobStore,
+        stripe_client: stripe.StripeClient,
+        workers: int = 4,
+        max_attempts: int = 5,
+        retry_base_delay: float = 5.0,
+        retry_max_delay: float = 300.0,
+        lease: float = 120.0,
+        poll_interval: float = 1.0,
+    ):
+        self.store = store
+        self._stripe = stripe_client
+        self._workers = max(1, workers)
+        self._max_attempts = max_attempts
+        self._retry_base_delay = retry_base_delay
+        self._retry_max_delay = retry_max_delay
+        self._lease = lease
+        self._poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self._workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, account: PlatformAccount) -> dict:
+        job = self.store.enqueue(account)
+        self._wakeup.set()
+        return job
+
+    async def _run(self):
+        while True:
+            job = await asyncio.to_thread(self.store.claim, self._lease)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._process(job)
+            except Exception as e:
+                logger.exception("Deletion job %s crashed", job["id"])
+                await self._fail_attempt(job, f"{type(e).__name__}: {e}", retry=True)
+
+    async def _fail_attempt(self, job: dict, error: str, retry: bool):
+        """Count a failed attempt and requeue the job with backoff, or fail it for good."""
+        job["attempts"] += 1
+        job["last_error"] = error
+        if retry and job["attempts"] < self._max_attempts:
+            delay = random.uniform(0, min(self._retry_max_delay, self._retry_base_delay * 2 ** (job["attempts"] - 1)))
+            job["status"] = QUEUED
+            job["run_after"] = time.time() + delay
+        else:
+            job["status"] = FAILED
+            ACCOUNT_DELETION_JOBS.inc(FAILED)
+        try:
+            await asyncio.to_thread(self.store.save, job)
+        except Exception:
+            # Left running; the job is claimed again once its lease expires
+            logger.exception("Could not save deletion job %s", job["id"])
+
+    async def _close_account(self, job: dict):
+        try:
+            # v2 accounts are closed rather than deleted
+            await self._stripe.v2.core.accounts.close_async(job["stripe_account_id"])
+        except stripe.error.StripeError as e:
+            if not _already_gone(e):
+                raise
+        invalidate_account_snapshot(job["stripe_account_id"])
+
+    async def _delete_customer(self, job: dict):
+        try:
+            await self._stripe.v1.customers.delete_async(job["stripe_customer_id"])
+        except stripe.error.StripeError as e:
+            if not _already_gone(e):
+                raise
+        forget_customer_id(job["stripe_account_id"])
+
+    async def _process(self, job: dict):
+        steps = job["steps"]
+        runners = {CLOSE_ACCOUNT: self._close_account, DELETE_CUSTOMER: self._delete_customer}
+        pending = [name for name in runners if steps[name] == PENDING]
+        results = await asyncio.gather(*(runners[name](job) for name in pending), return_exceptions=True)
+
+        errors = {}
+        for name, result in zip(pending, results):
+            if isinstance(result, Exception):
+                errors[name] = result
+            else:
+                steps[name] = DONE
+
+        if errors:
+            await self._fail_attempt(
+                job,
+                "; ".join(f"{name}: {error}" for name, error in errors.items()),
+                retry=all(is_transient_error(e) for e in errors.values()),
+            )
+            return
+
+        if steps[DELETE_RECORD] == PENDING:
+            await asyncio.to_thread(delete_platform_account, job["account_id"])
+            steps[DELETE_RECORD] = DONE
+        job["status"] = SUCCEEDED
+        job["last_error"] = None
+        await asyncio.to_thread(self.store.save, job)
+        ACCOUNT_DELETION_JOBS.inc(SUCCEEDED)
+
+
+def create_deletion_worker_pool(stripe_client: stripe.StripeClient) -> DeletionWorkerPool:
+    """Build the deletion job store and worker pool from the environment."""
+    store = DeletionJobStore(
+        os.getenv("DELETION_JOBS_DB_PATH") or DELETION_JOBS_FILE,
+        ttl=float(os.getenv("DELETION_JOB_TTL", "604800")),
+    )
+    return DeletionWorkerPool(
+        store,
+        stripe_client,
+        workers=int(os.getenv("DELETION_WORKERS", "4")),
+        max_attempts=int(os.getenv("DELETION_MAX_ATTEMPTS", "5")),
+        retry_base_delay=float(os.getenv("DELETION_RETRY_BASE_DELAY", "5")),
+        retry_max_delay=float(os.getenv("DELETION_RETRY_MAX_DELAY", "300")),
+        lease=float(os.getenv("DELETION_JOB_LEASE", "120")),
+        poll_interval=float(os.getenv("DELETION_POLL_INTERVAL", "1")),
+    )
@@ -0,0 +1,40 @@
+import os
+import threading
+from typing import List, Optional
+
+from services.cache import TTLCache
+
+# Stripe account ID -> every external account (bank accounts and cards) of that connected account
+_cache: TTLCache[list] = TTLCache(
+    maxsize=int(os.getenv("EXTERNAL_ACCOUNT_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("EXTERNAL_ACCOUNT_CACHE_TTL", "300")),
+)
+
+# Bumped by every invalidation, so a listing that raced with a change isn't cached
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def get_cached_external_accounts(stripe_account_id: str) -> Optional[list]:
+    """Return the cached external accounts of a connected account, or None if not cached."""
+    return _cache.get(stripe_account_id)
+
+
+def external_accounts_generation() -> int:
+    """Take before listing from Stripe and pass to cache_external_accounts."""
+    return _generation
+
+
+def cache_external_accounts(stripe_account_id: str, external_accounts: List, generation: int):
+    """Cache a full listing, unless any external accounts changed since ``generation`` was taken."""
+    with _generation_lock:
+        if generation == _generation:
+            _cache.set(stripe_account_id, external_accounts)
+
+
+def invalidate_external_accounts(stripe_account_id: str):
+    """Drop a connected account's cached listing after one of its external accounts changed."""
+    global _generation
+    with _generation_lock:
+        _generation += 1
+        _cache.invalidate(stripe_account_id)
@@ -0,0 +1,539 @@
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import httpx
+
+# Payment method IDs that behave like Stripe's test cards
+DECLINED_PAYMENT_METHODS = {"pm_card_chargeDeclined", "pm_card_visa_chargeDeclined"}
+
+
+class FakeStripeError(Exception):
+    def __init__(self, status_code: int, error_type: str, message: str, code: Optional[str] = None, param: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = {"error": {"type": error_type, "message": message}}
+        if code:
+            self.body["error"]["code"] = code
+        if param:
+            self.body["error"]["param"] = param
+
+
+def _not_found(kind: str, object_id: str) -> FakeStripeError:
+    return FakeStripeError(404, "invalid_request_error", f"No such {kind}: '{object_id}'", code="resource_missing", param="id")
+
+
+def _new_id(prefix: str) -> str:
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def _decode_form(body: str) -> dict:
+    """Decode Stripe's v1 form encoding (``a[b][0]=x``) into nested dicts and lists."""
+    result: dict = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        parts = re.findall(r"[^\[\]]+", key)
+        target: Any = result
+        for part, next_part in zip(parts, parts[1:]):
+            container: Any = [] if next_part.isdigit() else {}
+            if isinstance(target, list):
+                if int(part) >= len(target):
+                    target.append(container)
+                target = target[int(part)]
+            else:
+                target = target.setdefault(part, container)
+        last = parts[-1]
+        if isinstance(target, list):
+            target.append(value)
+        else:
+            target[last] = value
+    return result
+
+
+def _as_bool(value: Any) -> bool:
+    return value is True or value == "true"
+
+
+def _merge(target: dict, updates: dict):
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
+
+
+def _list_object(url: str, data: List[dict]) -> dict:
+    return {"object": "list", "url": url, "has_more": False, "data": data}
+
+
+class FakeStripe:
+    """In-memory stand-in for the parts of the Stripe API this project calls.
+
+    Objects live only as long as the instance. Latency is added to every call
+    (``latency`` seconds plus up to ``jitter``), and ``error_rate`` of calls
+    fail with ``error_status`` before touching any state, the way a Stripe
+    outage would. Unknown ``pm_`` IDs are treated as fresh test cards, and
+    ``pm_card_chargeDeclined`` is declined when charged. Accounts created with
+    a customer configuration get a v1 Customer tagged with their account ID,
+    so the payment method and transaction routes work against new accounts.
+
+    With ``auto_accounts``, an unknown ``acct_`` ID (in a path, a transfer
+    destination or a customer search) is created on first use as a customer
+    account, so a pre-seeded account store can be served without creating
+    every account through the API first.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        seed: Optional[int] = None,
+        auto_accounts: bool = False,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.auto_accounts = auto_accounts
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.accounts: Dict[str, dict] = {}
+        self.customers: Dict[str, dict] = {}
+        self.payment_methods: Dict[str, dict] = {}
+        self.setup_intents: Dict[str, dict] = {}
+        self.payment_intents: Dict[str, dict] = {}
+        self.external_accounts: Dict[str, Dict[str, dict]] = {}
+        self._idempotent_responses: Dict[str, Tuple[int, bytes]] = {}
+
+        self._routes: List[Tuple[str, "re.Pattern", Callable]] = [
+            ("POST", re.compile(r"^/v2/core/accounts$"), self._create_v2_account),
+            ("GET", re.compile(r"^/v2/core/accounts/([^/]+)$"), self._retrieve_v2_account),
+            ("POST", re.compile(r"^/v2/core/accounts/([^/]+)/close$"), self._close_v2_account),
+            ("POST", re.compile(r"^/v2/core/accounts/([^/]+)$"), self._update_v2_account),
+            ("POST", re.compile(r"^/v2/core/account_links$"), self._create_account_link),
+            ("POST", re.compile(r"^/v1/accounts$"), self._create_v1_account),
+            ("GET", re.compile(r"^/v1/accounts$"), self._list_v1_accounts),
+            ("GET", re.compile(r"^/v1/accounts/([^/]+)$"), self._retrieve_v1_account),
+            ("DELETE", re.compile(r"^/v1/accounts/([^/]+)$"), self._delete_v1_account),
+            ("POST", re.compile(r"^/v1/accounts/([^/]+)/external_accounts$"), self._create_external_account),
+            ("GET", re.compile(r"^/v1/accounts/([^/]+)/external_accounts$"), self._list_external_accounts),
+            ("POST", re.compile(r"^/v1/accounts/([^/]+)/external_accounts/([^/]+)$"), self._update_external_account),
+            ("DELETE", re.compile(r"^/v1/accounts/([^/]+)/external_accounts/([^/]+)$"), self._delete_external_account),
+            ("POST", re.compile(r"^/v1/customers$"), self._create_customer),
+            ("GET", re.compile(r"^/v1/customers/search$"), self._search_customers),
+            ("DELETE", re.compile(r"^/v1/customers/([^/]+)$"), self._delete_customer),
+            ("GET", re.compile(r"^/v1/customers/([^/]+)/payment_methods$"), self._list_customer_payment_methods),
+            ("POST", re.compile(r"^/v1/setup_intents$"), self._create_setup_intent),
+            ("GET", re.compile(r"^/v1/payment_methods$"), self._list_payment_methods),
+            ("GET", re.compile(r"^/v1/payment_methods/([^/]+)$"), self._retrieve_payment_method),
+            ("POST", re.compile(r"^/v1/payment_methods/([^/]+)/attach$"), self._attach_payment_method),
+            ("POST", re.compile(r"^/v1/payment_methods/([^/]+)/detach$"), self._detach_payment_method),
+            ("POST", re.compile(r"^/v1/payment_intents$"), self._create_payment_intent),
+        ]
+
+    # --- Transport entry points ---
+
+    def delay(self) -> float:
+        if not self.latency and not self.jitter:
+            return 0.0
+        return self.latency + self._random.random() * self.jitter
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        status_code, content = self._dispatch(request)
+        return httpx.Response(
+            status_code,
+            content=content,
+            headers={"content-type": "application/json", "request-id": _new_id("req")},
+        )
+
+    def _dispatch(self, request: httpx.Request) -> Tuple[int, bytes]:
+        if self.error_rate and self._random.random() < self.error_rate:
+            body = {"error": {"type": "api_error", "message": "Injected fault from the fake Stripe backend"}}
+            return self.error_status, json.dumps(body).encode()
+
+        path = request.url.path
+        if path.startswith("/v2/"):
+            params = json.loads(request.content) if request.content else {}
+        elif request.method == "GET" or request.method == "DELETE":
+            params = _decode_form(request.url.query.decode("utf-8"))
+        else:
+            params = _decode_form(request.content.decode("utf-8"))
+
+        for method, pattern, handler in self._routes:
+            match = pattern.match(path)
+            if method == request.method and match:
+                break
+        else:
+            body = {"error": {"type": "invalid_request_error", "message": f"Unrecognized request URL ({request.method}: {path})"}}
+            return 404, json.dumps(body).encode()
+
+        idempotency_key = request.headers.get("idempotency-key")
+        with self._lock:
+            if idempotency_key and idempotency_key in self._idempotent_responses:
+                return self._idempotent_responses[idempotency_key]
+            # Serialize while holding the lock so the response is a consistent snapshot
+            try:
+                result = (200, json.dumps(handler(params, *match.groups())).encode())
+            except FakeStripeError as e:
+                result = (e.status_code, json.dumps(e.body).encode())
+            if idempotency_key and request.method == "POST":
+                self._idempotent_responses[idempotency_key] = result
+        return result
+
+    # --- v2 accounts ---
+
+    def _v2_account(self, account_id: str) -> dict:
+        account = self.accounts.get(account_id)
+        if account is None:
+            if not (self.auto_accounts and account_id.startswith("acct_")):
+                raise _not_found("account", account_id)
+            account = self._create_v2_account(
+                {"configuration": {"customer": {"capabilities": {"automatic_indirect_tax": {"requested": True}}}}},
+                account_id=account_id,
+            )
+        return account
+
+    def _apply_configuration(self, account: dict, configuration: dict):
+        for name, config in configuration.items():
+            current = account["configuration"].get(name) or {"capabilities": {}}
+            for capability, settings in (config.get("capabilities") or {}).items():
+                # Customer capabilities are granted immediately; the rest wait for onboarding
+                status = "active" if name == "customer" else "restricted"
+                if isinstance(settings, dict) and "requested" not in settings:
+                    current["capabilities"][capability] = {
+                        sub: {"requested": _as_bool(value.get("requested")), "status": status}
+                        for sub, value in settings.items()
+                    }
+                else:
+                    current["capabilities"][capability] = {"requested": True, "status": status}
+            account["configuration"][name] = current
+            if name not in account["applied_configurations"]:
+                account["applied_configurations"].append(name)
+
+    def _create_v2_account(self, params: dict, account_id: Optional[str] = None) -> dict:
+        account = {
+            "id": account_id or _new_id("acct"),
+            "object": "v2.core.account",
+            "applied_configurations": [],
+            "closed": False,
+            "configuration": {"customer": None, "merchant": None, "recipient": None},
+            "contact_email": params.get("contact_email"),
+            "created": _now_iso(),
+            "dashboard": params.get("dashboard", "none"),
+            "defaults": params.get("defaults"),
+            "display_name": params.get("display_name"),
+            "identity": params.get("identity"),
+            "livemode": False,
+            "metadata": params.get("metadata") or {},
+            "requirements": {"entries": [], "summary": {"minimum_deadline": None}},
+        }
+        self._apply_configuration(account, params.get("configuration") or {})
+        self.accounts[account["id"]] = account
+        self.external_accounts[account["id"]] = {}
+        if "customer" in account["applied_configurations"]:
+            # Give customer accounts the v1 Customer that resolve_customer_id() searches for
+            self._create_customer({"email": account["contact_email"], "metadata": {"account_id": account["id"]}})
+        return account
+
+    def _retrieve_v2_account(self, params: dict, account_id: str) -> dict:
+        return self._v2_account(account_id)
+
+    def _update_v2_account(self, params: dict, account_id: str) -> dict:
+        account = self._v2_account(account_id)
+        for field in ("contact_email", "display_name", "dashboard"):
+            if field in params:
+                account[field] = params[field]
+        for field in ("identity", "defaults", "metadata"):
+            if field in params:
+                account[field] = account.get(field) or {}
+                _merge(account[field], params[field])
+        self._apply_configuration(account, params.get("configuration") or {})
+        return account
+
+    def _close_v2_account(self, params: dict, account_id: str) -> dict:
+        account = self._v2_account(account_id)
+        account["closed"] = True
+        account["applied_configurations"] = []
+        return account
+
+    def _create_account_link(self, params: dict) -> dict:
+        self._v2_account(params.get("account", ""))
+        created = datetime.now(timezone.utc)
+        return {
+            "object": "v2.core.account_link",
+            "account": params["account"],
+            "created": created.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "expires_at": datetime.fromtimestamp(created.timestamp() + 300, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "url": f"https://connect.stripe.com/setup/fake/{uuid.uuid4().hex}",
+            "use_case": params.get("use_case"),
+            "livemode": False,
+        }
+
+    # --- v1 accounts and external accounts ---
+
+    def _v1_account(self, account: dict) -> dict:
+        external_accounts = list(self.external_accounts.get(account["id"], {}).values())
+        return {
+            "id": account["id"],
+            "object": "account",
+            "email": account.get("contact_email"),
+            "created": int(time.time()),
+            "metadata": account.get("metadata") or {},
+            "external_accounts": _list_object(f"/v1/accounts/{account['id']}/external_accounts", external_accounts),
+        }
+
+    def _create_v1_account(self, params: dict) -> dict:
+        account = self._create_v2_account({"contact_email": params.get("email"), "metadata": params.get("metadata")})
+        return self._v1_account(account)
+
+    def _list_v1_accounts(self, params: dict) -> dict:
+        limit = int(params.get("limit", 10))
+        return _list_object("/v1/accounts", [self._v1_account(a) for a in list(self.accounts.values())[:limit]])
+
+    def _retrieve_v1_account(self, params: dict, account_id: str) -> dict:
+        return self._v1_account(self._v2_account(account_id))
+
+    def _delete_v1_account(self, params: dict, account_id: str) -> dict:
+        self._v2_account(account_id)
+        del self.accounts[account_id]
+        self.external_accounts.pop(account_id, None)
+        return {"id": account_id, "object": "account", "deleted": True}
+
+    def _external_account(self, account_id: str, external_account_id: str) -> dict:
+        self._v2_account(account_id)
+        external_account = self.external_accounts[account_id].get(external_account_id)
+        if external_account is None:
+            raise _not_found("external account", external_account_id)
+        return external_account
+
+    def _create_external_account(self, params: dict, account_id: str) -> dict:
+        self._v2_account(account_id)
+        existing = self.external_accounts[account_id]
+        external_account = {
+            "id": _new_id("ba"),
+            "object": "bank_account",
+            "account": account_id,
+            "bank_name": "STRIPE TEST BANK",
+            "country": "US",
+            "currency": "usd",
+            "last4": "6789",
+            "routing_number": "110000000",
+            "status": "new",
+            "default_for_currency": not existing,
+        }
+        existing[external_account["id"]] = external_account
+        return external_account
+
+    def _list_external_accounts(self, params: dict, account_id: str) -> dict:
+        self._v2_account(account_id)
+        data = list(self.external_accounts[account_id].values())
+        starting_after = params.get("starting_after")
+        if starting_after:
+            ids = [ea["id"] for ea in data]
+            data = data[ids.index(starting_after) + 1:] if starting_after in ids else []
+        limit = int(params.get("limit", 10))
+        result = _list_object(f"/v1/accounts/{account_id}/external_accounts", data[:limit])
+        result["has_more"] = len(data) > limit
+        return result
+
+    def _update_external_account(self, params: dict, account_id: str, external_account_id: str) -> dict:
+        external_account = self._external_account(account_id, external_account_id)
+        if _as_bool(params.get("default_for_currency")):
+            for other in self.external_accounts[account_id].values():
+                if other["currency"] == external_account["currency"]:
+                    other["default_for_currency"] = False
+            external_account["default_for_currency"] = True
+        return external_account
+
+    def _delete_external_account(self, params: dict, account_id: str, external_account_id: str) -> dict:
+        self._external_account(account_id, external_account_id)
+        del self.external_accounts[account_id][external_account_id]
+        return {"id": external_account_id, "object": "bank_account", "deleted": True}
+
+    # --- Customers ---
+
+    def _create_customer(self, params: dict) -> dict:
+        customer = {
+            "id": _new_id("cus"),
+            "object": "customer",
+            "created": int(time.time()),
+            "email": params.get("email"),
+            "metadata": params.get("metadata") or {},
+            "livemode": False,
+        }
+        self.customers[customer["id"]] = customer
+        return customer
+
+    def _search_customers(self, params: dict) -> dict:
+        query = params.get("query", "")
+        metadata_match = re.match(r"^metadata\['([^']+)'\]:'([^']*)'$", query)
+        email_match = re.match(r"^email:'([^']*)'$", query)
+        if metadata_match:
+            key, value = metadata_match.groups()
+            if key == "account_id" and self.auto_accounts and value.startswith("acct_"):
+                self._v2_account(value)
+            data = [c for c in self.customers.values() if c["metadata"].get(key) == value]
+        elif email_match:
+            data = [c for c in self.customers.values() if c.get("email") == email_match.group(1)]
+        else:
+            raise FakeStripeError(400, "invalid_request_error", f"Unsupported search query: {query}", param="query")
+        return {"object": "search_result", "url": "/v1/customers/search", "has_more": False, "next_page": None, "data": data}
+
+    def _delete_customer(self, params: dict, customer_id: str) -> dict:
+        if self.customers.pop(customer_id, None) is None:
+            raise _not_found("customer", customer_id)
+        return {"id": customer_id, "object": "customer", "deleted": True}
+
+    def _customer(self, customer_id: str) -> dict:
+        customer = self.customers.get(customer_id)
+        if customer is None:
+            raise _not_found("customer", customer_id)
+        return customer
+
+    # --- Payment methods, SetupIntents and PaymentIntents ---
+
+    def _payment_method(self, payment_method_id: str) -> dict:
+        payment_method = self.payment_methods.get(payment_method_id)
+        if payment_method is None:
+            if not payment_method_id.startswith("pm_"):
+                raise _not_found("payment_method", payment_method_id)
+            payment_method = {
+                "id": payment_method_id,
+                "object": "payment_method",
+                "type": "card",
+                "created": int(time.time()),
+                "customer": None,
+                "card": {"brand": "visa", "last4": "4242", "exp_month": 12, "exp_year": datetime.now().year + 3},
+                "livemode": False,
+            }
+            self.payment_methods[payment_method_id] = payment_method
+        return payment_method
+
+    def _list_for_customer(self, customer_id: str, params: dict) -> List[dict]:
+        limit = int(params.get("limit", 10))
+        data = [pm for pm in self.payment_methods.values() if pm["customer"] == customer_id]
+        return data[:limit]
+
+    def _list_customer_payment_methods(self, params: dict, customer_id: str) -> dict:
+        self._customer(customer_id)
+        return _list_object(f"/v1/customers/{customer_id}/payment_methods", self._list_for_customer(customer_id, params))
+
+    def _list_payment_methods(self, params: dict) -> dict:
+        customer_id = params.get("customer", "")
+        self._customer(customer_id)
+        return _list_object("/v1/payment_methods", self._list_for_customer(customer_id, params))
+
+    def _retrieve_payment_method(self, params: dict, payment_method_id: str) -> dict:
+        return self._payment_method(payment_method_id)
+
+    def _attach_payment_method(self, params: dict, payment_method_id: str) -> dict:
+        payment_method = self._payment_method(payment_method_id)
+        payment_method["customer"] = self._customer(params.get("customer", ""))["id"]
+        return payment_method
+
+    def _detach_payment_method(self, params: dict, payment_method_id: str) -> dict:
+        payment_method = self._payment_method(payment_method_id)
+        if payment_method["customer"] is None:
+            raise FakeStripeError(400, "invalid_request_error", f"The payment method {payment_method_id} is not attached to a customer")
+        payment_method["customer"] = None
+        return payment_method
+
+    def _create_setup_intent(self, params: dict) -> dict:
+        if params.get("customer"):
+            self._customer(params["customer"])
+        setup_intent_id = _new_id("seti")
+        setup_intent = {
+            "id": setup_intent_id,
+            "object": "setup_intent",
+            "client_secret": f"{setup_intent_id}_secret_{uuid.uuid4().hex[:24]}",
+            "customer": params.get("customer"),
+            "usage": params.get("usage", "off_session"),
+            "payment_method_types": params.get("payment_method_types") or ["card"],
+            "status": "requires_payment_method",
+            "metadata": params.get("metadata") or {},
+            "created": int(time.time()),
+        }
+        self.setup_intents[setup_intent_id] = setup_intent
+        return setup_intent
+
+    def _create_payment_intent(self, params: dict) -> dict:
+        customer_id = params.get("customer")
+        if customer_id:
+            self._customer(customer_id)
+        destination = (params.get("transfer_data") or {}).get("destination")
+        if destination:
+            self._v2_account(destination)
+
+        payment_method_id = params.get("payment_method")
+        confirm = _as_bool(params.get("confirm"))
+        if confirm and payment_method_id in DECLINED_PAYMENT_METHODS:
+            raise FakeStripeError(402, "card_error", "Your card was declined.", code="card_declined")
+        if confirm and payment_method_id:
+            payment_method = self._payment_method(payment_method_id)
+            if customer_id and payment_method["customer"] != customer_id:
+                raise FakeStripeError(
+                    400, "invalid_request_error",
+                    f"The payment method {payment_method_id} does not belong to the customer {customer_id}",
+                    param="payment_method",
+                )
+
+        payment_intent_id = _new_id("pi")
+        payment_intent = {
+            "id": payment_intent_id,
+            "object": "payment_intent",
+            "amount": int(params.get("amount", 0)),
+            "currency": params.get("currency", "usd"),
+            "customer": customer_id,
+            "payment_method": payment_method_id,
+            "application_fee_amount": int(params["application_fee_amount"]) if "application_fee_amount" in params else None,
+            "transfer_data": {"destination": destination} if destination else None,
+            "setup_future_usage": params.get("setup_future_usage"),
+            "client_secret": f"{payment_intent_id}_secret_{uuid.uuid4().hex[:24]}",
+            "status": "succeeded" if confirm else "requires_payment_method",
+            "metadata": params.get("metadata") or {},
+            "created": int(time.time()),
+            "livemode": False,
+        }
+        self.payment_intents[payment_intent_id] = payment_intent
+        return payment_intent
+
+
+class FakeStripeTransport(httpx.BaseTransport):
+    """httpx transport that answers Stripe requests from a FakeStripe."""
+
+    def __init__(self, backend: FakeStripe):
+        self.backend = backend
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        delay = self.backend.delay()
+        if delay:
+            time.sleep(delay)
+        return self.backend.handle(request)
+
+
+class AsyncFakeStripeTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of FakeStripeTransport; latency is awaited, not slept."""
+
+    def __init__(self, backend: FakeStripe):
+        self.backend = backend
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        delay = self.backend.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        return self.backend.handle(request)
@@ -0,0 +1,28 @@
+import asyncio
+from typing import Awaitable, Callable, Iterable, List, Optional, TypeVar, Union
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def bounded_gather(
+    func: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+    concurrency: int,
+    timeout: Optional[float] = None,
+) -> List[Union[R, Exception]]:
+    """Await ``func(item)`` for every item with at most ``concurrency`` in flight.
+
+    Results come back in input order. An item that raises, or takes longer than
+    ``timeout`` seconds, yields its exception instead of failing the batch.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(item: T) -> Union[R, Exception]:
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(func(item), timeout)
+            except Exception as e:
+                return e
+
+    return await asyncio.gather(*(run(item) for item in items))
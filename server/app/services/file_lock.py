@@ -0,0 +1,67 @@
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, so run a single worker there
+    fcntl = None
+
+
+class FileLock:
+    """Advisory lock shared by every process that opens the same lock file.
+
+    Built on ``flock``, so it only excludes other processes (and other open
+    handles of the file). Threads of one process share the handle and must be
+    serialized by the caller's own lock. The lock file is opened on first use.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._fd = None
+
+    def _open(self) -> int:
+        if self._fd is None:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._fd
+
+    def acquire(self, exclusive: bool = True, blocking: bool = True) -> bool:
+        """Take the lock; returns False if ``blocking`` is off and another process holds it."""
+        if fcntl is None:
+            return True
+        flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(self._open(), flags)
+        except BlockingIOError:
+            return False
+        return True
+
+    def release(self):
+        if fcntl is not None and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        self.acquire(exclusive=True)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        self.acquire(exclusive=False)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,276 @@
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+IDEMPOTENCY_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "idempotency.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    status_code INTEGER,
+    body TEXT,
+    created_at REAL NOT NULL,
+    claimed_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created_at ON idempotency_keys (created_at);
+"""
+
+CLAIMED = "claimed"
+COMPLETED = "completed"
+PENDING = "pending"
+MISMATCH = "mismatch"
+
+
+class IdempotencyStore:
+    """Persistent record of idempotency keys and the responses they produced.
+
+    A key is first claimed with an empty response, which marks it as in flight
+    for every worker sharing the database, and then completed with the
+    response. A claim holds for ``lease`` seconds unless renewed, so a key whose
+    worker died can be claimed again. Keys older than ``ttl`` seconds are
+    treated as unused and purged.
+    """
+
+    def __init__(self, path: str, ttl: float, lease: float = 30.0):
+        self._path = path
+        self._ttl = ttl
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._last_purge = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            db_dir = os.path.dirname(self._path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+            self._conn = sqlite3.connect(self._path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(idempotency_keys)")]
+            if "claimed_at" not in columns:
+                self._conn.execute("ALTER TABLE idempotency_keys ADD COLUMN claimed_at REAL NOT NULL DEFAULT 0")
+        return self._conn
+
+    def claim(self, key: str, fingerprint: str) -> Tuple[str, Optional[Tuple[int, Any]]]:
+        """Try to take ownership of a key.
+
+        Returns (CLAIMED, None) if the caller should run the request,
+        (COMPLETED, (status_code, body)) if a response is stored,
+        (PENDING, None) if another request holds the key and its lease, or
+        (MISMATCH, None) if the key was used with a different request body.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT fingerprint, status_code, body, created_at, claimed_at FROM idempotency_keys WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                expired = row is not None and row[1] is None and row[4] < now - self.lease
+                if row is None or row[3] < now - self._ttl or (expired and row[0] == fingerprint):
+                    conn.execute(
+                        "INSERT OR REPLACE INTO idempotency_keys "
+                        "(key, fingerprint, status_code, body, created_at, claimed_at) VALUES (?, ?, NULL, NULL, ?, ?)",
+                        (key, fingerprint, now, now),
+                    )
+                    result = (CLAIMED, None)
+                elif row[0] != fingerprint:
+                    result = (MISMATCH, None)
+                elif row[1] is None:
+                    result = (PENDING, None)
+                else:
+                    result = (COMPLETED, (row[1], json.loads(row[2])))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def renew(self, key: str):
+        """Extend the lease of a key whose request is still running."""
+        with self._lock:
+            self._connection().execute(
+                "UPDATE idempotency_keys SET claimed_at = ? WHERE key = ? AND status_code IS NULL",
+                (time.time(), key),
+            )
+
+    def complete(self, key: str, status_code: int, body: Any):
+        with self._lock:
+            self._connection().execute(
+                "UPDATE idempotency_keys SET status_code = ?, body = ? WHERE key = ?",
+                (status_code, json.dumps(body), key),
+            )
+        self._maybe_purge()
+
+    def release(self, key: str):
+        """Forget a claimed key whose request failed, so a retry can run it."""
+        with self._lock:
+            self._connection().execute(
+                "DELETE FROM idempotency_keys WHERE key = ? AND status_code IS NULL",
+                (key,),
+            )
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        with self._lock:
+            self._connection().execute(
+                "DELETE FROM idempotency_keys WHERE created_at < ?",
+                (now - self._ttl,),
+            )
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_store: Optional[IdempotencyStore] = None
+
+# Requests running in this process, so local duplicates are woken as soon as it finishes
+_inflight: Dict[str, "asyncio.Future"] = {}
+
+
+class _Attempt:
+    wrote_to_stripe = False
+
+
+# The idempotent request being handled, shared with the tasks it starts
+_attempt: contextvars.ContextVar[Optional[_Attempt]] = contextvars.ContextVar("idempotent_attempt", default=None)
+
+
+def mark_stripe_write():
+    """Record that the current request sent a write to Stripe.
+
+    Called by the Stripe HTTP client before every non-GET call. Only requests
+    that got this far have their response stored under their Idempotency-Key.
+    """
+    attempt = _attempt.get()
+    if attempt is not None:
+        attempt.wrote_to_stripe = True
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    global _store
+    if _store is None:
+        _store = IdempotencyStore(
+            os.getenv("IDEMPOTENCY_DB_PATH") or IDEMPOTENCY_FILE,
+            ttl=float(os.getenv("IDEMPOTENCY_TTL", "86400")),
+            lease=float(os.getenv("IDEMPOTENCY_LEASE", "30")),
+        )
+    return _store
+
+
+def close_idempotency_store():
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
+
+
+def _replay(status_code: int, body: Any) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content=body, headers={"Idempotent-Replayed": "true"})
+
+
+async def run_idempotent(
+    request: Request,
+    idempotency_key: Optional[str],
+    handler: Callable[[], Awaitable[Any]],
+):
+    """Run ``handler`` at most once per Idempotency-Key.
+
+    A repeated key returns the stored response without calling the handler. A
+    duplicate that arrives while the original is still running waits for it
+    and then returns its response. Once the handler has sent a write to
+    Stripe, its response is stored, whether a success or a client error
+    (4xx). Otherwise the key is released, so a request that failed a check
+    before touching Stripe can be fixed and retried with the same key; the
+    same goes for server errors. Reusing a key with a different request body
+    is rejected with 422.
+
+    The claim's lease is renewed while the handler runs. If this worker dies,
+    a retry can claim the key once the lease has expired; the Stripe calls
+    carry idempotency keys derived from it, so running the handler again
+    doesn't repeat their effects.
+    """
+    if not idempotency_key:
+        return await handler()
+
+    store = get_idempotency_store()
+    key = f"{request.method} {request.url.path}:{idempotency_key}"
+    fingerprint = hashlib.sha256(await request.body()).hexdigest()
+    deadline = time.monotonic() + float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "30"))
+
+    while True:
+        state, stored = await asyncio.to_thread(store.claim, key, fingerprint)
+        if state == COMPLETED:
+            return _replay(*stored)
+        if state == MISMATCH:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request body",
+            )
+        if state == CLAIMED:
+            break
+
+        # PENDING: wait for the original request, here or in another worker
+        if time.monotonic() >= deadline:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        pending = _inflight.get(key)
+        if pending is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(pending), max(0.0, deadline - time.monotonic()))
+            except Exception:
+                pass
+        else:
+            await asyncio.sleep(0.05)
+
+    async def keep_lease():
+        while True:
+            await asyncio.sleep(store.lease / 3)
+            await asyncio.to_thread(store.renew, key)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    attempt = _Attempt()
+    token = _attempt.set(attempt)
+    renewal = asyncio.create_task(keep_lease())
+    try:
+        try:
+            result = await handler()
+        except HTTPException as e:
+            if e.status_code >= 500 or not attempt.wrote_to_stripe:
+                raise
+            await asyncio.to_thread(store.complete, key, e.status_code, {"detail": e.detail})
+            raise
+        if attempt.wrote_to_stripe:
+            await asyncio.to_thread(store.complete, key, 200, jsonable_encoder(result))
+        else:
+            await asyncio.to_thread(store.release, key)
+        return result
+    except BaseException:
+        await asyncio.shield(asyncio.to_thread(store.release, key))
+        raise
+    finally:
+        renewal.cancel()
+        _attempt.reset(token)
+        future.set_result(None)
+        del _inflight[key]
@@ -0,0 +1,378 @@
+import functools
+import inspect
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from a cache hit up to a slow Stripe call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative histogram. Bucket counts are stored per bucket and summed on render."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self._buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = [(labels, list(series)) for labels, series in self._values.items()]
+        lines = self._header()
+        for labels, series in values:
+            cumulative = 0
+            for bound, count in zip(self._buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {_format_value(cumulative)}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {series[-1]!r}")
+            lines.append(f"{self.name}_count{label_text} {_format_value(cumulative)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+PROCESS_START_TIME = REGISTRY.register(Gauge(
+    "process_start_time_seconds", "Start time of the process since the Unix epoch in seconds."
+))
+PROCESS_START_TIME.set(time.time())
+
+STARTUP_DURATION = REGISTRY.register(Gauge(
+    "app_startup_duration_seconds", "Time spent in each phase of this worker's startup.",
+    ("phase",),
+))
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests handled, by route and status code.",
+    ("method", "route", "status"),
+))
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Time to handle an HTTP request, by route.",
+    ("method", "route"),
+))
+HTTP_REQUESTS_IN_PROGRESS = REGISTRY.register(Gauge(
+    "http_requests_in_progress", "HTTP requests currently being handled.",
+    ("method",),
+))
+
+STRIPE_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "stripe_request_duration_seconds", "Time for a single HTTP call to the Stripe API, by operation.",
+    ("operation",),
+))
+STRIPE_REQUEST_ERRORS = REGISTRY.register(Counter(
+    "stripe_request_errors_total", "Stripe API calls that failed, by operation and HTTP status or error.",
+    ("operation", "error"),
+))
+STRIPE_RETRIES = REGISTRY.register(Counter(
+    "stripe_retries_total", "Stripe API calls retried, by operation and the status or error that caused it.",
+    ("operation", "reason"),
+))
+STRIPE_HEDGED_REQUESTS = REGISTRY.register(Counter(
+    "stripe_hedged_requests_total", "Second requests sent for slow idempotent Stripe GETs.",
+    ("operation",),
+))
+STRIPE_CIRCUIT_STATE = REGISTRY.register(Gauge(
+    "stripe_circuit_state", "Circuit breaker state per Stripe operation (0 closed, 1 half-open, 2 open).",
+    ("operation",),
+))
+STRIPE_CIRCUIT_REJECTIONS = REGISTRY.register(Counter(
+    "stripe_circuit_rejections_total", "Stripe calls failed fast because the operation's circuit was open.",
+    ("operation",),
+))
+STRIPE_QUEUE_WAIT = REGISTRY.register(Histogram(
+    "stripe_rate_limit_wait_seconds", "Time Stripe calls waited for the outbound rate limiter, by priority class.",
+    ("priority",),
+))
+STRIPE_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "stripe_rate_limit_queue_depth", "Stripe calls waiting for the outbound rate limiter, by priority class.",
+    ("priority",),
+))
+STRIPE_QUEUE_REJECTIONS = REGISTRY.register(Counter(
+    "stripe_rate_limit_rejections_total", "Stripe calls refused because their rate limiter queue was full.",
+    ("priority",),
+))
+ACCOUNT_DELETION_JOBS = REGISTRY.register(Counter(
+    "account_deletion_jobs_total", "Account deletion jobs finished, by outcome.",
+    ("status",),
+))
+ACCOUNT_IMPORT_ROWS = REGISTRY.register(Counter(
+    "account_import_rows_total", "Rows processed by bulk account imports, by outcome.",
+    ("status",),
+))
+WEBHOOK_EVENTS = REGISTRY.register(Counter(
+    "webhook_events_total", "Stripe webhook events received (or ignored as duplicates) and processed, by outcome.",
+    ("status",),
+))
+WEBHOOK_EVENT_DELAY = REGISTRY.register(Histogram(
+    "webhook_event_processing_delay_seconds", "Time from receiving a Stripe webhook event to finishing its processing.",
+))
+STRIPE_SERVICE_DURATION = REGISTRY.register(Histogram(
+    "stripe_service_call_duration_seconds", "Time spent in an AsyncStripeService method.",
+    ("method",),
+))
+STRIPE_SERVICE_ERRORS = REGISTRY.register(Counter(
+    "stripe_service_call_errors_total", "AsyncStripeService methods that raised, by exception type.",
+    ("method", "error"),
+))
+
+
+def render_metrics() -> str:
+    """All metrics of this process in the Prometheus text exposition format."""
+    return REGISTRY.render()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and in-flight counts per route.
+
+    Requests are labelled with the route template (e.g.
+    ``/api/accounts/{account_id}``) rather than the raw path, and requests that
+    match no route share a single label, so series stay bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.inc(method)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_REQUESTS_IN_PROGRESS.dec(method)
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "<unmatched>"
+            HTTP_REQUEST_DURATION.observe(elapsed, method, route_path)
+            HTTP_REQUESTS.inc(method, route_path, status)
+
+
+# Path segments that are object IDs (acct_1Nx..., pm_123, numeric) are collapsed
+# so that each Stripe endpoint is a single operation label. Resource names such as
+# payment_methods are lowercase only, while generated IDs contain a digit or capital.
+_ID_SEGMENT = re.compile(r"^(?:[a-z]+_[a-z_]*[A-Z0-9][A-Za-z0-9_]*|\d+)$")
+
+# Test-mode IDs such as pm_card_visa or tok_visa are lowercase too, so any
+# prefixed segment right after one of these collections counts as an ID as well.
+_PREFIXED_SEGMENT = re.compile(r"^[a-z]+_[A-Za-z0-9_]+$")
+_COLLECTIONS = frozenset({
+    "accounts", "balance_transactions", "charges", "customers", "events", "external_accounts",
+    "invoices", "payment_intents", "payment_methods", "payouts", "persons", "prices", "products",
+    "refunds", "setup_intents", "sources", "subscriptions", "tokens", "transfers",
+})
+
+
+def stripe_operation(method: str, url: str) -> str:
+    """Label for a Stripe API call, e.g. ``POST /v1/payment_methods/{id}/attach``."""
+    path = url.split("://", 1)[-1]
+    path = path[path.find("/"):] if "/" in path else "/"
+    path = path.split("?", 1)[0]
+    segments = path.split("/")
+    labels = [
+        "{id}" if _ID_SEGMENT.match(segment)
+        or (index and segments[index - 1] in _COLLECTIONS and _PREFIXED_SEGMENT.match(segment))
+        else segment
+        for index, segment in enumerate(segments)
+    ]
+    return f"{method.upper()} {'/'.join(labels)}"
+
+
+def record_stripe_request(operation: str, elapsed: float, status_code: Optional[int] = None, error: Optional[str] = None):
+    STRIPE_REQUEST_DURATION.observe(elapsed, operation)
+    if error is not None:
+        STRIPE_REQUEST_ERRORS.inc(operation, error)
+    elif status_code is not None and status_code >= 400:
+        STRIPE_REQUEST_ERRORS.inc(operation, str(status_code))
+
+
+def instrument_methods(cls):
+    """Class decorator recording latency and errors of every public method."""
+    for name, func in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.isfunction(func):
+            continue
+        setattr(cls, name, _instrument(func, f"{cls.__name__}.{name}"))
+    return cls
+
+
+def _instrument(func, label: str):
+    # Generators are timed from the first item requested until they are exhausted or closed
+    if inspect.isasyncgenfunction(func):
+        @functools.wraps(func)
+        async def async_gen_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                async for item in func(*args, **kwargs):
+                    yield item
+            except Exception as e:
+                STRIPE_SERVICE_ERRORS.inc(label, type(e).__name__)
+                raise
+            finally:
+                STRIPE_SERVICE_DURATION.observe(time.perf_counter() - start, label)
+        return async_gen_wrapper
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def gen_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                yield from func(*args, **kwargs)
+            except Exception as e:
+                STRIPE_SERVICE_ERRORS.inc(label, type(e).__name__)
+                raise
+            finally:
+                STRIPE_SERVICE_DURATION.observe(time.perf_counter() - start, label)
+        return gen_wrapper
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                STRIPE_SERVICE_ERRORS.inc(label, type(e).__name__)
+                raise
+            finally:
+                STRIPE_SERVICE_DURATION.observe(time.perf_counter() - start, label)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            STRIPE_SERVICE_ERRORS.inc(label, type(e).__name__)
+            raise
+        finally:
+            STRIPE_SERVICE_DURATION.observe(time.perf_counter() - start, label)
+    return wrapper
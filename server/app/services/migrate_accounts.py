@@ -0,0 +1,51 @@
+"""One-shot migration of accounts.json (plus any pending accounts.log) into SQLite.
+
+Run from the app directory:
+
+    python -m services.migrate_accounts [--source data/accounts.json] [--target data/accounts.db]
+
+Accounts whose id already exists in the target are skipped, so the command can
+be re-run safely.
+"""
+import argparse
+import os
+
+from services.account_log import AccountLog
+from services.account_store import JsonAccountStore
+from services.database import DB_FILE, LOG_FILE, SQLITE_FILE
+from services.sqlite_store import SqliteAccountStore
+
+
+def migrate(source: str, target: str, log_file: str = "", batch_size: int = 1000) -> int:
+    """Copy every account from the JSON store into the SQLite store. Returns the number copied."""
+    log = AccountLog(log_file) if log_file and os.path.exists(log_file) else None
+    json_store = JsonAccountStore(source, log=log)
+    sqlite_store = SqliteAccountStore(target, pool_size=1)
+
+    try:
+        pending = [
+            record for record in json_store.list()
+            if sqlite_store.get(record["id"]) is None
+        ]
+        for start in range(0, len(pending), batch_size):
+            sqlite_store.insert_many(pending[start:start + batch_size])
+        return len(pending)
+    finally:
+        json_store.close()
+        sqlite_store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate platform accounts from JSON to SQLite.")
+    parser.add_argument("--source", default=DB_FILE, help="accounts.json to read")
+    parser.add_argument("--log", default=LOG_FILE, help="accounts.log to replay on top of the source, if present")
+    parser.add_argument("--target", default=SQLITE_FILE, help="SQLite database to write")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    copied = migrate(args.source, args.target, args.log, args.batch_size)
+    print(f"Migrated {copied} accounts into {os.path.abspath(args.target)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+from typing import Optional
+
+from services.cache import TTLCache
+
+# PaymentMethod ID -> ID of the Customer it is attached to. Only attached
+# payment methods are cached; an unknown entry means "ask Stripe".
+_cache: TTLCache[str] = TTLCache(
+    maxsize=int(os.getenv("PAYMENT_METHOD_OWNER_CACHE_SIZE", "50000")),
+    ttl=float(os.getenv("PAYMENT_METHOD_OWNER_CACHE_TTL", "3600")),
+)
+
+
+def get_payment_method_owner(payment_method_id: str) -> Optional[str]:
+    """Return the Customer a payment method is known to be attached to, or None if unknown."""
+    return _cache.get(payment_method_id)
+
+
+def remember_payment_method_owner(payment_method_id: str, customer_id: Optional[str]):
+    """Record who owns a payment method, after attaching, listing or retrieving it."""
+    if customer_id:
+        _cache.set(payment_method_id, customer_id)
+    else:
+        _cache.invalidate(payment_method_id)
+
+
+def forget_payment_method_owner(payment_method_id: str):
+    """Drop a cached owner, e.g. after detaching or when Stripe rejects the payment method."""
+    _cache.invalidate(payment_method_id)
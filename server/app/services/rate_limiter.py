@@ -0,0 +1,157 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, List, Optional, Union
+
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second, bursting up to ``burst``.
+
+    Waiters are served in arrival order.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self._rate = rate
+        self._burst = max(1, burst)
+        self._tokens = float(self._burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        if self._rate <= 0:
+            return
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class QueueFullError(Exception):
+    """Raised by PriorityTokenBucket.acquire when a priority class's queue is full."""
+
+
+class PriorityTokenBucket(TokenBucket):
+    """Token bucket whose waiters are served by priority class, then arrival order.
+
+    Priority 0 is served first. A caller only takes a token straight away when
+    nobody of the same or a higher priority is waiting, so a burst of
+    low-priority calls can't starve higher ones. Each class queues at most
+    ``max_queue`` waiters; beyond that acquire() raises QueueFullError.
+
+    Threads without an event loop use ``acquire_blocking``, which queues in the
+    same priority classes under the same bound.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, priorities: int = 3, max_queue: int = 1000,
+                 on_wait: Optional[Callable[[int, float], None]] = None,
+                 on_depth: Optional[Callable[[int, int], None]] = None):
+        super().__init__(rate, burst)
+        self._max_queue = max_queue
+        self._queues: List[Deque[Union[asyncio.Future, concurrent.futures.Future]]] = [deque() for _ in range(priorities)]
+        self._state_lock = threading.Lock()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._on_wait = on_wait
+        self._on_depth = on_depth
+
+    def _take(self) -> bool:
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def _report_depth(self, priority: int):
+        if self._on_depth:
+            self._on_depth(priority, len(self._queues[priority]))
+
+    async def acquire(self, priority: int = 0):
+        """Wait for a token at ``priority``."""
+        if self._rate <= 0:
+            return
+        with self._state_lock:
+            if not any(self._queues[: priority + 1]) and self._take():
+                if self._on_wait:
+                    self._on_wait(priority, 0.0)
+                return
+            if len(self._queues[priority]) >= self._max_queue:
+                raise QueueFullError(f"Too many requests waiting at priority {priority}")
+            waiter = asyncio.get_running_loop().create_future()
+            self._queues[priority].append(waiter)
+            self._report_depth(priority)
+            if self._dispatcher is None or self._dispatcher.done():
+                self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+        started = time.monotonic()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._state_lock:
+                if waiter in self._queues[priority]:
+                    self._queues[priority].remove(waiter)
+                    self._report_depth(priority)
+            raise
+        if self._on_wait:
+            self._on_wait(priority, time.monotonic() - started)
+
+    async def _dispatch(self):
+        """Hand out tokens to queued waiters, highest priority first, as they accrue."""
+        while True:
+            with self._state_lock:
+                priority = next((p for p, q in enumerate(self._queues) if q), None)
+                if priority is None:
+                    return
+                if self._take():
+                    waiter = self._queues[priority].popleft()
+                    self._report_depth(priority)
+                    if waiter.done():
+                        # Cancelled after being queued: give the token back
+                        self._tokens += 1
+                    else:
+                        waiter.set_result(None)
+                    continue
+                wait = (1 - self._tokens) / self._rate
+            await asyncio.sleep(wait)
+
+    def acquire_blocking(self, priority: int = 0):
+        """Wait for a token at ``priority`` from a thread.
+
+        The waiting thread takes its own token once it is first in line; while
+        async waiters are queued too, the dispatcher may hand it one instead.
+        """
+        if self._rate <= 0:
+            return
+        with self._state_lock:
+            if not any(self._queues[: priority + 1]) and self._take():
+                if self._on_wait:
+                    self._on_wait(priority, 0.0)
+                return
+            if len(self._queues[priority]) >= self._max_queue:
+                raise QueueFullError(f"Too many requests waiting at priority {priority}")
+            waiter = concurrent.futures.Future()
+            self._queues[priority].append(waiter)
+            self._report_depth(priority)
+
+        started = time.monotonic()
+        while True:
+            with self._state_lock:
+                if waiter.done():
+                    break
+                first = next(q[0] for q in self._queues if q)
+                if first is waiter and self._take():
+                    self._queues[priority].popleft()
+                    self._report_depth(priority)
+                    break
+                wait = max(1 - self._tokens, 0.1) / self._rate
+            concurrent.futures.wait([waiter], timeout=wait)
+        if self._on_wait:
+            self._on_wait(priority, time.monotonic() - started)
@@ -0,0 +1,260 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Mapping, Optional, Tuple
+
+import stripe
+
+from services.metrics import (
+    STRIPE_CIRCUIT_REJECTIONS,
+    STRIPE_CIRCUIT_STATE,
+    STRIPE_HEDGED_REQUESTS,
+    STRIPE_RETRIES,
+)
+
+Response = Tuple[bytes, int, Mapping[str, str]]
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(stripe.error.APIConnectionError):
+    """Raised instead of calling Stripe while an operation's circuit is open."""
+
+
+class CircuitBreaker:
+    """Per-operation circuit breaker.
+
+    An operation's circuit opens after ``failure_threshold`` consecutive
+    failures (connection errors and 5xx responses) and rejects calls for
+    ``reset_timeout`` seconds. After that a single trial call is let through;
+    its success closes the circuit again and its failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        # operation -> [state, consecutive failures, time opened or last trial started]
+        self._circuits: Dict[str, list] = {}
+
+    def _set_state(self, operation: str, circuit: list, state: str):
+        circuit[0] = state
+        STRIPE_CIRCUIT_STATE.set(_STATE_VALUES[state], operation)
+
+    def before_call(self, operation: str):
+        """Raise CircuitOpenError if ``operation`` must not call Stripe right now."""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            circuit = self._circuits.get(operation)
+            if circuit is None or circuit[0] == CLOSED:
+                return
+            # Let one trial call through per reset_timeout (again if a trial never reported back)
+            now = time.monotonic()
+            if now - circuit[2] >= self.reset_timeout:
+                circuit[2] = now
+                self._set_state(operation, circuit, HALF_OPEN)
+                return
+        STRIPE_CIRCUIT_REJECTIONS.inc(operation)
+        raise CircuitOpenError(
+            f"Stripe is currently failing for {operation}; not retrying for up to {self.reset_timeout:g}s",
+            should_retry=False,
+        )
+
+    def record(self, operation: str, success: bool):
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            circuit = self._circuits.setdefault(operation, [CLOSED, 0, 0.0])
+            if success:
+                circuit[1] = 0
+                if circuit[0] != CLOSED:
+                    self._set_state(operation, circuit, CLOSED)
+                return
+            circuit[1] += 1
+            if circuit[0] == HALF_OPEN or circuit[1] >= self.failure_threshold:
+                circuit[2] = time.monotonic()
+                self._set_state(operation, circuit, OPEN)
+
+
+class StripeResilience:
+    """Retries, hedging and circuit breaking for single Stripe HTTP calls.
+
+    Used by PooledHTTPXClient underneath every StripeClient, so it covers the
+    AsyncStripeService and direct client calls alike. Every POST already
+    carries an Idempotency-Key from the SDK, so retrying writes is safe.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 2,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        hedge_after: float = 0.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker(failure_threshold=0)
+
+    @staticmethod
+    def _should_retry(status_code: int, headers: Mapping[str, str]) -> bool:
+        # Stripe says explicitly when retrying would (not) help, e.g. on lock timeouts
+        should_retry = headers.get("stripe-should-retry")
+        if should_retry == "true":
+            return True
+        if should_retry == "false":
+            return False
+        return status_code in (409, 429) or status_code >= 500
+
+    def _backoff(self, attempt: int, headers: Optional[Mapping[str, str]]) -> float:
+        """Full-jitter exponential backoff, but never sooner than a Retry-After header asks."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        retry_after = headers.get("retry-after") if headers else None
+        if retry_after:
+            try:
+                delay = max(delay, min(self.max_delay, float(retry_after)))
+            except ValueError:
+                pass
+        return delay
+
+    def _outcome(self, operation: str, attempt: int, response: Optional[Response], error: Optional[Exception]):
+        """Record a call in the breaker and return the delay before retrying, or None to stop."""
+        if error is not None:
+            self.breaker.record(operation, success=False)
+            if attempt >= self.max_retries or not getattr(error, "should_retry", False):
+                return None
+            STRIPE_RETRIES.inc(operation, "connection")
+            return self._backoff(attempt, None)
+
+        _, status_code, headers = response
+        self.breaker.record(operation, success=status_code < 500)
+        if attempt >= self.max_retries or not self._should_retry(status_code, headers):
+            return None
+        STRIPE_RETRIES.inc(operation, str(status_code))
+        return self._backoff(attempt, headers)
+
+    def call(self, operation: str, send: Callable[[], Response],
+             acquire: Optional[Callable[[], None]] = None) -> Response:
+        """Send a call with retries; ``acquire``, if given, runs before every attempt (e.g. to take a rate limit token)."""
+        attempt = 0
+        while True:
+            self.breaker.before_call(operation)
+            if acquire:
+                acquire()
+            response, error = None, None
+            try:
+                response = send()
+            except stripe.error.APIConnectionError as e:
+                error = e
+            delay = self._outcome(operation, attempt, response, error)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            time.sleep(delay)
+            attempt += 1
+
+    async def call_async(self, operation: str, method: str, send: Callable[[], Awaitable[Response]],
+                         acquire: Optional[Callable[[], Awaitable[None]]] = None) -> Response:
+        """Async counterpart of call(), which also hedges GETs."""
+        hedge = self.hedge_after > 0 and method.lower() == "get"
+        attempt = 0
+        while True:
+            self.breaker.before_call(operation)
+            if acquire:
+                await acquire()
+            response, error = None, None
+            try:
+                response = await (self._hedged(operation, send, acquire) if hedge else send())
+            except stripe.error.APIConnectionError as e:
+                error = e
+            delay = self._outcome(operation, attempt, response, error)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _hedged(self, operation: str, send: Callable[[], Awaitable[Response]],
+                      acquire: Optional[Callable[[], Awaitable[None]]]) -> Response:
+        """Send a GET, and a second copy if the first is slower than ``hedge_after``; first answer wins.
+
+        The first copy has already been through ``acquire``, so time spent
+        waiting for the rate limiter never counts towards ``hedge_after``; the
+        second copy goes through it on its own.
+        """
+        async def send_again() -> Response:
+            if acquire:
+                await acquire()
+            return await send()
+
+        tasks = [asyncio.ensure_future(send())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done:
+                STRIPE_HEDGED_REQUESTS.inc(operation)
+                tasks.append(asyncio.ensure_future(send_again()))
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+
+def create_stripe_resilience() -> StripeResilience:
+    """Build the resilience policy from the environment."""
+    return StripeResilience(
+        max_retries=int(os.getenv("STRIPE_MAX_RETRIES", "2")),
+        base_delay=float(os.getenv("STRIPE_RETRY_BASE_DELAY", "0.5")),
+        max_delay=float(os.getenv("STRIPE_RETRY_MAX_DELAY", "8")),
+        hedge_after=float(os.getenv("STRIPE_HEDGE_AFTER_MS", "0")) / 1000,
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("STRIPE_BREAKER_THRESHOLD", "5")),
+            reset_timeout=float(os.getenv("STRIPE_BREAKER_RESET_SECONDS", "30")),
+        ),
+    )
+
+
+def stripe_error_status(e: stripe.error.StripeError) -> int:
+    """HTTP status to answer with when a Stripe call fails.
+
+    Failures that are Stripe's or the network's (connection errors, an open
+    circuit, rate limiting, 5xx) are 503 so clients know to retry later;
+    anything else is a problem with the request and stays 400.
+    """
+    if isinstance(e, (stripe.error.APIConnectionError, stripe.error.RateLimitError)):
+        return 503
+    if e.http_status is not None and e.http_status >= 500:
+        return 503
+    return 400
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether a failed background attempt is worth retrying.
+
+    Stripe errors answered with 503 (see stripe_error_status) may succeed
+    later; other Stripe errors won't change. Anything else is unexpected, so
+    it gets another go too.
+    """
+    if isinstance(error, stripe.error.StripeError):
+        return stripe_error_status(error) == 503
+    return True
@@ -0,0 +1,23 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+
+class ModelResponse(Response):
+    """JSON response rendered directly by a model's compiled Pydantic serializer.
+
+    Returning a Response from a route makes FastAPI skip re-validating the
+    result against ``response_model``, encoding it to plain Python and then
+    dumping that again, so a model built by ``from_stripe_*`` is validated once
+    and turned into JSON once. Routes keep their ``response_model`` for the
+    OpenAPI schema. Anything that isn't a model is rendered with orjson.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.__pydantic_serializer__.to_json(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,219 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from services.account_storage import AccountStorage
+
+COLUMNS = ("id", "email", "stripe_customer_id", "stripe_account_id")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    stripe_customer_id TEXT NOT NULL DEFAULT '',
+    stripe_account_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_accounts_stripe_account_id ON accounts (stripe_account_id);
+CREATE INDEX IF NOT EXISTS idx_accounts_email ON accounts (email);
+"""
+
+
+class _ConnectionPool:
+    """Fixed-size pool of SQLite connections shared by the threads of one worker.
+
+    Connections are opened lazily up to ``size``; callers beyond that wait for
+    one to be returned.
+    """
+
+    def __init__(self, path: str, size: int):
+        self._path = path
+        self._size = max(1, size)
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self._path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._opened < self._size:
+                    self._opened += 1
+                    try:
+                        conn = self._open()
+                    except Exception:
+                        self._opened -= 1
+                        raise
+        if conn is None:
+            conn = self._idle.get()
+
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._opened = 0
+
+
+class SqliteAccountStore(AccountStorage):
+    """Account storage in a SQLite database running in WAL mode.
+
+    Lookups by id, Stripe account ID and email are served by indexes, and each
+    worker process keeps its own pool of connections.
+    """
+
+    def __init__(self, path: str, pool_size: int = 4):
+        self._path = path
+        self._pool = _ConnectionPool(path, pool_size)
+        self._schema_lock = threading.Lock()
+        self._ready = False
+
+    def load(self):
+        """Create the database file and schema if they don't exist yet."""
+        with self._schema_lock:
+            if self._ready:
+                return
+            db_dir = os.path.dirname(self._path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+            with self._pool.connection() as conn:
+                conn.executescript(SCHEMA)
+            self._ready = True
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        if not self._ready:
+            self.load()
+        with self._pool.connection() as conn:
+            yield conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _fetch_one(self, where: str, value: str) -> Optional[dict]:
+        with self._connection() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM accounts WHERE {where} = ? ORDER BY rowid LIMIT 1",
+                (value,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    # --- Reads ---
+
+    def get(self, account_id: str) -> Optional[dict]:
+        return self._fetch_one("id", account_id)
+
+    def get_by_stripe_id(self, stripe_account_id: str) -> Optional[dict]:
+        return self._fetch_one("stripe_account_id", stripe_account_id)
+
+    def get_by_email(self, email: str) -> Optional[dict]:
+        return self._fetch_one("email", email)
+
+    def list(self) -> List[dict]:
+        with self._connection() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM accounts ORDER BY rowid"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_page(self, limit: int, starting_after: Optional[str] = None) -> Tuple[List[dict], bool]:
+        with self._connection() as conn:
+            after_rowid = 0
+            if starting_after is not None:
+                row = conn.execute(
+                    "SELECT rowid FROM accounts WHERE id = ?", (starting_after,)
+                ).fetchone()
+                if row is None:
+                    raise ValueError(f"Unknown cursor: {starting_after}")
+                after_rowid = row[0]
+
+            rows = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM accounts WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (after_rowid, limit + 1),
+            ).fetchall()
+        return [dict(row) for row in rows[:limit]], len(rows) > limit
+
+    def iter_batches(self, batch_size: int) -> Iterator[List[dict]]:
+        last_rowid = 0
+        while True:
+            with self._connection() as conn:
+                rows = conn.execute(
+                    f"SELECT rowid, {', '.join(COLUMNS)} FROM accounts WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1]["rowid"]
+            yield [{column: row[column] for column in COLUMNS} for row in rows]
+
+    # --- Writes ---
+
+    def insert(self, record: dict):
+        self.insert_many([record])
+
+    def insert_many(self, records: Iterable[dict]):
+        rows = [tuple(record.get(column, "") for column in COLUMNS) for record in records]
+        with self._transaction() as conn:
+            conn.executemany(
+                f"INSERT INTO accounts ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def update(self, account_id: str, updates: dict) -> Optional[dict]:
+        for column in updates:
+            if column not in COLUMNS or column == "id":
+                raise ValueError(f"Cannot update account field: {column}")
+
+        with self._transaction() as conn:
+            if updates:
+                assignments = ", ".join(f"{column} = ?" for column in updates)
+                conn.execute(
+                    f"UPDATE accounts SET {assignments} WHERE id = ?",
+                    (*updates.values(), account_id),
+                )
+            row = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM accounts WHERE id = ?",
+                (account_id,),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def delete(self, account_id: str) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute("DELETE FROM accounts WHERE id = ?", (account_id,))
+        return cursor.rowcount > 0
+
+    def close(self):
+        self._pool.close()
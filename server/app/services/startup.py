@@ -0,0 +1,147 @@
+import asyncio
+import importlib
+import os
+import time
+from functools import reduce
+from typing import Dict, Optional
+
+import stripe
+from fastapi import FastAPI
+
+from services.account_snapshots import get_account_snapshot
+from services.database import get_account_store, list_platform_accounts_page
+from services.fanout import bounded_gather
+from services.metrics import STARTUP_DURATION
+from services.stripe_client import StripeClients
+
+ROUTER_MODULES = ("accounts", "payment_methods", "external_accounts", "transactions", "webhooks")
+
+# Stripe SDK services the routers use; the SDK imports each on first attribute access
+_STRIPE_SERVICES = (
+    "v1.accounts",
+    "v1.accounts.external_accounts",
+    "v1.customers",
+    "v1.customers.payment_methods",
+    "v1.payment_intents",
+    "v1.payment_methods",
+    "v1.setup_intents",
+    "v2.core.accounts",
+    "v2.core.account_links",
+)
+
+
+def include_routers(app: FastAPI):
+    """Import the API routers and register them on the app."""
+    for name in ROUTER_MODULES:
+        app.include_router(importlib.import_module(f"routers.{name}").router)
+
+
+class RouterLoader:
+    """Imports and registers the API routers on first use instead of at app creation.
+
+    The import runs in a worker thread; only the registration happens on the
+    event loop. Requests that arrive before it finishes wait for it.
+    """
+
+    def __init__(self, app: FastAPI):
+        self._app = app
+        self._loaded = False
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def load(self):
+        if self._loaded:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._loaded:
+                return
+            started = time.perf_counter()
+            modules = await asyncio.to_thread(
+                lambda: [importlib.import_module(f"routers.{name}") for name in ROUTER_MODULES]
+            )
+            for module in modules:
+                self._app.include_router(module.router)
+            self._loaded = True
+            STARTUP_DURATION.set(time.perf_counter() - started, "routers")
+
+
+class LazyRouterMiddleware:
+    """ASGI middleware that makes sure the routers are loaded before routing a request."""
+
+    def __init__(self, app, loader: RouterLoader):
+        self.app = app
+        self.loader = loader
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            await self.loader.load()
+        await self.app(scope, receive, send)
+
+
+def _load_stripe_services(clients: StripeClients):
+    for client in (clients.default, clients.preview):
+        for path in _STRIPE_SERVICES:
+            reduce(getattr, path.split("."), client)
+
+
+async def _prime_account_snapshots(clients: StripeClients, count: int) -> int:
+    """Fetch the accounts on the first page of GET /api/accounts into the snapshot cache."""
+    platform_accounts, _ = await asyncio.to_thread(list_platform_accounts_page, count)
+    results = await bounded_gather(
+        lambda pa: get_account_snapshot(clients.preview, pa.stripe_account_id),
+        platform_accounts,
+        concurrency=int(os.getenv("ACCOUNTS_FANOUT_CONCURRENCY", "16")),
+        timeout=float(os.getenv("ACCOUNTS_FANOUT_TIMEOUT", "10")),
+    )
+    return sum(1 for result in results if not isinstance(result, Exception))
+
+
+async def warm_up(clients: StripeClients, import_seconds: float) -> Dict[str, float]:
+    """Do the work the first requests after a deploy would otherwise pay for.
+
+    Loads the account store and its indexes, imports the Stripe SDK services,
+    opens STARTUP_STRIPE_CONNECTIONS pooled connections to Stripe (or the fake
+    backend) and fetches the first STARTUP_PRIME_ACCOUNTS account snapshots.
+    Network phases are bounded by STARTUP_WARMUP_TIMEOUT and only warn on
+    failure. Each phase's duration is printed and exported as
+    app_startup_duration_seconds.
+    """
+    timings = {"imports": import_seconds}
+    details = []
+    timeout = float(os.getenv("STARTUP_WARMUP_TIMEOUT", "10"))
+
+    started = time.perf_counter()
+    await asyncio.to_thread(get_account_store().load)
+    timings["account_store"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    _load_stripe_services(clients)
+    timings["stripe_sdk"] = time.perf_counter() - started
+
+    connections = int(os.getenv("STARTUP_STRIPE_CONNECTIONS", "4"))
+    if connections > 0:
+        started = time.perf_counter()
+        try:
+            opened = await asyncio.wait_for(clients.http_client.open_connections(stripe.api_base, connections), timeout)
+            details.append(f"{opened}/{connections} connections")
+        except asyncio.TimeoutError:
+            print("Warning: Timed out opening connections to Stripe during startup")
+        timings["stripe_connections"] = time.perf_counter() - started
+
+    prime_accounts = int(os.getenv("STARTUP_PRIME_ACCOUNTS", "100"))
+    if prime_accounts > 0:
+        started = time.perf_counter()
+        try:
+            primed = await asyncio.wait_for(_prime_account_snapshots(clients, prime_accounts), timeout)
+            details.append(f"{primed} account snapshots")
+        except asyncio.TimeoutError:
+            print("Warning: Timed out priming account snapshots during startup")
+        timings["caches"] = time.perf_counter() - started
+
+    timings["total"] = sum(timings.values())
+    for phase, seconds in timings.items():
+        STARTUP_DURATION.set(seconds, phase)
+    summary = ", ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in timings.items())
+    print(f"Startup: {summary}" + (f" ({', '.join(details)})" if details else ""))
+    return timings
@@ -0,0 +1,225 @@
+import asyncio
+import os
+import ssl
+import time
+from typing import Optional
+
+import httpx
+import stripe
+
+from services.idempotency import mark_stripe_write
+from services.metrics import (
+    STRIPE_QUEUE_DEPTH,
+    STRIPE_QUEUE_REJECTIONS,
+    STRIPE_QUEUE_WAIT,
+    record_stripe_request,
+    stripe_operation,
+)
+from services.rate_limiter import PriorityTokenBucket, QueueFullError
+from services.resilience import StripeResilience, create_stripe_resilience
+
+# API version required by the v2 recipient configuration and account links.
+PREVIEW_API_VERSION = "2025-12-15.preview"
+
+# Outbound rate limiter priority classes, served in this order
+MONEY_MOVEMENT = 0
+WRITE = 1
+READ = 2
+PRIORITY_NAMES = ("money_movement", "write", "read")
+
+# Endpoints whose POSTs create or move funds
+_MONEY_MOVEMENT_PREFIXES = ("/v1/payment_intents", "/v1/charges", "/v1/transfers", "/v1/payouts", "/v1/refunds")
+
+
+class OutboundQueueFullError(stripe.error.RateLimitError):
+    """Raised instead of calling Stripe when too many calls of a priority class are already waiting."""
+
+
+def stripe_priority(operation: str) -> int:
+    """Rate limiter priority class of a Stripe operation label from stripe_operation()."""
+    method, _, path = operation.partition(" ")
+    if method == "GET":
+        return READ
+    if method == "POST" and path.startswith(_MONEY_MOVEMENT_PREFIXES):
+        return MONEY_MOVEMENT
+    return WRITE
+
+
+def create_stripe_rate_limiter() -> PriorityTokenBucket:
+    """Build the outbound rate limiter from the environment (STRIPE_RATE_LIMIT=0 disables it)."""
+    rate = float(os.getenv("STRIPE_RATE_LIMIT", "90"))
+    return PriorityTokenBucket(
+        rate=rate,
+        burst=int(os.getenv("STRIPE_RATE_BURST", str(max(1, int(rate))))),
+        priorities=len(PRIORITY_NAMES),
+        max_queue=int(os.getenv("STRIPE_RATE_QUEUE_SIZE", "1000")),
+        on_wait=lambda priority, waited: STRIPE_QUEUE_WAIT.observe(waited, PRIORITY_NAMES[priority]),
+        on_depth=lambda priority, depth: STRIPE_QUEUE_DEPTH.set(depth, PRIORITY_NAMES[priority]),
+    )
+
+
+class PooledHTTPXClient(stripe.HTTPXClient):
+    """Stripe HTTP client backed by long-lived httpx clients with keep-alive pools.
+
+    One instance is shared by every StripeClient in the process, so TLS
+    connections to Stripe are reused across requests and API versions. Calls
+    go through ``resilience`` for retries, hedging and circuit breaking, every
+    attempt (retries and hedges included) takes a token from ``rate_limiter``
+    according to its priority class, and every attempt is timed and recorded
+    in services.metrics.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 80,
+        transport: Optional[httpx.BaseTransport] = None,
+        async_transport: Optional[httpx.AsyncBaseTransport] = None,
+        resilience: Optional[StripeResilience] = None,
+        rate_limiter: Optional[PriorityTokenBucket] = None,
+    ):
+        super().__init__(timeout=timeout)
+        self.resilience = resilience or StripeResilience(max_retries=0)
+        self.rate_limiter = rate_limiter or PriorityTokenBucket(rate=0)
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        verify = ssl.create_default_context(cafile=stripe.ca_bundle_path)
+
+        # Replace the default clients with ones that use the tuned pool limits
+        self._client = httpx.Client(verify=verify, limits=limits, transport=transport)
+        self._client_async = httpx.AsyncClient(verify=verify, limits=limits, transport=async_transport)
+
+    def _acquire(self, operation):
+        priority = stripe_priority(operation)
+        try:
+            self.rate_limiter.acquire_blocking(priority)
+        except QueueFullError as e:
+            STRIPE_QUEUE_REJECTIONS.inc(PRIORITY_NAMES[priority])
+            raise OutboundQueueFullError(str(e), http_status=429) from e
+
+    async def _acquire_async(self, operation):
+        priority = stripe_priority(operation)
+        try:
+            await self.rate_limiter.acquire(priority)
+        except QueueFullError as e:
+            STRIPE_QUEUE_REJECTIONS.inc(PRIORITY_NAMES[priority])
+            raise OutboundQueueFullError(str(e), http_status=429) from e
+
+    def _send(self, operation, method, url, headers, post_data):
+        if method.lower() != "get":
+            mark_stripe_write()
+        start = time.perf_counter()
+        try:
+            content, status_code, response_headers = super().request(method, url, headers, post_data)
+        except Exception as e:
+            record_stripe_request(operation, time.perf_counter() - start, error=type(e).__name__)
+            raise
+        record_stripe_request(operation, time.perf_counter() - start, status_code)
+        return content, status_code, response_headers
+
+    async def _send_async(self, operation, method, url, headers, post_data):
+        if method.lower() != "get":
+            mark_stripe_write()
+        start = time.perf_counter()
+        try:
+            content, status_code, response_headers = await super().request_async(method, url, headers, post_data)
+        except Exception as e:
+            record_stripe_request(operation, time.perf_counter() - start, error=type(e).__name__)
+            raise
+        record_stripe_request(operation, time.perf_counter() - start, status_code)
+        return content, status_code, response_headers
+
+    async def open_connections(self, url: str, count: int) -> int:
+        """Open up to ``count`` keep-alive connections to ``url`` ahead of the first API call.
+
+        Sends unauthenticated GETs straight through the httpx client, so they
+        count against no rate limit; any answer leaves a warm connection in
+        the pool. Returns how many requests got a response.
+        """
+        responses = await asyncio.gather(
+            *(self._client_async.get(url) for _ in range(count)),
+            return_exceptions=True,
+        )
+        return sum(1 for response in responses if not isinstance(response, BaseException))
+
+    def request(self, method, url, headers, post_data=None):
+        operation = stripe_operation(method, url)
+        return self.resilience.call(
+            operation,
+            lambda: self._send(operation, method, url, headers, post_data),
+            acquire=lambda: self._acquire(operation),
+        )
+
+    async def request_async(self, method, url, headers, post_data=None):
+        operation = stripe_operation(method, url)
+        return await self.resilience.call_async(
+            operation,
+            method,
+            lambda: self._send_async(operation, method, url, headers, post_data),
+            acquire=lambda: self._acquire_async(operation),
+        )
+
+
+class StripeClients:
+    """The process-wide Stripe clients, one per API version, sharing one connection pool."""
+
+    def __init__(self, api_key: str, http_client: stripe.HTTPClient):
+        self.http_client = http_client
+        # Retries happen in the http client's resilience layer, so the SDK's own are turned off
+        self.default = stripe.StripeClient(api_key, http_client=http_client, max_network_retries=0)
+        self.preview = stripe.StripeClient(
+            api_key,
+            stripe_version=PREVIEW_API_VERSION,
+            http_client=http_client,
+            max_network_retries=0,
+        )
+
+    async def aclose(self):
+        self.http_client.close()
+        await self.http_client.close_async()
+
+
+def _fake_stripe_transports():
+    from services.fake_stripe import AsyncFakeStripeTransport, FakeStripe, FakeStripeTransport
+
+    seed = os.getenv("FAKE_STRIPE_SEED")
+    backend = FakeStripe(
+        latency=float(os.getenv("FAKE_STRIPE_LATENCY_MS", "0")) / 1000,
+        jitter=float(os.getenv("FAKE_STRIPE_JITTER_MS", "0")) / 1000,
+        error_rate=float(os.getenv("FAKE_STRIPE_ERROR_RATE", "0")),
+        error_status=int(os.getenv("FAKE_STRIPE_ERROR_STATUS", "500")),
+        seed=int(seed) if seed else None,
+        auto_accounts=os.getenv("FAKE_STRIPE_AUTO_ACCOUNTS", "false").lower() in ("1", "true", "yes"),
+    )
+    return FakeStripeTransport(backend), AsyncFakeStripeTransport(backend)
+
+
+def create_stripe_clients() -> StripeClients:
+    """Build the Stripe clients from the environment. Called once from the app lifespan.
+
+    With STRIPE_BACKEND=fake, requests never leave the process and are answered
+    by services.fake_stripe instead, for load testing and benchmarks.
+    """
+    transport = async_transport = None
+    api_key = os.getenv("STRIPE_SECRET_KEY", "")
+    if os.getenv("STRIPE_BACKEND", "stripe") == "fake":
+        print("Warning: Using the in-process fake Stripe backend; no requests will reach Stripe")
+        transport, async_transport = _fake_stripe_transports()
+        api_key = api_key or "sk_test_fake"
+
+    http_client = PooledHTTPXClient(
+        max_connections=int(os.getenv("STRIPE_HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("STRIPE_HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("STRIPE_HTTP_KEEPALIVE_EXPIRY", "30")),
+        timeout=float(os.getenv("STRIPE_HTTP_TIMEOUT", "80")),
+        transport=transport,
+        async_transport=async_transport,
+        resilience=create_stripe_resilience(),
+        rate_limiter=create_stripe_rate_limiter(),
+    )
+    return StripeClients(api_key, http_client)
@@ -0,0 +1,486 @@
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+import stripe
+
+from services.account_snapshots import invalidate_account_snapshot, refresh_account_snapshot
+from services.customer_ids import forget_customer_id
+from services.database import get_platform_account_by_stripe_id, update_platform_account
+from services.external_account_lists import invalidate_external_accounts
+from services.metrics import WEBHOOK_EVENT_DELAY, WEBHOOK_EVENTS
+from services.payment_method_owners import forget_payment_method_owner, remember_payment_method_owner
+from services.resilience import is_transient_error
+
+WEBHOOK_EVENTS_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "webhook_events.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    type TEXT NOT NULL,
+    object_id TEXT NOT NULL DEFAULT '',
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    received_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    run_after REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_webhook_events_ready ON webhook_events (status, run_after);
+CREATE INDEX IF NOT EXISTS idx_webhook_events_object ON webhook_events (object_id, seq);
+CREATE TABLE IF NOT EXISTS cache_invalidations (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin TEXT NOT NULL,
+    cache TEXT NOT NULL,
+    key TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# Event statuses
+PENDING = "pending"
+PROCESSING = "processing"
+PROCESSED = "processed"
+FAILED = "failed"
+
+# In-process caches that processing an event can invalidate
+ACCOUNT_SNAPSHOTS = "account_snapshots"
+EXTERNAL_ACCOUNTS = "external_accounts"
+CUSTOMER_IDS = "customer_ids"
+PAYMENT_METHOD_OWNERS = "payment_method_owners"
+
+_INVALIDATORS = {
+    ACCOUNT_SNAPSHOTS: invalidate_account_snapshot,
+    EXTERNAL_ACCOUNTS: invalidate_external_accounts,
+    CUSTOMER_IDS: forget_customer_id,
+    PAYMENT_METHOD_OWNERS: forget_payment_method_owner,
+}
+
+# How long cache invalidations are kept for other processes to pick up (seconds)
+INVALIDATION_TTL = 3600
+
+_COLUMNS = (
+    "seq, id, type, object_id, payload, status, attempts, last_error, "
+    "received_at, updated_at, run_after"
+)
+
+
+def _row_to_event(row) -> dict:
+    return dict(zip([name.strip() for name in _COLUMNS.split(",")], row))
+
+
+def event_summary(event: dict) -> dict:
+    """The public view of a stored event, without its payload."""
+    return {
+        "seq": event["seq"],
+        "id": event["id"],
+        "type": event["type"],
+        "status": event["status"],
+        "attempts": event["attempts"],
+        "last_error": event["last_error"],
+        "received_at": event["received_at"],
+    }
+
+
+def event_object_id(event: dict) -> str:
+    """ID of the object an event is about; events for one object are processed in the order received."""
+    if event.get("object") == "v2.core.event":
+        return (event.get("related_object") or {}).get("id") or ""
+    return ((event.get("data") or {}).get("object") or {}).get("id") or ""
+
+
+class WebhookEventStore:
+    """Append-only log of the Stripe events the webhook received, in SQLite.
+
+    Each event is stored once under its Stripe event ID, so redeliveries are
+    recognised, and gets an increasing ``seq`` that is its offset in the log.
+    Processing state is kept next to the raw payload: an event is claimed
+    with a lease like a deletion job, and one whose worker died is picked up
+    again once the lease runs out. Processed and failed events are purged
+    after ``ttl`` seconds.
+
+    The caches an event invalidates live in each worker process, so the
+    invalidations are logged in the same database for every other process to
+    apply as well.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self._path = path
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._last_purge = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            db_dir = os.path.dirname(self._path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+            self._conn = sqlite3.connect(self._path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def append(self, event_id: str, event_type: str, object_id: str, payload: str) -> Optional[int]:
+        """Store a received event; returns its seq, or None if the event was already stored."""
+        now = time.time()
+        with self._lock:
+            cursor = self._connection().execute(
+                "INSERT OR IGNORE INTO webhook_events "
+                "(id, type, object_id, payload, status, received_at, updated_at, run_after) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (event_id, event_type, object_id, payload, PENDING, now, now, now),
+            )
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def get(self, seq: int) -> Optional[dict]:
+        with self._lock:
+            row = self._connection().execute(
+                f"SELECT {_COLUMNS} FROM webhook_events WHERE seq = ?", (seq,)
+            ).fetchone()
+        return _row_to_event(row) if row else None
+
+    def list(self, after_seq: int = 0, limit: int = 100, status: Optional[str] = None) -> List[dict]:
+        """Events after an offset, oldest first, optionally only those in one status."""
+        query = f"SELECT {_COLUMNS} FROM webhook_events WHERE seq > ?"
+        params: list = [after_seq]
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY seq LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._connection().execute(query, params).fetchall()
+        return [_row_to_event(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of events in each status, and the last seq."""
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute("SELECT status, COUNT(*) FROM webhook_events GROUP BY status").fetchall()
+            last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM webhook_events").fetchone()[0]
+        counts = {PENDING: 0, PROCESSING: 0, PROCESSED: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return {**counts, "last_seq": last_seq}
+
+    def claim(self, lease: float) -> Optional[dict]:
+        """Take the oldest due event that no earlier unfinished event for the same object is holding up."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    f"SELECT {_COLUMNS} FROM webhook_events AS e "
+                    "WHERE e.status IN (?, ?) AND e.run_after <= ? AND (e.object_id = '' OR NOT EXISTS ("
+                    "    SELECT 1 FROM webhook_events AS earlier WHERE earlier.object_id = e.object_id "
+                    "    AND earlier.seq < e.seq AND earlier.status IN (?, ?))) "
+                    "ORDER BY e.seq LIMIT 1",
+                    (PENDING, PROCESSING, now, PENDING, PROCESSING),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE webhook_events SET status = ?, run_after = ?, updated_at = ? WHERE seq = ?",
+                        (PROCESSING, now + lease, now, row[0]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            self._maybe_purge()
+            return None
+        event = _row_to_event(row)
+        event.update(status=PROCESSING, run_after=now + lease, updated_at=now)
+        return event
+
+    def save(self, event: dict):
+        """Persist an event's status and retry schedule."""
+        event["updated_at"] = time.time()
+        with self._lock:
+            self._connection().execute(
+                "UPDATE webhook_events SET status = ?, attempts = ?, last_error = ?, updated_at = ?, run_after = ? "
+                "WHERE seq = ?",
+                (event["status"], event["attempts"], event["last_error"], event["updated_at"],
+                 event["run_after"], event["seq"]),
+            )
+
+    def replay(self, from_seq: int, to_seq: Optional[int] = None) -> int:
+        """Queue the stored events from ``from_seq`` (through ``to_seq``) to be processed again.
+
+        Events being processed right now are left alone. Returns how many
+        events were queued.
+        """
+        now = time.time()
+        query = (
+            "UPDATE webhook_events SET status = ?, attempts = 0, last_error = NULL, updated_at = ?, run_after = ? "
+            "WHERE seq >= ? AND status != ?"
+        )
+        params: list = [PENDING, now, now, from_seq, PROCESSING]
+        if to_seq is not None:
+            query += " AND seq <= ?"
+            params.append(to_seq)
+        with self._lock:
+            cursor = self._connection().execute(query, params)
+        return cursor.rowcount
+
+    def publish_invalidations(self, origin: str, invalidations: List[Tuple[str, str]]):
+        """Log the ``(cache, key)`` entries a process invalidated, for the other processes."""
+        now = time.time()
+        with self._lock:
+            self._connection().executemany(
+                "INSERT INTO cache_invalidations (origin, cache, key, created_at) VALUES (?, ?, ?, ?)",
+                [(origin, cache, key, now) for cache, key in invalidations],
+            )
+
+    def last_invalidation_seq(self) -> int:
+        with self._lock:
+            return self._connection().execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM cache_invalidations"
+            ).fetchone()[0]
+
+    def invalidations_after(self, after_seq: int, origin: str) -> Tuple[int, List[Tuple[str, str]]]:
+        """Invalidations logged by other processes after an offset, and the new offset."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT seq, origin, cache, key FROM cache_invalidations WHERE seq > ? ORDER BY seq",
+                (after_seq,),
+            ).fetchall()
+        if not rows:
+            return after_seq, []
+        return rows[-1][0], [(cache, key) for _, row_origin, cache, key in rows if row_origin != origin]
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "DELETE FROM webhook_events WHERE status IN (?, ?) AND updated_at < ?",
+                (PROCESSED, FAILED, now - self._ttl),
+            )
+            conn.execute("DELETE FROM cache_invalidations WHERE created_at < ?", (now - INVALIDATION_TTL,))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _changed_account_id(event: dict):
+    """Return the Stripe account ID an event reports a change to, if any."""
+    event_type = event.get("type", "")
+
+    # v2 thin events, e.g. v2.core.account.updated or v2.core.account[requirements].updated
+    if event.get("object") == "v2.core.event":
+        if event_type in ("v2.core.account.updated", "v2.core.account.closed") or event_type.startswith("v2.core.account["):
+            return (event.get("related_object") or {}).get("id")
+        return None
+
+    # v1 snapshot events
+    if event_type == "account.updated":
+        return ((event.get("data") or {}).get("object") or {}).get("id")
+    # Connect events about a connected account's bank accounts and cards carry the account at the top level
+    if event_type.startswith("account.external_account."):
+        return event.get("account") or ((event.get("data") or {}).get("object") or {}).get("account")
+    return None
+
+
+def _track_payment_method_owner(event: dict) -> Optional[str]:
+    """Keep the payment method ownership cache in step with attach/detach events; returns the payment method."""
+    if event.get("type") in ("payment_method.attached", "payment_method.detached"):
+        payment_method = (event.get("data") or {}).get("object") or {}
+        if payment_method.get("id"):
+            remember_payment_method_owner(payment_method["id"], payment_method.get("customer"))
+            return payment_method["id"]
+    return None
+
+
+def _track_customer(event: dict) -> Optional[str]:
+    """Record a platform account's Customer when it is created, and drop it when it is deleted.
+
+    Returns the Stripe account ID whose cached Customer ID was dropped.
+    """
+    event_type = event.get("type")
+    if event_type not in ("customer.created", "customer.deleted"):
+        return None
+    customer = (event.get("data") or {}).get("object") or {}
+    stripe_account_id = (customer.get("metadata") or {}).get("account_id")
+    platform_account = get_platform_account_by_stripe_id(stripe_account_id) if stripe_account_id else None
+    if platform_account is None:
+        return None
+
+    if event_type == "customer.created" and not platform_account.stripe_customer_id:
+        update_platform_account(platform_account.id, stripe_customer_id=customer["id"])
+    elif event_type == "customer.deleted" and platform_account.stripe_customer_id == customer.get("id"):
+        update_platform_account(platform_account.id, stripe_customer_id="")
+        forget_customer_id(stripe_account_id)
+        return stripe_account_id
+    return None
+
+
+async def process_event(stripe_client: stripe.StripeClient, event: dict) -> List[Tuple[str, str]]:
+    """Bring the local state an event touches up to date.
+
+    Updates the payment method owner cache, the Customer IDs stored on
+    platform accounts, the cached external account listings, and the cached
+    account snapshots, which are dropped and fetched again for accounts this
+    platform manages. Returns the ``(cache, key)`` entries it changed, which
+    other processes have to drop.
+    """
+    invalidations = []
+    payment_method_id = _track_payment_method_owner(event)
+    if payment_method_id:
+        invalidations.append((PAYMENT_METHOD_OWNERS, payment_method_id))
+    forgotten_customer = await asyncio.to_thread(_track_customer, event)
+    if forgotten_customer:
+        invalidations.append((CUSTOMER_IDS, forgotten_customer))
+
+    stripe_account_id = _changed_account_id(event)
+    if stripe_account_id:
+        invalidate_account_snapshot(stripe_account_id)
+        invalidations.append((ACCOUNT_SNAPSHOTS, stripe_account_id))
+        if event.get("type", "").startswith("account.external_account."):
+            invalidate_external_accounts(stripe_account_id)
+            invalidations.append((EXTERNAL_ACCOUNTS, stripe_account_id))
+        if event.get("type") != "v2.core.account.closed" and get_platform_account_by_stripe_id(stripe_account_id):
+            await refresh_account_snapshot(stripe_client, stripe_account_id)
+    return invalidations
+
+
+class WebhookWorkerPool:
+    """Asyncio workers that process the events of a WebhookEventStore.
+
+    Events are processed in the order they were received, except that
+    different objects' events don't wait for each other. Transient failures
+    are retried with jittered exponential backoff up to ``max_attempts``
+    times; an event that fails for good is marked failed and can be replayed.
+
+    The pool also applies the cache invalidations logged by other processes'
+    pools every ``poll_interval`` seconds, so their caches lag a webhook by
+    about that much at most.
+    """
+
+    def __init__(
+        self,
+        store: WebhookEventStore,
+        stripe_client: stripe.StripeClient,
+        workers: int = 4,
+        max_attempts: int = 5,
+        retry_base_delay: float = 5.0,
+        retry_max_delay: float = 300.0,
+        lease: float = 60.0,
+        poll_interval: float = 1.0,
+    ):
+        self.store = store
+        self._stripe = stripe_client
+        self._workers = max(1, workers)
+        self._max_attempts = max_attempts
+        self._retry_base_delay = retry_base_delay
+        self._retry_max_delay = retry_max_delay
+        self._lease = lease
+        self._poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        # Identifies this process's invalidations, which it has applied already
+        self._origin = uuid.uuid4().hex
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self._workers)]
+        self._tasks.append(asyncio.create_task(self._follow_invalidations()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wake idle workers after events were appended or replayed."""
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            event = await asyncio.to_thread(self.store.claim, self._lease)
+            if event is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._process(event)
+            except Exception as e:
+                # Leave the event processing; its lease expires and another attempt picks it up
+                print(f"Warning: Webhook event {event['id']} crashed: {e}")
+
+    async def _follow_invalidations(self):
+        # Caches start out empty, so only invalidations from now on matter
+        after_seq = await asyncio.to_thread(self.store.last_invalidation_seq)
+        while True:
+            await asyncio.sleep(self._poll_interval)
+            try:
+                after_seq, invalidations = await asyncio.to_thread(
+                    self.store.invalidations_after, after_seq, self._origin
+                )
+            except Exception as e:
+                print(f"Warning: Could not read cache invalidations: {e}")
+                continue
+            for cache, key in invalidations:
+                _INVALIDATORS[cache](key)
+
+    async def _process(self, event: dict):
+        try:
+            invalidations = await process_event(self._stripe, orjson.loads(event["payload"]))
+        except Exception as e:
+            event["attempts"] += 1
+            event["last_error"] = str(e) or type(e).__name__
+            if event["attempts"] < self._max_attempts and is_transient_error(e):
+                delay = random.uniform(0, min(self._retry_max_delay, self._retry_base_delay * 2 ** (event["attempts"] - 1)))
+                event["status"] = PENDING
+                event["run_after"] = time.time() + delay
+            else:
+                event["status"] = FAILED
+                WEBHOOK_EVENTS.inc(FAILED)
+                print(f"Warning: Giving up on webhook event {event['id']} ({event['type']}): {event['last_error']}")
+            await asyncio.to_thread(self.store.save, event)
+            return
+
+        if invalidations:
+            await asyncio.to_thread(self.store.publish_invalidations, self._origin, invalidations)
+        event["status"] = PROCESSED
+        event["last_error"] = None
+        await asyncio.to_thread(self.store.save, event)
+        WEBHOOK_EVENTS.inc(PROCESSED)
+        WEBHOOK_EVENT_DELAY.observe(event["updated_at"] - event["received_at"])
+
+
+def create_webhook_worker_pool(stripe_client: stripe.StripeClient) -> WebhookWorkerPool:
+    """Build the webhook event store and worker pool from the environment."""
+    store = WebhookEventStore(
+        os.getenv("WEBHOOK_EVENTS_DB_PATH") or WEBHOOK_EVENTS_FILE,
+        ttl=float(os.getenv("WEBHOOK_EVENT_TTL", "2592000")),
+    )
+    return WebhookWorkerPool(
+        store,
+        stripe_client,
+        workers=int(os.getenv("WEBHOOK_WORKERS", "4")),
+        max_attempts=int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5")),
+        retry_base_delay=float(os.getenv("WEBHOOK_RETRY_BASE_DELAY", "5")),
+        retry_max_delay=float(os.getenv("WEBHOOK_RETRY_MAX_DELAY", "300")),
+        lease=float(os.getenv("WEBHOOK_EVENT_LEASE", "60")),
+        poll_interval=float(os.getenv("WEBHOOK_POLL_INTERVAL", "1")),
+    )
@@ -0,0 +1,377 @@
+"""Load benchmark for the API routers against the in-process fake Stripe backend.
+
+For every combination of account-store size, storage backend and worker count
+this seeds a scratch account store, starts ``uvicorn main:app`` on it with
+STRIPE_BACKEND=fake, drives each endpoint at a fixed concurrency and records
+throughput, latency percentiles and the server's resident memory. Results are
+written as JSON so runs can be compared between releases.
+
+    python benchmarks/run_benchmarks.py --sizes 100,10000,1000000 \\
+        --backends json,json-wal,sqlite --workers 1,4 --output results.json
+
+Run from the server/ directory. Anything else the server reads from the
+environment (cache sizes, fan-out limits, ...) can be set with --env KEY=VALUE,
+and --no-cache turns off the account snapshot and customer ID caches.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+BACKENDS = {
+    "json": {"ACCOUNT_DB_BACKEND": "json", "ACCOUNT_DB_MODE": "snapshot"},
+    "json-wal": {"ACCOUNT_DB_BACKEND": "json", "ACCOUNT_DB_MODE": "wal"},
+    "sqlite": {"ACCOUNT_DB_BACKEND": "sqlite"},
+}
+
+
+class Endpoint:
+    def __init__(self, name: str, method: str, build: Callable[[random.Random, List[str]], Tuple[str, Optional[dict]]]):
+        self.name = name
+        self.method = method
+        self.build = build
+
+
+def _any(ids: List[str], rng: random.Random) -> str:
+    return ids[rng.randrange(len(ids))]
+
+
+def _two(ids: List[str], rng: random.Random) -> Tuple[str, str]:
+    sender = _any(ids, rng)
+    recipient = _any(ids, rng)
+    while recipient == sender and len(ids) > 1:
+        recipient = _any(ids, rng)
+    return sender, recipient
+
+
+def _pay_user(rng: random.Random, ids: List[str]):
+    sender, recipient = _two(ids, rng)
+    body = {"amount": 1000, "recipient_account_id": recipient, "payment_method_id": "pm_card_visa"}
+    return f"/api/transactions/{sender}/pay-user", body
+
+
+def _create_payment_intent(rng: random.Random, ids: List[str]):
+    sender, recipient = _two(ids, rng)
+    return f"/api/transactions/{sender}/create-payment-intent", {"amount": 1000, "recipient_account_id": recipient}
+
+
+def _create_account(rng: random.Random, ids: List[str]):
+    return "/api/accounts", {"email": f"bench-{uuid.uuid4().hex[:12]}@example.com", "name": "Benchmark User"}
+
+
+ENDPOINTS = [
+    Endpoint("accounts.list", "GET", lambda rng, ids: ("/api/accounts?limit=100", None)),
+    Endpoint("accounts.list_page", "GET", lambda rng, ids: (f"/api/accounts?limit=100&starting_after={_any(ids, rng)}", None)),
+    Endpoint("accounts.get", "GET", lambda rng, ids: (f"/api/accounts/{_any(ids, rng)}", None)),
+    Endpoint("accounts.create", "POST", _create_account),
+    Endpoint("payment_methods.list", "GET", lambda rng, ids: (f"/api/accounts/{_any(ids, rng)}/payment-methods", None)),
+    Endpoint("payment_methods.setup_intent", "POST", lambda rng, ids: (f"/api/accounts/{_any(ids, rng)}/payment-methods/setup-intent", None)),
+    Endpoint("external_accounts.list", "GET", lambda rng, ids: (f"/api/accounts/{_any(ids, rng)}/external-accounts", None)),
+    Endpoint("transactions.pay_user", "POST", _pay_user),
+    Endpoint("transactions.create_payment_intent", "POST", _create_payment_intent),
+]
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _process_tree_rss_mb(pid: int) -> Optional[float]:
+    """Resident memory of a process and its children in MB (Linux only)."""
+    if not os.path.isdir("/proc"):
+        return None
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total_kb = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            continue
+    return round(total_kb / 1024, 1)
+
+
+def seed_store(env: Dict[str, str], size: int) -> List[str]:
+    """Fill a scratch account store with ``size`` accounts; returns their platform IDs."""
+    sys.path.insert(0, APP_DIR)
+    previous = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        from services.database import create_account_store
+
+        store = create_account_store()
+        store.load()
+        ids = []
+        batch = []
+        for i in range(size):
+            account_id = f"plat_{uuid.uuid4().hex[:16]}"
+            ids.append(account_id)
+            batch.append({
+                "id": account_id,
+                "email": f"user{i}@example.com",
+                "stripe_customer_id": "",
+                "stripe_account_id": f"acct_bench{i:014d}",
+            })
+            if len(batch) == 10000:
+                store.insert_many(batch)
+                batch = []
+        if batch:
+            store.insert_many(batch)
+        store.sync()
+        store.compact()
+        store.close()
+        return ids
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def start_server(env: Dict[str, str], workers: int, port: int) -> subprocess.Popen:
+    command = [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning",
+    ]
+    return subprocess.Popen(
+        command,
+        cwd=APP_DIR,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+    )
+
+
+async def wait_until_ready(base_url: str, server: subprocess.Popen, timeout: float = 600):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with code {server.returncode}")
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not become ready")
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    endpoint: Endpoint,
+    ids: List[str],
+    requests: int,
+    concurrency: int,
+    rng: random.Random,
+) -> dict:
+    # Build every request up front so the random draws don't count as latency
+    plan = [endpoint.build(rng, ids) for _ in range(requests)]
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < len(plan):
+            path, body = plan[next_index]
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                response = await client.request(endpoint.method, path, json=body)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+            "p50": round(_percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(_percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(_percentile(latencies, 0.99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else None,
+        },
+    }
+
+
+async def run_configuration(args, size: int, backend: str, workers: int) -> List[dict]:
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    env = {
+        **BACKENDS[backend],
+        "ACCOUNT_DB_PATH": os.path.join(workdir, "accounts.json"),
+        "ACCOUNT_DB_LOG_PATH": os.path.join(workdir, "accounts.log"),
+        "ACCOUNT_DB_SQLITE_PATH": os.path.join(workdir, "accounts.db"),
+        "IDEMPOTENCY_DB_PATH": os.path.join(workdir, "idempotency.db"),
+        "DELETION_JOBS_DB_PATH": os.path.join(workdir, "deletion_jobs.db"),
+        "WEBHOOK_EVENTS_DB_PATH": os.path.join(workdir, "webhook_events.db"),
+        "STRIPE_BACKEND": "fake",
+        "FAKE_STRIPE_AUTO_ACCOUNTS": "true",
+        "FAKE_STRIPE_LATENCY_MS": str(args.stripe_latency_ms),
+        "FAKE_STRIPE_JITTER_MS": str(args.stripe_jitter_ms),
+        "FAKE_STRIPE_ERROR_RATE": str(args.stripe_error_rate),
+        # The fake has no rate limit to protect; pass --env STRIPE_RATE_LIMIT=... to measure the limiter
+        "STRIPE_RATE_LIMIT": "0",
+    }
+    if args.no_cache:
+        env.update({"ACCOUNT_SNAPSHOT_TTL": "0", "CUSTOMER_ID_CACHE_TTL": "0"})
+    env.update(dict(item.split("=", 1) for item in args.env))
+
+    label = f"size={size} backend={backend} workers={workers}"
+    print(f"[{label}] seeding...", file=sys.stderr)
+    seed_started = time.perf_counter()
+    ids = seed_store(env, size)
+    seed_seconds = time.perf_counter() - seed_started
+
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server_started = time.perf_counter()
+    server = start_server(env, workers, port)
+    results = []
+    try:
+        await wait_until_ready(base_url, server)
+        startup_seconds = time.perf_counter() - server_started
+        rng = random.Random(args.seed)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+            for endpoint in ENDPOINTS:
+                if args.endpoints and endpoint.name not in args.endpoints:
+                    continue
+                print(f"[{label}] {endpoint.name}", file=sys.stderr)
+                await drive(client, endpoint, ids, args.warmup, args.concurrency, rng)
+                rss_before = _process_tree_rss_mb(server.pid)
+                stats = await drive(client, endpoint, ids, args.requests, args.concurrency, rng)
+                results.append({
+                    "store_size": size,
+                    "backend": backend,
+                    "workers": workers,
+                    "endpoint": endpoint.name,
+                    "concurrency": args.concurrency,
+                    **stats,
+                    "rss_mb_before": rss_before,
+                    "rss_mb_after": _process_tree_rss_mb(server.pid),
+                    "seed_seconds": round(seed_seconds, 2),
+                    "startup_seconds": round(startup_seconds, 2),
+                })
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def _csv(cast):
+    return lambda value: [cast(item) for item in value.split(",") if item]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=_csv(int), default=[100, 10000], help="Account-store sizes, comma separated")
+    parser.add_argument("--backends", type=_csv(str), default=["json"], help=f"Storage backends: {', '.join(BACKENDS)}")
+    parser.add_argument("--workers", type=_csv(int), default=[1], help="uvicorn worker counts, comma separated")
+    parser.add_argument("--endpoints", type=_csv(str), default=[], help="Only run these endpoints (default: all)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent requests per endpoint")
+    parser.add_argument("--requests", type=int, default=1000, help="Measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=50, help="Unmeasured requests per endpoint before measuring")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--stripe-latency-ms", type=float, default=0, help="Latency added to each fake Stripe call")
+    parser.add_argument("--stripe-jitter-ms", type=float, default=0, help="Random extra latency per fake Stripe call")
+    parser.add_argument("--stripe-error-rate", type=float, default=0, help="Fraction of fake Stripe calls that fail")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the account snapshot and customer ID caches")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra server environment")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for request selection")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    unknown = [backend for backend in args.backends if backend not in BACKENDS]
+    if unknown:
+        parser.error(f"Unknown backend(s): {', '.join(unknown)}")
+    known = {endpoint.name for endpoint in ENDPOINTS}
+    unknown = [name for name in args.endpoints if name not in known]
+    if unknown:
+        parser.error(f"Unknown endpoint(s): {', '.join(unknown)}")
+    return args
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    for size in args.sizes:
+        for backend in args.backends:
+            for workers in args.workers:
+                results.extend(await run_configuration(args, size, backend, workers))
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,198 @@
+"""Micro-benchmark of turning Stripe objects into JSON response bodies.
+
+Compares, per item, the previous path (models built from StripeObject
+attributes, then FastAPI validating the result against the route's
+response_model, encoding it and rendering it with the standard JSON encoder)
+with the current one (``from_stripe_*`` reading StripeObjects as dicts, rendered
+once by the model's compiled serializer through ModelResponse). Also times the
+GET /api/accounts page body with JSONResponse and ORJSONResponse.
+
+    python benchmarks/serialization_benchmark.py --items 100 --repeat 200
+
+Run from the server/ directory. Prints a JSON report with microseconds per item.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import stripe  # noqa: E402
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+
+from schemas.account import AccountResponse, ExternalAccountSummary  # noqa: E402
+from schemas.external_account import ExternalAccountListResponse, ExternalAccountResponse  # noqa: E402
+from schemas.payment_method import CardDetails, PaymentMethodListResponse, PaymentMethodResponse  # noqa: E402
+from services.serialization import ModelResponse  # noqa: E402
+
+
+def _bank_account(i: int) -> dict:
+    return {
+        "id": f"ba_{i:024d}",
+        "object": "bank_account",
+        "bank_name": "STRIPE TEST BANK",
+        "last4": "6789",
+        "routing_number": "110000000",
+        "currency": "usd",
+        "country": "US",
+        "default_for_currency": i == 0,
+        "status": "new",
+    }
+
+
+def _payment_method(i: int) -> stripe.PaymentMethod:
+    return stripe.PaymentMethod.construct_from({
+        "id": f"pm_{i:024d}",
+        "object": "payment_method",
+        "type": "card",
+        "created": 1700000000 + i,
+        "card": {"brand": "visa", "last4": "4242", "exp_month": 12, "exp_year": 2030},
+    }, "sk_test_bench")
+
+
+def _account(i: int) -> stripe.Account:
+    return stripe.Account.construct_from({
+        "id": f"acct_{i:016d}",
+        "object": "account",
+        "email": f"user{i}@example.com",
+        "business_profile": {"name": f"Business {i}"},
+        "charges_enabled": True,
+        "payouts_enabled": True,
+        "details_submitted": True,
+        "created": 1700000000 + i,
+        "external_accounts": {"object": "list", "data": [_bank_account(j) for j in range(2)]},
+    }, "sk_test_bench")
+
+
+# The constructors as they were before, reading every field through StripeObject.__getattr__
+
+def _validated_payment_method(pm) -> PaymentMethodResponse:
+    card = None
+    if pm.type == "card" and pm.card:
+        card = CardDetails(brand=pm.card.brand, last4=pm.card.last4, exp_month=pm.card.exp_month, exp_year=pm.card.exp_year)
+    return PaymentMethodResponse(id=pm.id, type=pm.type, card=card, created=pm.created)
+
+
+def _validated_external_account(ea) -> ExternalAccountResponse:
+    return ExternalAccountResponse(
+        id=ea.id,
+        object=ea.object,
+        bank_name=getattr(ea, "bank_name", None),
+        last4=ea.last4,
+        routing_number=getattr(ea, "routing_number", None),
+        currency=ea.currency,
+        country=ea.country,
+        default_for_currency=ea.default_for_currency or False,
+        status=getattr(ea, "status", None),
+    )
+
+
+def _validated_account(account) -> AccountResponse:
+    return AccountResponse(
+        stripe_account_id=account.id,
+        email=account.email,
+        business_name=account.business_profile.name if account.business_profile else None,
+        charges_enabled=account.charges_enabled,
+        payouts_enabled=account.payouts_enabled,
+        details_submitted=account.details_submitted,
+        external_accounts=[
+            ExternalAccountSummary(
+                id=ea.id,
+                bank_name=getattr(ea, "bank_name", None),
+                last4=ea.last4,
+                currency=ea.currency,
+                default_for_currency=ea.default_for_currency or False,
+            )
+            for ea in account.external_accounts.data
+        ],
+        created=account.created,
+    )
+
+
+def _fastapi_render(field, content) -> bytes:
+    """What FastAPI's serialize_response does with a route's return value when it isn't a Response."""
+    if field is None:
+        return JSONResponse(jsonable_encoder(content)).body
+    value, errors = field.validate(content, {}, loc=("response",))
+    assert not errors, errors
+    return JSONResponse(field.serialize(value)).body
+
+
+def _time(func: Callable[[], bytes], items: int, repeat: int) -> float:
+    """Best-of microseconds per item."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best / items * 1e6
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100, help="Items per response")
+    parser.add_argument("--repeat", type=int, default=200, help="Timed runs per case; the fastest is reported")
+    args = parser.parse_args(argv)
+
+    payment_methods = [_payment_method(i) for i in range(args.items)]
+    external_accounts = [stripe.BankAccount.construct_from(_bank_account(i), "sk_test_bench") for i in range(args.items)]
+    accounts = [_account(i) for i in range(args.items)]
+    summaries = [
+        {
+            "id": f"pa_{i}", "stripe_account_id": f"acct_{i:016d}", "stripe_customer_id": f"cus_{i}",
+            "email": f"user{i}@example.com", "display_name": f"User {i}", "created": "2025-01-01T00:00:00.000Z",
+            "is_customer": True, "is_merchant": False, "is_recipient": i % 2 == 0,
+        }
+        for i in range(args.items)
+    ]
+
+    pm_list_field = create_model_field(name="Response_list_payment_methods", type_=PaymentMethodListResponse, mode="serialization")
+    ea_list_field = create_model_field(name="Response_list_external_accounts", type_=ExternalAccountListResponse, mode="serialization")
+    account_field = create_model_field(name="Response_account", type_=AccountResponse, mode="serialization")
+
+    cases = {
+        "payment_method_list": (
+            lambda: _fastapi_render(pm_list_field, PaymentMethodListResponse(
+                payment_methods=[_validated_payment_method(pm) for pm in payment_methods])),
+            lambda: ModelResponse(PaymentMethodListResponse(
+                payment_methods=[PaymentMethodResponse.from_stripe_payment_method(pm) for pm in payment_methods])).body,
+        ),
+        "external_account_list": (
+            lambda: _fastapi_render(ea_list_field, ExternalAccountListResponse(
+                external_accounts=[_validated_external_account(ea) for ea in external_accounts])),
+            lambda: ModelResponse(ExternalAccountListResponse(
+                external_accounts=[ExternalAccountResponse.from_stripe_external_account(ea) for ea in external_accounts])).body,
+        ),
+        "account": (
+            lambda: b"".join(_fastapi_render(account_field, _validated_account(a)) for a in accounts),
+            lambda: b"".join(ModelResponse(AccountResponse.from_stripe_account(a)).body for a in accounts),
+        ),
+        "account_summary_page": (
+            lambda: _fastapi_render(None, {"accounts": summaries, "has_more": False, "next_cursor": None}),
+            lambda: ORJSONResponse({"accounts": summaries, "has_more": False, "next_cursor": None}).body,
+        ),
+    }
+
+    results = {}
+    for name, (before, after) in cases.items():
+        # Both paths must produce the same document
+        assert before().replace(b" ", b"") == after().replace(b" ", b""), name
+        before_us = _time(before, args.items, args.repeat)
+        after_us = _time(after, args.items, args.repeat)
+        results[name] = {
+            "before_us_per_item": round(before_us, 3),
+            "after_us_per_item": round(after_us, 3),
+            "speedup": round(before_us / after_us, 2),
+        }
+
+    print(json.dumps({"items": args.items, "repeat": args.repeat, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()